@@ -4,7 +4,7 @@ import { useState, useEffect, useRef } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Listbox } from '@headlessui/react';
 import { ChevronUpDownIcon, XMarkIcon, CheckIcon } from '@heroicons/react/24/outline';
-import { api } from '../lib/api';
+import { api, openLiveAnalysis, LIVE_ANALYSIS_ENABLED } from '../lib/api';
 
 // Position options
 const positionOptions = ['^', '<', '>', 'v', '.'];
@@ -213,6 +213,39 @@ const ResponseBlock = ({ id, onRemove, imageId, onResponseSubmit }) => {
   
   // Store previous imageId to detect changes
   const prevImageIdRef = useRef(imageId);
+  
+  // Live matching session and the sequence number of the latest text sent
+  const liveSessionRef = useRef(null);
+  const liveSeqRef = useRef(null);
+
+  // Join the page's shared live matching session so the response is matched while it is typed
+  useEffect(() => {
+    if (!LIVE_ANALYSIS_ENABLED) {
+      return;
+    }
+    
+    const session = openLiveAnalysis(id, (data) => {
+      // Ignore results for text that has been edited since
+      if (data.seq !== liveSeqRef.current || data.error) {
+        return;
+      }
+      
+      if (data.match_found) {
+        setLocation(data.location);
+        setFq(data.fq);
+        setAnalysisMessage('Location and FQ matched while typing.');
+      } else {
+        // Keep hand-entered location and FQ, as the Analyze button does
+        setAnalysisMessage('');
+      }
+    });
+    liveSessionRef.current = session;
+    
+    return () => {
+      liveSessionRef.current = null;
+      session.close();
+    };
+  }, [id]);
 
   // Reset all fields when imageId changes
   useEffect(() => {
@@ -277,6 +310,7 @@ const ResponseBlock = ({ id, onRemove, imageId, onResponseSubmit }) => {
     setSpecialScore([]);
     setAnalysisMessage('');
     setSubmitMessage('');
+    liveSeqRef.current = null;
   };
 
   const toggleExpand = () => {
@@ -288,6 +322,10 @@ const ResponseBlock = ({ id, onRemove, imageId, onResponseSubmit }) => {
     setResponseText(value);
     
     setAnalysisMessage('');
+    
+    if (liveSessionRef.current) {
+      liveSeqRef.current = liveSessionRef.current.send(imageId, value);
+    }
   };
 
   const handleAnalyzeResponse = async () => {
@@ -1,8 +1,9 @@
 'use client';
 
-import { useState } from 'react';
+import { useState, useEffect } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { ChevronDownIcon, ChevronUpIcon, ArrowDownTrayIcon, PrinterIcon } from '@heroicons/react/24/outline';
+import { api } from '../lib/api';
 
 /**
  * Format arrays into comma-separated strings
@@ -14,6 +15,17 @@ const formatArray = (arr) => {
   return arr.join(', ');
 };
 
+/**
+ * Format summary counts as "code count" pairs, most frequent first
+ * @param {Object} counts - Counts keyed by scoring code
+ * @returns {String} The formatted counts or '-' if there are none
+ */
+const formatCounts = (counts) => {
+  const pairs = Object.entries(counts || {}).sort((a, b) => b[1] - a[1]);
+  if (pairs.length === 0) return '-';
+  return pairs.map(([code, count]) => `${code} ${count}`).join(', ');
+};
+
 /**
  * A single response row component
  */
@@ -113,6 +125,16 @@ const ImageSection = ({ imageData, imageNumber }) => {
  * Responsive summary table component
  */
 const ResponseSummaryTable = ({ patient }) => {
+  // Structural summary computed by the backend on every write
+  const [summary, setSummary] = useState(null);
+
+  useEffect(() => {
+    if (!patient?.patient_id) return;
+    api.getPatientSummary(patient.patient_id)
+      .then(setSummary)
+      .catch((error) => console.error('Error fetching patient summary:', error));
+  }, [patient?.patient_id, patient?.version]);
+
   // Handle printing the summary
   const handlePrint = () => {
     window.print();
@@ -214,13 +236,32 @@ const ResponseSummaryTable = ({ patient }) => {
           <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
             <div className="bg-gray-700 p-4 rounded">
               <p className="text-gray-400 text-sm">Total Responses</p>
-              <p className="text-2xl font-bold">{imageResponses.reduce((sum, img) => sum + img.entries.length, 0)}</p>
+              <p className="text-2xl font-bold">{summary ? summary.total_responses : '-'}</p>
             </div>
             <div className="bg-gray-700 p-4 rounded">
               <p className="text-gray-400 text-sm">Images Used</p>
-              <p className="text-2xl font-bold">{imageResponses.length}</p>
+              <p className="text-2xl font-bold">{summary ? summary.cards_with_responses : '-'}</p>
+            </div>
+            <div className="bg-gray-700 p-4 rounded">
+              <p className="text-gray-400 text-sm">Location</p>
+              <p className="text-sm font-medium">{formatCounts(summary?.location)}</p>
+            </div>
+            <div className="bg-gray-700 p-4 rounded">
+              <p className="text-gray-400 text-sm">Form Quality</p>
+              <p className="text-sm font-medium">{formatCounts(summary?.fq)}</p>
+            </div>
+            <div className="bg-gray-700 p-4 rounded">
+              <p className="text-gray-400 text-sm">Determinants</p>
+              <p className="text-sm font-medium">{formatCounts(summary?.determinants)}</p>
+            </div>
+            <div className="bg-gray-700 p-4 rounded">
+              <p className="text-gray-400 text-sm">Content</p>
+              <p className="text-sm font-medium">{formatCounts(summary?.content)}</p>
+            </div>
+            <div className="bg-gray-700 p-4 rounded">
+              <p className="text-gray-400 text-sm">Special Scores</p>
+              <p className="text-sm font-medium">{formatCounts(summary?.special_scores)}</p>
             </div>
-            {/* Add more statistics as needed */}
           </div>
         </div>
 
@@ -47,17 +47,158 @@ export const fetchApi = async (endpoint, options = {}) => {
   }
 };
 
+// Live matching while typing (set NEXT_PUBLIC_LIVE_ANALYSIS=false to disable)
+export const LIVE_ANALYSIS_ENABLED = process.env.NEXT_PUBLIC_LIVE_ANALYSIS !== 'false';
+
+// One live matching connection is shared by every response block on the page; the
+// server keeps their texts apart by entry key. It opens with the first block, reconnects
+// after a drop while any block is left, and closes with the last one.
+const LIVE_RECONNECT_DELAYS_MS = [500, 1000, 2000, 5000];
+
+const liveConnection = {
+  socket: null,
+  // Entry key -> { onResult, lastMessage }
+  subscribers: new Map(),
+  seq: 0,
+  attempts: 0,
+  reconnectTimer: null,
+};
+
+const connectLive = () => {
+  const socket = new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/ws/analyze`);
+  liveConnection.socket = socket;
+
+  socket.onopen = () => {
+    liveConnection.attempts = 0;
+    // Texts sent before a reconnect were lost with the old session, so send them again
+    liveConnection.subscribers.forEach(({ lastMessage }) => {
+      if (lastMessage) {
+        socket.send(JSON.stringify(lastMessage));
+      }
+    });
+  };
+
+  socket.onmessage = (event) => {
+    try {
+      const data = JSON.parse(event.data);
+      const subscriber = liveConnection.subscribers.get(String(data.entry));
+      if (subscriber) {
+        subscriber.onResult(data);
+      }
+    } catch (error) {
+      console.error('Error handling live analysis result:', error);
+    }
+  };
+
+  socket.onerror = (error) => {
+    console.error('Live analysis connection error:', error);
+  };
+
+  socket.onclose = () => {
+    // A socket replaced or closed on purpose doesn't reconnect
+    if (liveConnection.socket !== socket) {
+      return;
+    }
+    liveConnection.socket = null;
+    if (liveConnection.subscribers.size === 0) {
+      return;
+    }
+    const delays = LIVE_RECONNECT_DELAYS_MS;
+    const delay = delays[Math.min(liveConnection.attempts, delays.length - 1)];
+    liveConnection.attempts += 1;
+    liveConnection.reconnectTimer = setTimeout(() => {
+      liveConnection.reconnectTimer = null;
+      if (liveConnection.subscribers.size > 0) {
+        connectLive();
+      }
+    }, delay);
+  };
+};
+
+/**
+ * Join the live matching session on the /ws/analyze WebSocket
+ * @param {string|number} entry - Key of the response block, unique on the page
+ * @param {Function} onResult - Called with every result message for this entry
+ * @returns {Object} - Session with send(imageId, responseText), which returns the
+ *                     message sequence number (or null if not connected), and close()
+ */
+export const openLiveAnalysis = (entry, onResult) => {
+  const key = String(entry);
+  const subscriber = { onResult, lastMessage: null };
+  liveConnection.subscribers.set(key, subscriber);
+  if (!liveConnection.socket && !liveConnection.reconnectTimer) {
+    connectLive();
+  }
+
+  return {
+    send(imageId, responseText) {
+      liveConnection.seq += 1;
+      subscriber.lastMessage = {
+        entry: key,
+        seq: liveConnection.seq,
+        image_id: imageId,
+        response_text: responseText
+      };
+      const { socket } = liveConnection;
+      if (!socket || socket.readyState !== WebSocket.OPEN) {
+        // Sent once the connection is back
+        return subscriber.lastMessage.seq;
+      }
+      socket.send(JSON.stringify(subscriber.lastMessage));
+      return subscriber.lastMessage.seq;
+    },
+    close() {
+      if (liveConnection.subscribers.get(key) === subscriber) {
+        liveConnection.subscribers.delete(key);
+      }
+      if (liveConnection.subscribers.size === 0) {
+        clearTimeout(liveConnection.reconnectTimer);
+        liveConnection.reconnectTimer = null;
+        const { socket } = liveConnection;
+        liveConnection.socket = null;
+        if (socket) {
+          socket.close();
+        }
+      }
+    }
+  };
+};
+
 /**
  * Common API functions
  */
 export const api = {
   // Patient endpoints
-  async getPatients() {
-    return fetchApi('/patients');
+  async getPatients({ limit, after } = {}) {
+    const params = new URLSearchParams();
+    if (limit) params.set('limit', limit);
+    if (after) params.set('after', after);
+    const query = params.toString();
+    return fetchApi(`/patients${query ? `?${query}` : ''}`);
+  },
+  
+  // images: only fetch the responses to these cards; fields: 'header' to skip all responses
+  async getPatientById(patientId, { images, fields } = {}) {
+    const params = new URLSearchParams();
+    if (images && images.length) params.set('images', images.join(','));
+    if (fields) params.set('fields', fields);
+    const query = params.toString();
+    return fetchApi(`/patient/${patientId}${query ? `?${query}` : ''}`);
+  },
+  
+  // Counts by location, fq, determinant, content and special score, kept up to date by the backend
+  async getPatientSummary(patientId) {
+    return fetchApi(`/patient/${patientId}/summary`);
   },
   
-  async getPatientById(patientId) {
-    return fetchApi(`/patient/${patientId}`);
+  // Population-level analytics, optionally broken down by 'gender' or 'age_band'
+  async getCohortAnalytics({ by, card, top } = {}) {
+    const params = new URLSearchParams();
+    if (by) params.set('by', by);
+    if (card) params.set('card', card);
+    if (top) params.set('top', top);
+    const query = params.toString();
+    return fetchApi(`/cohort${query ? `?${query}` : ''}`);
   },
   
   async submitPatient(patientData) {
@@ -74,6 +215,46 @@ export const api = {
     });
   },
   
+  // Granular response updates; version is the patient record version being edited.
+  // A 409 error means someone else changed the record first: reload it and retry.
+  async replaceResponseCard(patientId, imageNumber, entries, version) {
+    return fetchApi(`/patient/${patientId}/responses/${imageNumber}`, {
+      method: 'PUT',
+      headers: { 'If-Match': `"${version}"` },
+      body: JSON.stringify(entries),
+    });
+  },
+
+  async deleteResponseCard(patientId, imageNumber, version) {
+    return fetchApi(`/patient/${patientId}/responses/${imageNumber}`, {
+      method: 'DELETE',
+      headers: { 'If-Match': `"${version}"` },
+    });
+  },
+
+  async addResponseEntry(patientId, imageNumber, entry, version) {
+    return fetchApi(`/patient/${patientId}/responses/${imageNumber}/entries`, {
+      method: 'POST',
+      headers: { 'If-Match': `"${version}"` },
+      body: JSON.stringify(entry),
+    });
+  },
+
+  async updateResponseEntry(patientId, imageNumber, entryIndex, changes, version) {
+    return fetchApi(`/patient/${patientId}/responses/${imageNumber}/entries/${entryIndex}`, {
+      method: 'PATCH',
+      headers: { 'If-Match': `"${version}"` },
+      body: JSON.stringify(changes),
+    });
+  },
+
+  async deleteResponseEntry(patientId, imageNumber, entryIndex, version) {
+    return fetchApi(`/patient/${patientId}/responses/${imageNumber}/entries/${entryIndex}`, {
+      method: 'DELETE',
+      headers: { 'If-Match': `"${version}"` },
+    });
+  },
+  
   // Response analysis
   async analyzeResponse(responseText, imageId) {
     return fetchApi('/analyze-response', {
@@ -8,7 +8,9 @@ import { api } from '../lib/api';
 
 function PatientList() {
   const [patients, setPatients] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
 
   useEffect(() => {
@@ -16,7 +18,8 @@ function PatientList() {
       try {
         setLoading(true);
         const data = await api.getPatients();
-        setPatients(data);
+        setPatients(data.patients);
+        setNextCursor(data.next_cursor);
       } catch (error) {
         console.error('Error fetching patients:', error);
         setError(error.message);
@@ -28,6 +31,21 @@ function PatientList() {
     fetchPatients();
   }, []);
 
+  // Fetch the next page of patients and append it to the list
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const data = await api.getPatients({ after: nextCursor });
+      setPatients((current) => [...current, ...data.patients]);
+      setNextCursor(data.next_cursor);
+    } catch (error) {
+      console.error('Error fetching more patients:', error);
+      setError(error.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   // Function to format date
   const formatDate = (dateString) => {
     const options = { year: 'numeric', month: 'long', day: 'numeric' };
@@ -115,6 +133,17 @@ function PatientList() {
                     ))}
                   </tbody>
                 </table>
+                {nextCursor && (
+                  <div className="bg-gray-700 p-4 text-center">
+                    <button
+                      onClick={loadMore}
+                      disabled={loadingMore}
+                      className="px-4 py-2 bg-blue-600 text-white rounded-md hover:bg-blue-700 disabled:opacity-50"
+                    >
+                      {loadingMore ? 'Loading...' : 'Load more'}
+                    </button>
+                  </div>
+                )}
               </div>
             )}
           </div>
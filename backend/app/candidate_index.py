@@ -0,0 +1,88 @@
+import re
+from typing import Dict, List, Sequence, Set
+
+import numpy as np
+
+# Inverted index used to block candidates before fuzzy scoring: only reference rows
+# sharing a word token or a character n-gram with the query are shortlisted, so large
+# tables don't have to be scored row by row on every request.
+
+TOKEN_PATTERN = re.compile(r"\w+")
+NGRAM_SIZE = 3
+
+# A shared whole word is stronger evidence than a shared n-gram
+TOKEN_WEIGHT = 2
+NGRAM_WEIGHT = 1
+
+def tokenize(text: str) -> List[str]:
+    """Split a normalized text into word tokens."""
+    return TOKEN_PATTERN.findall(text)
+
+def char_ngrams(tokens: Sequence[str], size: int = NGRAM_SIZE) -> Set[str]:
+    """Get the character n-grams of the given tokens, padded so short words still produce grams."""
+    grams = set()
+    for token in tokens:
+        padded = f" {token} "
+        for start in range(len(padded) - size + 1):
+            grams.add(padded[start:start + size])
+    return grams
+
+class CandidateIndex:
+    """Inverted token / character n-gram index over the texts of one reference table."""
+
+    def __init__(self, texts: Sequence[str], token_postings=None, ngram_postings=None):
+        """
+        Build the index over the given texts, or wrap prebuilt posting maps.
+
+        Prebuilt posting maps (e.g. snapshot-backed ones) only need a ``get(key)``
+        method returning an int32 array of row indexes or None.
+        """
+        self.size = len(texts)
+        if token_postings is not None and ngram_postings is not None:
+            self.token_postings = token_postings
+            self.ngram_postings = ngram_postings
+            return
+
+        token_rows: Dict[str, List[int]] = {}
+        ngram_rows: Dict[str, List[int]] = {}
+        for index, text in enumerate(texts):
+            tokens = set(tokenize(text))
+            for token in tokens:
+                token_rows.setdefault(token, []).append(index)
+            for gram in char_ngrams(tokens):
+                ngram_rows.setdefault(gram, []).append(index)
+
+        # Postings are stored as int32 arrays so shortlisting runs vectorized
+        self.token_postings = {key: np.array(rows, dtype=np.int32) for key, rows in token_rows.items()}
+        self.ngram_postings = {key: np.array(rows, dtype=np.int32) for key, rows in ngram_rows.items()}
+
+    def shortlist(self, text: str, limit: int) -> np.ndarray:
+        """
+        Get the rows that share tokens or n-grams with a normalized query text.
+
+        Args:
+            text: The normalized query text
+            limit: Maximum number of rows to return; the rows sharing the most keys are kept
+
+        Returns:
+            Sorted array of row indexes (empty if nothing is shared)
+        """
+        tokens = set(tokenize(text))
+        overlap = np.zeros(self.size, dtype=np.int32)
+
+        # Row indexes are unique within a posting list, so fancy-index addition is exact
+        for token in tokens:
+            rows = self.token_postings.get(token)
+            if rows is not None:
+                overlap[rows] += TOKEN_WEIGHT
+        for gram in char_ngrams(tokens):
+            rows = self.ngram_postings.get(gram)
+            if rows is not None:
+                overlap[rows] += NGRAM_WEIGHT
+
+        candidates = np.flatnonzero(overlap)
+        if len(candidates) > limit:
+            top = np.argpartition(overlap[candidates], -limit)[-limit:]
+            candidates = np.sort(candidates[top])
+
+        return candidates
@@ -0,0 +1,184 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from .normalization import normalize_text
+from .summary import location_category, summary_key
+
+# Cohort analytics: per-card location and fq distributions and the most common responses,
+# for all patients and broken down by gender and age band. They are kept in rollups that
+# writes to patient responses increment by the difference between the old and new
+# responses, so reading them costs the same however many patients there are:
+# - cohort_rollups: one small document per group and card with the response count and
+#   the location and fq distributions, plus one per group with its totals (card 0)
+# - cohort_responses: one document per group, card and distinct response text with its
+#   count, indexed so the most common ones of a card are read off the index. Kept apart
+#   so the number of distinct texts doesn't grow the documents every write rewrites.
+# Rollups are updated after the patient write, so a failure in between leaves them
+# stale; the rebuild job recomputes them from the patient records.
+
+ROLLUP_COLLECTIONS = ('cohort_rollups', 'cohort_responses')
+# Upper bounds of the age bands, the last band is open-ended
+AGE_BAND_LIMITS = [17, 29, 44, 59]
+# Rollup dimensions; "all" has the single value "all"
+COHORT_DIMENSIONS = ('all', 'gender', 'age_band')
+# Longest response text counted among the common responses
+MAX_RESPONSE_KEY_LENGTH = 100
+EMPTY_RESPONSE = "(empty)"
+DEFAULT_COMMON_RESPONSES = 10
+
+Updates = Dict[str, List[Tuple[Dict, Dict]]]
+
+def age_band(age: int) -> str:
+    """Get the label of the age band an age falls in, e.g. 18-29 or 60+."""
+    lower = 0
+    for upper in AGE_BAND_LIMITS:
+        if age <= upper:
+            return f"{lower}-{upper}"
+        lower = upper + 1
+    return f"{lower}+"
+
+def patient_groups(patient: Dict) -> List[Tuple[str, str]]:
+    """Get the (dimension, value) groups a patient is counted in."""
+    gender = (patient.get("gender") or "").strip().lower()
+    return [
+        ("all", "all"),
+        ("gender", summary_key(gender) if gender else "unknown"),
+        ("age_band", age_band(patient.get("age") or 0))
+    ]
+
+def response_key(text: str) -> str:
+    return normalize_text(text or "")[:MAX_RESPONSE_KEY_LENGTH] or EMPTY_RESPONSE
+
+def card_counts(entries: Iterable[Dict]) -> Tuple[Counter, Counter]:
+    """Get the distribution counters and the response text counts of one card's entries."""
+    counts, responses = Counter(), Counter()
+    for entry in entries:
+        counts["responses"] += 1
+        counts[f"location.{location_category(entry.get('location') or '')}"] += 1
+        counts[f"fq.{summary_key(entry.get('fq') or '')}"] += 1
+        responses[response_key(entry.get('response_text'))] += 1
+    return counts, responses
+
+def difference(new: Counter, old: Counter) -> Dict:
+    new = Counter(new)
+    new.subtract(old)
+    return {key: change for key, change in new.items() if change}
+
+def responses_by_card(responses: Iterable[Dict]) -> Dict[int, List[Dict]]:
+    return {card["image_number"]: card.get("entries") or [] for card in responses}
+
+def rollup_updates(
+    patient: Dict,
+    old_responses: List[Dict],
+    new_responses: List[Dict],
+    patients: int = 0
+) -> Updates:
+    """
+    Get the rollup updates of a change to a patient's responses.
+
+    Args:
+        patient: The patient, with its age and gender
+        old_responses: The cards the change replaces
+        new_responses: The cards replacing them
+        patients: 1 when the patient is new, -1 when it is removed
+
+    Returns:
+        (filter, update) pairs of upserts incrementing the counters, per rollup collection
+    """
+    old_cards = responses_by_card(old_responses)
+    new_cards = responses_by_card(new_responses)
+    card_deltas: Dict[int, Dict] = {}
+    text_deltas: Dict[int, Dict] = {}
+    for card in sorted(old_cards.keys() | new_cards.keys()):
+        if old_cards.get(card) == new_cards.get(card):
+            continue
+        new_counts, new_texts = card_counts(new_cards.get(card, []))
+        old_counts, old_texts = card_counts(old_cards.get(card, []))
+        card_deltas[card] = difference(new_counts, old_counts)
+        text_deltas[card] = difference(new_texts, old_texts)
+    totals = {"patients": patients, "responses": sum(delta.get("responses", 0) for delta in card_deltas.values())}
+
+    updates: Updates = {collection: [] for collection in ROLLUP_COLLECTIONS}
+    for dimension, value in patient_groups(patient):
+        for card, delta in [(0, totals), *card_deltas.items()]:
+            increments = {path: change for path, change in delta.items() if change}
+            if increments:
+                updates["cohort_rollups"].append((
+                    {"_id": f"{dimension}:{value}:{card}"},
+                    {"$inc": increments, "$setOnInsert": {"dimension": dimension, "value": value, "card": card}}
+                ))
+        for card, delta in text_deltas.items():
+            for text, change in delta.items():
+                updates["cohort_responses"].append((
+                    {"_id": f"{dimension}:{value}:{card}:{text}"},
+                    {"$inc": {"count": change}, "$setOnInsert": {"dimension": dimension, "value": value, "card": card, "response": text}}
+                ))
+    return updates
+
+class RollupBuilder:
+    """Accumulates the rollups of all patients in memory, for the rebuild job."""
+
+    def __init__(self):
+        self.patients = 0
+        # Collection -> _id -> (fixed fields, counters)
+        self.rollups: Dict[str, Dict[str, Tuple[Dict, Counter]]] = {collection: {} for collection in ROLLUP_COLLECTIONS}
+
+    def add(self, patient: Dict) -> None:
+        self.patients += 1
+        updates = rollup_updates(patient, [], patient.get("responses") or [], patients=1)
+        for collection, pairs in updates.items():
+            for rollup_filter, update in pairs:
+                _, counts = self.rollups[collection].setdefault(rollup_filter["_id"], (update["$setOnInsert"], Counter()))
+                counts.update(update["$inc"])
+
+    def documents(self, collection: str) -> List[Dict]:
+        """Get the documents of a rollup collection, with the counters nested the way the updates store them."""
+        documents = []
+        for key, (fields, counts) in self.rollups[collection].items():
+            document: Dict = {"_id": key, **fields}
+            for path, count in counts.items():
+                if "." in path:
+                    group, name = path.split(".", 1)
+                    document.setdefault(group, {})[name] = count
+                else:
+                    document[path] = count
+            documents.append(document)
+        return documents
+
+def group_order(value: str) -> Tuple[int, str]:
+    # Age bands in age order, other values alphabetically
+    lower = value.split("-")[0].rstrip("+")
+    return (int(lower), value) if lower.isdigit() else (0, value)
+
+def present_rollups(rollups: List[Dict], common_responses: Dict[Tuple[str, int], List[Dict]]) -> List[Dict]:
+    """
+    Turn the rollup documents of one dimension into its analytics, one entry per group.
+
+    Args:
+        rollups: The cohort_rollups documents of the dimension
+        common_responses: The most common response documents, by (group value, card)
+    """
+    groups: Dict[str, Dict] = {}
+    for rollup in rollups:
+        group = groups.setdefault(rollup["value"], {"value": rollup["value"], "patients": 0, "responses": 0, "cards": {}})
+        if rollup["card"] == 0:
+            group["patients"] = rollup.get("patients", 0)
+            group["responses"] = rollup.get("responses", 0)
+            continue
+        if not rollup.get("responses"):
+            continue
+        group["cards"][str(rollup["card"])] = {
+            "responses": rollup["responses"],
+            "location": {key: count for key, count in (rollup.get("location") or {}).items() if count},
+            "fq": {key: count for key, count in (rollup.get("fq") or {}).items() if count},
+            "common_responses": [
+                {"response": response["response"], "count": response["count"]}
+                for response in common_responses.get((rollup["value"], rollup["card"]), [])
+            ]
+        }
+    for group in groups.values():
+        group["cards"] = dict(sorted(group["cards"].items(), key=lambda item: int(item[0])))
+    return [
+        group for _, group in sorted(groups.items(), key=lambda item: group_order(item[0]))
+        if group["patients"] > 0
+    ]
@@ -1,11 +1,23 @@
 import motor.motor_asyncio
 from bson import ObjectId
-from datetime import datetime
-from typing import List, Optional, Dict, Any, Annotated
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, Annotated, AsyncIterator, Awaitable, Callable, Tuple
 from pydantic import BaseModel, Field, BeforeValidator, ConfigDict
+import asyncio
+import base64
+import copy
 import os
 import ssl
 import urllib.parse
+import uuid
+
+from .db_metrics import DatabaseMetrics
+from .summary import build_summary, summary_increments, present_summary
+from .match_cache import MISSING
+from .patient_cache import PatientCache, GENERATION_LOG_SIZE
+from .cohort import rollup_updates, RollupBuilder, present_rollups, Updates, ROLLUP_COLLECTIONS, DEFAULT_COMMON_RESPONSES
 
 # MongoDB connection - get credentials from environment or use defaults
 MONGO_URI = os.environ.get("MONGO_URI")
@@ -19,11 +31,34 @@ ssl_context.verify_mode = ssl.CERT_NONE
 # Print connection info for debugging (remove in production)
 print(f"Connecting to MongoDB: DATABASE_NAME={DATABASE_NAME}")
 
-# Create client with SSL options
-try:
-    if MONGO_URI:
-        client = motor.motor_asyncio.AsyncIOMotorClient(
-            MONGO_URI,
+# Connection pool sizing, per worker process. GET /db-stats shows the checkout waits
+# and connections in use to size the pool against.
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 100))
+# Connections opened at startup and kept open even when idle
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 2))
+# Idle connections beyond the minimum are closed after this long, 0 keeps them
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 300000))
+# How long a request may wait for a free connection before failing, 0 waits forever
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000))
+
+# The client is created lazily, once per process, and closed by the app's shutdown
+# event. Motor/PyMongo clients are not fork-safe, so a client created before the server
+# forks its workers must not be reused by them: each worker builds its own on first use.
+# Everything in the process (requests, the warm-up, health checks) shares its pool.
+_client: Optional[motor.motor_asyncio.AsyncIOMotorClient] = None
+_client_pid: Optional[int] = None
+_metrics: Optional[DatabaseMetrics] = None
+
+def client_options(uri: Optional[str] = MONGO_URI) -> Dict[str, Any]:
+    """Get the connection, SSL and pool options the app's clients are created with."""
+    options: Dict[str, Any] = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS or None,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS or None
+    }
+    if uri:
+        options.update(
             serverSelectionTimeoutMS=20000,
             connectTimeoutMS=20000,
             ssl=True,
@@ -32,28 +67,101 @@ try:
             tls=True,
             tlsAllowInvalidCertificates=True
         )
-    else:
+    return options
+
+def create_client(uri: Optional[str] = MONGO_URI, **overrides) -> motor.motor_asyncio.AsyncIOMotorClient:
+    """
+    Create a MongoDB client with the configured connection, SSL and pool options.
+    
+    Args:
+        uri: Connection string (localhost if not set)
+        **overrides: Client options replacing the configured ones
+    """
+    if not uri:
         print("Warning: No MONGO_URI found. Using default localhost connection.")
-        client = motor.motor_asyncio.AsyncIOMotorClient("mongodb://localhost:27017")
+    options = {**client_options(uri), **overrides}
+    return motor.motor_asyncio.AsyncIOMotorClient(uri or "mongodb://localhost:27017", **options)
+
+def get_client() -> Optional[motor.motor_asyncio.AsyncIOMotorClient]:
+    """Get this process's MongoDB client, creating it on first use (or after a fork)."""
+    global _client, _client_pid, _metrics
+    
+    if _client is None or _client_pid != os.getpid():
+        try:
+            metrics = DatabaseMetrics()
+            _client = create_client(event_listeners=[metrics])
+            _client_pid = os.getpid()
+            _metrics = metrics
+            print(f"MongoDB client initialized successfully (pid {_client_pid})")
+        except Exception as e:
+            print(f"Error initializing MongoDB client: {str(e)}")
+            # Fallback to ensure the app doesn't crash completely during initialization
+            _client = None
+            _client_pid = None
+            _metrics = None
+    
+    return _client
+
+def get_database():
+    """Get this process's database handle, or None if no client could be created."""
+    client = get_client()
+    if client is None:
+        return None
+    return client[DATABASE_NAME]
+
+async def warm_pool(connections: int = MONGO_MIN_POOL_SIZE) -> int:
+    """
+    Open pooled connections ahead of the first requests by running concurrent pings.
+    
+    Returns:
+        The number of open connections afterwards
+    """
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    if connections > 0:
+        await asyncio.gather(*(db.command("ping") for _ in range(connections)))
+    return _metrics.get_stats()["pool"]["open_connections"] if _metrics is not None else 0
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Get the pool settings and this process's pool and command metrics."""
+    return {
+        "pid": os.getpid(),
+        "config": {
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+            "max_idle_time_ms": MONGO_MAX_IDLE_TIME_MS,
+            "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS
+        },
+        "metrics": _metrics.get_stats() if _metrics is not None and _client_pid == os.getpid() else None
+    }
+
+def close_client() -> None:
+    """Close this process's MongoDB client, if one was created."""
+    global _client, _client_pid, _metrics
     
-    db = client[DATABASE_NAME]
-    print("MongoDB client initialized successfully")
-except Exception as e:
-    print(f"Error initializing MongoDB client: {str(e)}")
-    # Fallback to ensure the app doesn't crash completely during initialization
-    client = None
-    db = None
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+    _client = None
+    _client_pid = None
+    _metrics = None
 
 # Create indexes
-async def create_indexes():
+async def create_indexes() -> bool:
     try:
-        if db:
+        db = get_database()
+        if db is not None:
             await db.patients.create_index("patient_id", unique=True)
+            # Keyset pagination of the patient list (newest first)
+            await db.patients.create_index([("created_at", -1), ("_id", -1)])
+            await create_cohort_indexes(db.cohort_rollups, db.cohort_responses)
             print("MongoDB indexes created successfully")
+            return True
         else:
             print("Cannot create indexes: Database connection not established")
     except Exception as e:
         print(f"Error creating indexes: {str(e)}")
+    return False
 
 # Convert ObjectId to str and validate ObjectId
 def validate_object_id(v: Any) -> ObjectId:
@@ -97,6 +205,19 @@ class ResponseEntry(BaseModel):
         }
     )
 
+class ResponseEntryPatch(BaseModel):
+    """Fields of a response entry to change; fields left out keep their value."""
+    position: Optional[str] = None
+    response_text: Optional[str] = None
+    number_of_responses: Optional[int] = None
+    determinants: Optional[List[str]] = None
+    content: Optional[List[str]] = None
+    dq: Optional[str] = None
+    z_score: Optional[str] = None
+    special_score: Optional[List[str]] = None
+    location: Optional[str] = None
+    fq: Optional[str] = None
+
 class ImageResponse(BaseModel):
     image_number: int
     entries: List[ResponseEntry] = []
@@ -190,12 +311,19 @@ class PatientResponse(BaseModel):
     test_notes: str = ""
     created_at: datetime
     responses: List[ImageResponse] = []
+    version: int = 0  # Bumped by every change to the record, for optimistic concurrency and ETags
+    updated_at: Optional[datetime] = None
     
     model_config = ConfigDict(
         populate_by_name=True,
         arbitrary_types_allowed=True
     )
 
+# Every patient field except the responses
+PATIENT_HEADER_FIELDS = {
+    field.alias or name: 1 for name, field in PatientResponse.model_fields.items() if name != "responses"
+}
+
 class PatientBasicInfo(BaseModel):
     id: str = Field(alias="_id")
     patient_id: str
@@ -210,55 +338,788 @@ class PatientBasicInfo(BaseModel):
         arbitrary_types_allowed=True
     )
 
+class PatientPage(BaseModel):
+    patients: List[PatientBasicInfo]
+    next_cursor: Optional[str] = None  # Pass as `after` to get the next page
+
+class PatientSummary(BaseModel):
+    """Structural summary of a patient's responses; counts are keyed by scoring code."""
+    patient_id: str
+    version: int = 0
+    total_responses: int = 0
+    cards_with_responses: int = 0
+    per_card: Dict[str, int] = {}  # Keyed by image number
+    location: Dict[str, int] = {}  # W, D, Dd
+    fq: Dict[str, int] = {}
+    dq: Dict[str, int] = {}
+    determinants: Dict[str, int] = {}
+    content: Dict[str, int] = {}
+    special_scores: Dict[str, int] = {}
+
+# Fields returned by the patient list
+PATIENT_BASIC_FIELDS = {
+    "patient_id": 1,
+    "name": 1,
+    "age": 1,
+    "gender": 1,
+    "test_date": 1,
+    "created_at": 1
+}
+# Newest first; _id breaks ties between patients created in the same millisecond
+PATIENT_LIST_ORDER = [("created_at", -1), ("_id", -1)]
+DEFAULT_PATIENT_PAGE_SIZE = 50
+MAX_PATIENT_PAGE_SIZE = 500
+# Documents fetched per round trip when streaming the patient list
+PATIENT_STREAM_BATCH_SIZE = 200
+
+# Patient cache (see patient_cache.py). The generation counter and the log of changed
+# patients are kept in one document, so a single read tells a worker what to drop.
+patient_cache = PatientCache()
+PATIENTS_GENERATION_ID = "patients"
+
+async def sync_patient_cache() -> int:
+    """
+    Catch up with the other workers' writes if the generation counter is due for a check.
+    
+    Returns:
+        The generation the patient cache is in sync with
+    """
+    if patient_cache.check_due():
+        db = get_database()
+        if db is None:
+            raise Exception("Database connection not established")
+        counter = await db.cache_generations.find_one({"_id": PATIENTS_GENERATION_ID})
+        patient_cache.sync(counter["generation"] if counter else 0, counter["changes"] if counter else [])
+    return patient_cache.generation
+
+async def patient_changed(patient_id: str) -> None:
+    """Drop a changed patient from this worker's cache and tell the other workers through the generation counter."""
+    patient_cache.invalidate(patient_id)
+    try:
+        db = get_database()
+        if db is None:
+            raise Exception("Database connection not established")
+        counter = await db.cache_generations.find_one_and_update(
+            {"_id": PATIENTS_GENERATION_ID},
+            {"$inc": {"generation": 1}, "$push": {"changes": {"$each": [patient_id], "$slice": -GENERATION_LOG_SIZE}}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        patient_cache.sync(counter["generation"], counter["changes"])
+    except Exception as e:
+        print(f"⚠️ Error updating the patient cache generation, other workers may serve stale patients: {str(e)}")
+
 # Database operations
 async def insert_patient(patient_data: dict) -> str:
     try:
-        if not db:
+        db = get_database()
+        if db is None:
             raise Exception("Database connection not established")
+        # Store the structural summary with the record; later writes keep it current
+        patient_data["summary"] = build_summary(patient_data.get("responses") or [])
+        patient_data.setdefault("updated_at", patient_data.get("created_at") or datetime.now())
         patient = await db.patients.insert_one(patient_data)
-        return str(patient.inserted_id)
     except Exception as e:
         print(f"Error inserting patient: {str(e)}")
         raise
+    
+    await patient_changed(patient_data["patient_id"])
+    await update_cohort_rollups(rollup_updates(patient_data, [], patient_data.get("responses") or [], patients=1))
+    return str(patient.inserted_id)
+
+def patient_projection(images: Optional[List[int]] = None, header_only: bool = False) -> Optional[dict]:
+    """
+    Build the projection of a partial patient fetch.
+    
+    Args:
+        images: Only return the responses to these cards
+        header_only: Leave out the responses altogether
+        
+    Returns:
+        The projection, or None to fetch the whole document
+    """
+    if header_only:
+        return {"responses": 0}
+    if not images:
+        return None
+    
+    projection = dict(PATIENT_HEADER_FIELDS)
+    if len(images) == 1:
+        projection["responses"] = {"$elemMatch": {"image_number": images[0]}}
+    else:
+        # $elemMatch only returns the first matching card, $filter returns them all
+        projection["responses"] = {"$filter": {
+            "input": "$responses",
+            "as": "image",
+            "cond": {"$in": ["$$image.image_number", images]}
+        }}
+    return projection
 
-async def get_patient_by_id(patient_id: str) -> Optional[dict]:
+async def get_patient_by_id(patient_id: str, images: Optional[List[int]] = None, header_only: bool = False) -> Optional[dict]:
+    """
+    Get a patient record, or only part of it, through the in-process patient cache.
+    
+    Args:
+        patient_id: The patient ID
+        images: Only fetch the responses to these cards
+        header_only: Fetch the patient details without any responses
+        
+    Returns:
+        The (partial) patient document, or None if there is no such patient
+    """
     try:
-        if not db:
+        db = get_database()
+        if db is None:
             raise Exception("Database connection not established")
-        return await db.patients.find_one({"patient_id": patient_id})
+        
+        await sync_patient_cache()
+        variant = (tuple(images) if images else None, header_only)
+        cached = patient_cache.get(patient_id, variant)
+        if cached is not MISSING:
+            # Callers may change the document they get
+            return copy.deepcopy(cached)
+        
+        epoch = patient_cache.epoch
+        patient = await db.patients.find_one({"patient_id": patient_id}, patient_projection(images, header_only))
+        if patient is not None:
+            patient_cache.put(patient_id, variant, copy.deepcopy(patient), epoch)
+        return patient
     except Exception as e:
         print(f"Error getting patient by ID: {str(e)}")
         raise
 
-async def get_all_patients() -> List[dict]:
+# Cache variant of the version-only reads that conditional requests make
+PATIENT_VERSION_VARIANT = "version"
+
+async def get_patient_version(patient_id: str) -> Optional[int]:
+    """
+    Get the current version of a patient, to check a conditional request before reading the record.
+    
+    Comes from any cached document of the patient, or else from a read of the version alone.
+    
+    Returns:
+        The version, or None if there is no such patient
+    """
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    
+    await sync_patient_cache()
+    version = patient_cache.get_version(patient_id)
+    if version is not None:
+        return version
+    
+    epoch = patient_cache.epoch
+    patient = await db.patients.find_one({"patient_id": patient_id}, {"_id": 0, "version": 1})
+    if patient is None:
+        return None
+    patient.setdefault("version", 0)
+    patient_cache.put(patient_id, PATIENT_VERSION_VARIANT, patient, epoch)
+    return patient["version"]
+
+async def has_patients() -> bool:
+    """Check whether the patients collection has any document, reading at most one."""
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    return await db.patients.find_one({}, {"_id": 1}) is not None
+
+def encode_patient_cursor(patient: dict) -> str:
+    """Encode the sort key of a listed patient as an opaque `after` cursor."""
+    key = f"{patient['created_at'].isoformat()}|{patient['_id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+def decode_patient_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """
+    Decode an `after` cursor into the (created_at, _id) sort key it points at.
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
     try:
-        if not db:
-            raise Exception("Database connection not established")
-        patients = []
-        cursor = db.patients.find({}, {
-            "patient_id": 1,
-            "name": 1,
-            "age": 1,
-            "gender": 1,
-            "test_date": 1,
-            "created_at": 1
-        })
-        async for document in cursor:
-            patients.append(document)
-        return patients
-    except Exception as e:
-        print(f"Error getting all patients: {str(e)}")
-        return []
+        key = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, object_id = key.split("|")
+        return datetime.fromisoformat(created_at), ObjectId(object_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def patients_after_query(after: Optional[Tuple[datetime, ObjectId]]) -> dict:
+    """Filter for the patients listed after a (created_at, _id) sort key, newest first."""
+    if after is None:
+        return {}
+    created_at, object_id = after
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": object_id}}
+    ]}
+
+async def get_patients_page(limit: int, after: Optional[Tuple[datetime, ObjectId]] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Get one page of the patient list, newest first.
+    
+    Args:
+        limit: Maximum number of patients on the page
+        after: Sort key of the last patient of the previous page
+        
+    Returns:
+        The patients' basic info and the cursor of the next page (None on the last page)
+    """
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    
+    # Fetch one extra document to know whether another page follows
+    cursor = db.patients.find(patients_after_query(after), PATIENT_BASIC_FIELDS)
+    patients = await cursor.sort(PATIENT_LIST_ORDER).limit(limit + 1).to_list(length=limit + 1)
+    
+    next_cursor = None
+    if len(patients) > limit:
+        patients = patients[:limit]
+        next_cursor = encode_patient_cursor(patients[-1])
+    return patients, next_cursor
+
+async def iter_patients(after: Optional[Tuple[datetime, ObjectId]] = None, limit: int = 0) -> AsyncIterator[dict]:
+    """
+    Yield the patients' basic info, newest first, as the cursor fetches them.
+    
+    Args:
+        after: Sort key to start after
+        limit: Maximum number of patients, 0 for all of them
+    """
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    
+    cursor = db.patients.find(patients_after_query(after), PATIENT_BASIC_FIELDS).sort(PATIENT_LIST_ORDER)
+    if limit:
+        cursor = cursor.limit(limit)
+    async for document in cursor.batch_size(PATIENT_STREAM_BATCH_SIZE):
+        yield document
 
 async def update_patient_responses(patient_id: str, responses: List[dict]) -> bool:
     try:
-        if not db:
+        db = get_database()
+        if db is None:
             raise Exception("Database connection not established")
-        result = await db.patients.update_one(
+        # The responses before the update, for the cohort rollups
+        previous = await db.patients.find_one_and_update(
             {"patient_id": patient_id}, 
-            {"$set": {"responses": responses}}
+            {"$set": {"responses": responses, "summary": build_summary(responses), "updated_at": datetime.now()}, "$inc": {"version": 1}},
+            projection={"age": 1, "gender": 1, "responses": 1},
+            return_document=ReturnDocument.BEFORE
         )
-        return result.modified_count > 0
     except Exception as e:
         print(f"Error updating patient responses: {str(e)}")
-        return False 
\ No newline at end of file
+        return False
+    
+    if previous is None:
+        return False
+    await patient_changed(patient_id)
+    await update_cohort_rollups(rollup_updates(previous, previous.get("responses") or [], responses))
+    return True
+
+class VersionConflict(Exception):
+    """Raised when a patient record changed since the version a client based its edit on."""
+    
+    def __init__(self, patient_id: str, expected_version: int, current_version: int):
+        super().__init__(f"Patient {patient_id} is at version {current_version}, not {expected_version}")
+        self.current_version = current_version
+
+# Granular response updates. Each one changes a single card or entry in place with a
+# positional update (array filters select the card), and only applies if the record is
+# still at the version the client edited, so concurrent edits can't overwrite each other.
+
+def version_condition(expected_version: int) -> Any:
+    # Records created before versioning have no version field and count as version 0
+    return expected_version if expected_version else {"$in": [0, None]}
+
+async def versioned_update(
+    patient_id: str,
+    expected_version: int,
+    update: dict,
+    conditions: Optional[dict] = None,
+    array_filters: Optional[List[dict]] = None
+) -> Optional[int]:
+    """
+    Apply an update to a patient if it is still at the expected version, bumping the version.
+    
+    Args:
+        patient_id: The patient ID
+        expected_version: Version the change was based on
+        update: The update operators to apply
+        conditions: Extra conditions the record must meet (e.g. that the card exists)
+        array_filters: Array filters of the update
+        
+    Returns:
+        The new version, or None if the patient doesn't exist or doesn't meet the conditions
+        
+    Raises:
+        VersionConflict: If the patient is at another version
+    """
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    
+    query = {"patient_id": patient_id, "version": version_condition(expected_version), **(conditions or {})}
+    options = {"array_filters": array_filters} if array_filters else {}
+    update = {
+        **update,
+        "$set": {**update.get("$set", {}), "updated_at": datetime.now()},
+        "$inc": {**update.get("$inc", {}), "version": 1}
+    }
+    result = await db.patients.update_one(query, update, **options)
+    if result.matched_count:
+        await patient_changed(patient_id)
+        return expected_version + 1
+    
+    # Tell a stale version apart from a missing patient, card or entry
+    current = await db.patients.find_one({"patient_id": patient_id}, {"version": 1})
+    if current is None:
+        return None
+    if current.get("version", 0) != expected_version:
+        raise VersionConflict(patient_id, expected_version, current.get("version", 0))
+    return None
+
+def card_filter(image_number: int) -> List[dict]:
+    return [{"card.image_number": image_number}]
+
+async def backfill_summary(patient_id: str) -> Optional[dict]:
+    """
+    Build and store the summary of a record written before summaries were kept.
+    
+    A null summary counts as missing.
+    
+    Returns:
+        The version the summary was built from and the summary, or None if the patient
+        doesn't exist or already has one
+    """
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    
+    patient = await db.patients.find_one({"patient_id": patient_id, "summary": None}, {"version": 1, "responses": 1})
+    if patient is None:
+        return None
+    version = patient.get("version", 0)
+    summary = build_summary(patient.get("responses") or [])
+    # Not a change to the record, so the version stays; skipped if the record changed meanwhile
+    await db.patients.update_one(
+        {"_id": patient["_id"], "version": version_condition(version), "summary": None},
+        {"$set": {"summary": summary}}
+    )
+    return {"version": version, "summary": summary}
+
+async def get_patient_summary(patient_id: str) -> Optional[dict]:
+    """
+    Get the structural summary of a patient's responses, reading only the stored summary.
+    
+    Returns:
+        The summary with the patient ID and version, or None if there is no such patient
+    """
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    
+    projection = {"patient_id": 1, "version": 1, "summary": 1}
+    patient = await db.patients.find_one({"patient_id": patient_id}, projection)
+    if patient is None:
+        return None
+    if patient.get("summary") is None:
+        # Read once more if a concurrent write added the summary first, or the patient is gone
+        patient = await backfill_summary(patient_id) or await db.patients.find_one({"patient_id": patient_id}, projection)
+        if patient is None:
+            return None
+        if patient.get("summary") is None:
+            raise Exception(f"Summary of patient {patient_id} was removed while it was built")
+    return {"patient_id": patient_id, "version": patient.get("version", 0), **present_summary(patient["summary"])}
+
+async def summarized_update(
+    patient_id: str,
+    expected_version: int,
+    update: dict,
+    increments: Dict[str, int],
+    conditions: Optional[dict] = None,
+    array_filters: Optional[List[dict]] = None
+) -> Optional[int]:
+    """
+    Apply a versioned update together with the summary counter increments of the change.
+    
+    The increments only apply to a record that has a summary; one written before
+    summaries were kept gets its summary built first.
+    """
+    if increments:
+        update = {**update, "$inc": increments}
+        conditions = {**(conditions or {}), "summary": {"$ne": None}}
+    
+    version = await versioned_update(patient_id, expected_version, update, conditions, array_filters)
+    if version is None and increments and await backfill_summary(patient_id) is not None:
+        version = await versioned_update(patient_id, expected_version, update, conditions, array_filters)
+    return version
+
+async def get_card(patient_id: str, image_number: int, expected_version: int) -> Optional[dict]:
+    """
+    Read one card of a patient, as of the version the client edited.
+    
+    Returns:
+        The patient's version, age, gender and the card (if it has responses), or None if the patient doesn't exist
+        
+    Raises:
+        VersionConflict: If the patient is at another version
+    """
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    
+    patient = await db.patients.find_one(
+        {"patient_id": patient_id},
+        {"version": 1, "age": 1, "gender": 1, "responses": {"$elemMatch": {"image_number": image_number}}}
+    )
+    if patient is None:
+        return None
+    if patient.get("version", 0) != expected_version:
+        raise VersionConflict(patient_id, expected_version, patient.get("version", 0))
+    return patient
+
+def card_entries(patient: dict) -> List[dict]:
+    """Get the entries of the card read by get_card, empty if it has no responses."""
+    cards = patient.get("responses") or []
+    return cards[0]["entries"] if cards else []
+
+async def update_card_rollups(patient: dict, image_number: int, old_entries: List[dict], new_entries: List[dict]) -> None:
+    await update_cohort_rollups(rollup_updates(
+        patient,
+        [{"image_number": image_number, "entries": old_entries}],
+        [{"image_number": image_number, "entries": new_entries}]
+    ))
+
+# Every granular update adjusts the summary and the cohort rollups by the difference
+# between the card's or entry's old and new responses. The old ones are read at the
+# expected version, and the update only applies at that same version, so the increments
+# match what gets replaced.
+
+async def add_response_card(patient_id: str, image_number: int, entries: List[dict], expected_version: int) -> Optional[int]:
+    """Add a card that has no responses yet, keeping the cards ordered by image number."""
+    card = {"image_number": image_number, "entries": entries}
+    return await summarized_update(
+        patient_id, expected_version,
+        {"$push": {"responses": {"$each": [card], "$sort": {"image_number": 1}}}},
+        summary_increments([], entries, image_number),
+        conditions={"responses.image_number": {"$ne": image_number}}
+    )
+
+async def replace_response_card(patient_id: str, image_number: int, entries: List[dict], expected_version: int) -> Optional[int]:
+    """
+    Replace the entries of one card, adding the card if it has no responses yet.
+    
+    Returns:
+        The new version, or None if the patient doesn't exist
+    """
+    patient = await get_card(patient_id, image_number, expected_version)
+    if patient is None:
+        return None
+    
+    old_entries = card_entries(patient)
+    version = await summarized_update(
+        patient_id, expected_version,
+        {"$set": {"responses.$[card].entries": entries}},
+        summary_increments(old_entries, entries, image_number),
+        conditions={"responses.image_number": image_number},
+        array_filters=card_filter(image_number)
+    )
+    if version is None:
+        version = await add_response_card(patient_id, image_number, entries, expected_version)
+    if version is not None:
+        await update_card_rollups(patient, image_number, old_entries, entries)
+    return version
+
+async def delete_response_card(patient_id: str, image_number: int, expected_version: int) -> Optional[int]:
+    """
+    Remove one card and all its entries.
+    
+    Returns:
+        The new version, or None if the patient or card doesn't exist
+    """
+    patient = await get_card(patient_id, image_number, expected_version)
+    if patient is None:
+        return None
+    
+    old_entries = card_entries(patient)
+    version = await summarized_update(
+        patient_id, expected_version,
+        {"$pull": {"responses": {"image_number": image_number}}},
+        summary_increments(old_entries, [], image_number),
+        conditions={"responses.image_number": image_number}
+    )
+    if version is not None:
+        await update_card_rollups(patient, image_number, old_entries, [])
+    return version
+
+async def add_response_entry(patient_id: str, image_number: int, entry: dict, expected_version: int) -> Optional[int]:
+    """
+    Append an entry to a card, adding the card if it has no responses yet.
+    
+    Returns:
+        The new version, or None if the patient doesn't exist
+    """
+    # Read for the patient's cohort groups
+    patient = await get_card(patient_id, image_number, expected_version)
+    if patient is None:
+        return None
+    
+    version = await summarized_update(
+        patient_id, expected_version,
+        {"$push": {"responses.$[card].entries": entry}},
+        summary_increments([], [entry], image_number),
+        conditions={"responses.image_number": image_number},
+        array_filters=card_filter(image_number)
+    )
+    if version is None:
+        version = await add_response_card(patient_id, image_number, [entry], expected_version)
+    if version is not None:
+        await update_card_rollups(patient, image_number, [], [entry])
+    return version
+
+async def update_response_entry(
+    patient_id: str,
+    image_number: int,
+    entry_index: int,
+    fields: dict,
+    expected_version: int,
+    prepare: Optional[Callable[[dict, dict], Awaitable[None]]] = None
+) -> Optional[int]:
+    """
+    Change some fields of one entry of a card.
+    
+    Args:
+        prepare: Called with the stored entry and the fields before they are written,
+            to adjust the fields against what they replace (e.g. re-analyze changed text)
+    
+    Returns:
+        The new version, or None if the patient, card or entry doesn't exist
+    """
+    patient = await get_card(patient_id, image_number, expected_version)
+    entries = card_entries(patient) if patient is not None else []
+    if entry_index >= len(entries):
+        return None
+    
+    old_entry = entries[entry_index]
+    if prepare is not None:
+        await prepare(old_entry, fields)
+    new_entry = {**old_entry, **fields}
+    version = await summarized_update(
+        patient_id, expected_version,
+        {"$set": {f"responses.$[card].entries.{entry_index}.{name}": value for name, value in fields.items()}},
+        summary_increments([old_entry], [new_entry], image_number),
+        conditions={"responses": {"$elemMatch": {"image_number": image_number, f"entries.{entry_index}": {"$exists": True}}}},
+        array_filters=card_filter(image_number)
+    )
+    if version is not None:
+        await update_card_rollups(patient, image_number, [old_entry], [new_entry])
+    return version
+
+async def delete_response_entry(patient_id: str, image_number: int, entry_index: int, expected_version: int) -> Optional[int]:
+    """
+    Remove one entry of a card.
+    
+    MongoDB can't pull an array element by position, so the card's remaining entries
+    are written back; only that card is read and rewritten.
+    
+    Returns:
+        The new version, or None if the patient, card or entry doesn't exist
+    """
+    patient = await get_card(patient_id, image_number, expected_version)
+    entries = card_entries(patient) if patient is not None else []
+    if entry_index >= len(entries):
+        return None
+    
+    version = await summarized_update(
+        patient_id, expected_version,
+        {"$set": {"responses.$[card].entries": entries[:entry_index] + entries[entry_index + 1:]}},
+        summary_increments([entries[entry_index]], [], image_number),
+        conditions={"responses.image_number": image_number},
+        array_filters=card_filter(image_number)
+    )
+    if version is not None:
+        await update_card_rollups(patient, image_number, [entries[entry_index]], [])
+    return version
+
+# Cohort analytics rollups (see cohort.py)
+
+# cohort_rollups document recording when the rollups were last rebuilt
+COHORT_META_ID = "meta"
+# Index of the most common responses of each group and card
+COHORT_RESPONSES_INDEX = [("dimension", 1), ("value", 1), ("card", 1), ("count", -1), ("response", 1)]
+# Lease that lets one worker process at a time rebuild the rollups, in cohort_leases.
+# It expires so a worker that died mid-rebuild doesn't block rebuilds for good.
+COHORT_REBUILD_LEASE_ID = "rebuild"
+COHORT_REBUILD_LEASE_SECONDS = int(os.environ.get("COHORT_REBUILD_LEASE_SECONDS", 600))
+
+class RebuildInProgress(Exception):
+    """Raised when another worker holds the cohort rollup rebuild lease."""
+    pass
+
+async def acquire_rebuild_lease(db, holder: str) -> bool:
+    """Take the rebuild lease if it is free or expired; False if another worker holds it."""
+    now = datetime.now()
+    try:
+        await db.cohort_leases.find_one_and_update(
+            {"_id": COHORT_REBUILD_LEASE_ID, "expires_at": {"$lt": now}},
+            {"$set": {"holder": holder, "expires_at": now + timedelta(seconds=COHORT_REBUILD_LEASE_SECONDS)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The lease exists and hasn't expired, so the upsert collided with it
+        return False
+
+async def release_rebuild_lease(db, holder: str) -> None:
+    await db.cohort_leases.update_one(
+        {"_id": COHORT_REBUILD_LEASE_ID, "holder": holder},
+        {"$set": {"expires_at": datetime.now()}}
+    )
+
+async def create_cohort_indexes(rollups, responses) -> None:
+    await rollups.create_index("dimension")
+    await responses.create_index(COHORT_RESPONSES_INDEX)
+
+async def update_cohort_rollups(updates: Updates) -> None:
+    """
+    Apply rollup counter updates, one round trip per rollup collection.
+    
+    The patient write they belong to has already succeeded, so a failure is only logged:
+    it leaves the rollups stale until they are rebuilt.
+    """
+    try:
+        db = get_database()
+        if db is None:
+            raise Exception("Database connection not established")
+        await asyncio.gather(*(
+            db[collection].bulk_write(
+                [UpdateOne(rollup_filter, update, upsert=True) for rollup_filter, update in pairs], ordered=False
+            )
+            for collection, pairs in updates.items() if pairs
+        ))
+    except Exception as e:
+        print(f"⚠️ Error updating cohort rollups, rebuild them to catch up: {str(e)}")
+
+async def get_cohort_analytics(dimension: str, card: Optional[int] = None, common_responses: int = DEFAULT_COMMON_RESPONSES) -> dict:
+    """
+    Get the cohort analytics of one dimension from its rollups.
+    
+    Args:
+        dimension: "all", "gender" or "age_band"
+        card: Only include this card
+        common_responses: Number of most common responses listed per card
+        
+    Returns:
+        The analytics of each group of the dimension, and when the rollups were last rebuilt
+    """
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    
+    query = {"dimension": dimension, "card": {"$in": [0, card]}} if card else {"dimension": dimension}
+    rollups, meta = await asyncio.gather(
+        db.cohort_rollups.find(query).to_list(length=None),
+        db.cohort_rollups.find_one({"_id": COHORT_META_ID})
+    )
+    
+    # The most common responses of each group's cards, read off the index
+    cards = [(rollup["value"], rollup["card"]) for rollup in rollups if rollup["card"] and rollup.get("responses")]
+    top = await asyncio.gather(*(
+        db.cohort_responses.find({"dimension": dimension, "value": value, "card": number, "count": {"$gt": 0}})
+        .sort([("count", -1), ("response", 1)]).limit(common_responses).to_list(length=common_responses)
+        for value, number in cards
+    ))
+    return {
+        "dimension": dimension,
+        "groups": present_rollups(rollups, dict(zip(cards, top))),
+        "rebuilt_at": meta.get("rebuilt_at") if meta else None
+    }
+
+async def rebuild_cohort_rollups(if_missing: bool = False) -> Optional[dict]:
+    """
+    Recompute the cohort rollups from all patient records.
+    
+    The rollups are built in memory while the patients are streamed, written to new
+    collections and swapped in by renaming them, so readers never see partial rollups.
+    Patient writes made while the rebuild runs may be left out of the new rollups.
+    Only the worker holding the rebuild lease rebuilds, and every run stages its
+    rollups in collections of its own.
+    
+    Args:
+        if_missing: Only rebuild if the rollups were never built
+    
+    Returns:
+        The number of patients and rollup documents, and when the rebuild finished,
+        or None if if_missing was set and the rollups exist
+        
+    Raises:
+        RebuildInProgress: If another worker is rebuilding the rollups
+    """
+    db = get_database()
+    if db is None:
+        raise Exception("Database connection not established")
+    
+    run_id = f"{os.getpid()}_{uuid.uuid4().hex[:12]}"
+    if not await acquire_rebuild_lease(db, run_id):
+        raise RebuildInProgress("The cohort rollups are being rebuilt by another worker")
+    
+    staging = {collection: db[f"{collection}_rebuild_{run_id}"] for collection in ROLLUP_COLLECTIONS}
+    try:
+        # Checked under the lease, as another worker may have just finished building them
+        if if_missing and await db.cohort_rollups.find_one({"_id": COHORT_META_ID}, {"_id": 1}) is not None:
+            return None
+        
+        builder = RollupBuilder()
+        cursor = db.patients.find({}, {"age": 1, "gender": 1, "responses": 1})
+        async for patient in cursor.batch_size(PATIENT_STREAM_BATCH_SIZE):
+            builder.add(patient)
+        
+        rebuilt_at = datetime.now()
+        documents = {collection: builder.documents(collection) for collection in ROLLUP_COLLECTIONS}
+        documents["cohort_rollups"].append({"_id": COHORT_META_ID, "rebuilt_at": rebuilt_at, "patients": builder.patients})
+        
+        for name, collection in staging.items():
+            if documents[name]:
+                await collection.insert_many(documents[name], ordered=False)
+        await create_cohort_indexes(staging["cohort_rollups"], staging["cohort_responses"])
+        # The distributions are swapped in last: their meta document marks a complete rebuild
+        for name in reversed(ROLLUP_COLLECTIONS):
+            await staging[name].rename(name, dropTarget=True)
+    finally:
+        # Drops whatever a failed run left staged (renamed collections are gone already)
+        for name in staging:
+            await db[f"{name}_rebuild_{run_id}"].drop()
+        await release_rebuild_lease(db, run_id)
+    
+    rollups = len(documents["cohort_rollups"]) - 1
+    print(f"✅ Rebuilt {rollups} cohort rollups from {builder.patients} patients")
+    return {
+        "patients": builder.patients,
+        "rollups": rollups,
+        "responses": len(documents["cohort_responses"]),
+        "rebuilt_at": rebuilt_at
+    }
+
+async def ensure_cohort_rollups() -> bool:
+    """
+    Build the cohort rollups if they were never built, e.g. on a database that had
+    patients before the rollups were kept.
+    
+    Returns:
+        True if the rollups are in place
+    """
+    try:
+        db = get_database()
+        if db is None:
+            raise Exception("Database connection not established")
+        if await db.cohort_rollups.find_one({"_id": COHORT_META_ID}, {"_id": 1}) is None:
+            await rebuild_cohort_rollups(if_missing=True)
+        return True
+    except RebuildInProgress as e:
+        print(f"Cohort rollups not built here: {str(e)}")
+        return False
+    except Exception as e:
+        print(f"Error building cohort rollups: {str(e)}")
+        return False
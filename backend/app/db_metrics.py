@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict
+
+import numpy as np
+from pymongo import monitoring
+
+# Connection pool and command metrics of the MongoDB client, collected from the driver's
+# monitoring events. They show how long requests wait to check out a pooled connection,
+# how many connections are in use, and how long commands take, which is what the pool
+# size settings should be tuned against.
+
+# Recent command latencies kept for the percentiles
+COMMAND_LATENCY_WINDOW = 1000
+
+class DatabaseMetrics(monitoring.ConnectionPoolListener, monitoring.CommandListener):
+    """Driver event listener that aggregates pool and command metrics (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Checkout start times, per thread: a checkout starts and ends on the same thread
+        self._checkout_started = threading.local()
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.checkout_failures = 0
+        self.max_in_use = 0
+        self.total_checkout_wait = 0.0
+        self.max_checkout_wait = 0.0
+        self.pool_clears = 0
+        self.commands = 0
+        self.failed_commands = 0
+        self.total_command_time = 0.0
+        self.max_command_time = 0.0
+        self._recent_command_times: Deque[float] = deque(maxlen=COMMAND_LATENCY_WINDOW)
+        # Command name -> [count, total seconds, max seconds]
+        self._by_command: Dict[str, list] = {}
+
+    # Connection pool events
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event) -> None:
+        self._checkout_started.value = time.perf_counter()
+
+    def connection_check_out_failed(self, event) -> None:
+        self._checkout_started.value = None
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event) -> None:
+        started = getattr(self._checkout_started, 'value', None)
+        wait = time.perf_counter() - started if started is not None else 0.0
+        self._checkout_started.value = None
+        with self._lock:
+            self.checkouts += 1
+            self.total_checkout_wait += wait
+            self.max_checkout_wait = max(self.max_checkout_wait, wait)
+            self.max_in_use = max(self.max_in_use, self.checkouts - self.checkins)
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checkins += 1
+
+    # Command events
+
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        self._record_command(event.command_name, event.duration_micros / 1e6, failed=False)
+
+    def failed(self, event) -> None:
+        self._record_command(event.command_name, event.duration_micros / 1e6, failed=True)
+
+    def _record_command(self, name: str, duration: float, failed: bool) -> None:
+        with self._lock:
+            self.commands += 1
+            if failed:
+                self.failed_commands += 1
+            self.total_command_time += duration
+            self.max_command_time = max(self.max_command_time, duration)
+            self._recent_command_times.append(duration)
+            stats = self._by_command.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+
+    def get_stats(self) -> Dict:
+        """Get the pool and command metrics, times in milliseconds."""
+        with self._lock:
+            recent = np.array(self._recent_command_times) * 1000
+            return {
+                'pool': {
+                    'open_connections': self.connections_created - self.connections_closed,
+                    'in_use': self.checkouts - self.checkins,
+                    'max_in_use': self.max_in_use,
+                    'connections_created': self.connections_created,
+                    'connections_closed': self.connections_closed,
+                    'checkouts': self.checkouts,
+                    'checkout_failures': self.checkout_failures,
+                    'avg_checkout_wait_ms': self.total_checkout_wait * 1000 / self.checkouts if self.checkouts else 0.0,
+                    'max_checkout_wait_ms': self.max_checkout_wait * 1000,
+                    'clears': self.pool_clears
+                },
+                'commands': {
+                    'total': self.commands,
+                    'failed': self.failed_commands,
+                    'avg_ms': self.total_command_time * 1000 / self.commands if self.commands else 0.0,
+                    'max_ms': self.max_command_time * 1000,
+                    'recent_p50_ms': float(np.percentile(recent, 50)) if len(recent) else 0.0,
+                    'recent_p99_ms': float(np.percentile(recent, 99)) if len(recent) else 0.0,
+                    'by_command': {
+                        name: {'count': count, 'avg_ms': total * 1000 / count, 'max_ms': longest * 1000}
+                        for name, (count, total, longest) in sorted(self._by_command.items())
+                    }
+                }
+            }
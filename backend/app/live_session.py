@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from .match_pool import MatchPoolFull
+from .normalization import normalize_text
+
+# A live matching session serves one /ws/analyze connection. The client streams the text
+# of each response entry while it is being typed, and only the newest text per entry is
+# matched: an edit that arrives while an older one is still waiting replaces it, and
+# results that are already stale when they come back are dropped instead of sent.
+
+# Suggestions returned with each live result unless the message asks for another number
+LIVE_SUGGESTION_LIMIT = int(os.environ.get("LIVE_SUGGESTION_LIMIT", 3))
+MAX_SUGGESTION_LIMIT = 20
+
+class LiveMatchSession:
+    """Per-connection state of a live matching session."""
+
+    def __init__(self, analyzer, pool, suggestion_limit: int = LIVE_SUGGESTION_LIMIT):
+        """
+        Args:
+            analyzer: The ResponseAnalyzer to match against
+            pool: The MatchPool the matching runs on
+            suggestion_limit: Default number of suggestions per result
+        """
+        self.analyzer = analyzer
+        self.pool = pool
+        self.suggestion_limit = suggestion_limit
+        # Newest unprocessed request per entry, in arrival order
+        self._pending: Dict[str, Dict] = {}
+        # Sequence number of the newest request seen per entry
+        self._latest: Dict[str, int] = {}
+        # Last result sent per entry, keyed by what it was computed from
+        self._last: Dict[str, Tuple[Tuple, Dict]] = {}
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self._next_seq = 0
+        self.received = 0
+        self.matched = 0
+        self.reused = 0
+        self.superseded = 0
+        self.discarded = 0
+
+    def submit(self, raw_message: str) -> Optional[Dict]:
+        """
+        Queue a client message for matching, replacing any older pending text of the same entry.
+
+        Args:
+            raw_message: JSON message with response_text, image_id and optionally entry, seq and limit
+
+        Returns:
+            A reply to send right away (validation error, empty text or an unchanged
+            result), or None if the message was queued
+        """
+        self.received += 1
+        try:
+            message = json.loads(raw_message)
+            if not isinstance(message, dict):
+                raise ValueError("Message must be a JSON object")
+            entry = str(message.get('entry', 'default'))
+            seq = int(message['seq']) if message.get('seq') is not None else self._next_seq
+            image_id = int(message['image_id'])
+            response_text = str(message.get('response_text') or '')
+            limit = int(message.get('limit', self.suggestion_limit))
+        except (KeyError, TypeError, ValueError) as e:
+            return {'error': f"Invalid message: {str(e)}"}
+
+        self._next_seq = max(self._next_seq, seq) + 1
+        reply = {'entry': entry, 'seq': seq, 'image_id': image_id}
+
+        if image_id < 1 or image_id > 10:
+            return {**reply, 'error': "Image ID must be between 1 and 10"}
+        if limit < 0 or limit > MAX_SUGGESTION_LIMIT:
+            return {**reply, 'error': f"Limit must be between 0 and {MAX_SUGGESTION_LIMIT}"}
+
+        self._latest[entry] = seq
+        if entry in self._pending:
+            self.superseded += 1
+            del self._pending[entry]
+
+        normalized = normalize_text(response_text)
+        if not normalized:
+            self._last.pop(entry, None)
+            return {**reply, 'match_found': False, 'location': None, 'fq': None, 'suggestions': []}
+
+        # Edits that don't change the normalized text (e.g. a trailing space) reuse the last result
+        key = (image_id, normalized, limit, self.analyzer.reference.version)
+        last = self._last.get(entry)
+        if last is not None and last[0] == key:
+            self.reused += 1
+            return {**last[1], 'seq': seq}
+
+        self._pending[entry] = {**reply, 'key': key, 'text': normalized, 'limit': limit}
+        self._wakeup.set()
+        return None
+
+    def _match(self, request: Dict) -> Dict:
+        """Match one queued request (runs on the match pool)."""
+        # Pin the reference version so the result and suggestions agree
+        reference = self.analyzer.reference
+        result = self.analyzer.analyze_response(request['text'], request['image_id'], reference)
+        suggestions = []
+        if request['limit']:
+            suggestions = self.analyzer.suggest(
+                request['text'],
+                request['image_id'],
+                limit=request['limit'],
+                reference=reference
+            )
+
+        return {
+            'entry': request['entry'],
+            'seq': request['seq'],
+            'image_id': request['image_id'],
+            'match_found': result is not None,
+            'location': result['location'] if result else None,
+            'fq': result['fq'] if result else None,
+            'suggestions': suggestions,
+            'reference_version': reference.version
+        }
+
+    def close(self) -> None:
+        """Drop the pending requests and let run() return once the match in progress finishes."""
+        self._closed = True
+        self._pending.clear()
+        self._wakeup.set()
+
+    async def run(self, send: Callable[[Dict], Awaitable[None]]) -> None:
+        """
+        Match queued requests one at a time and send their results, until closed.
+
+        Args:
+            send: Coroutine function that sends a reply to the client
+        """
+        while not self._closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._pending:
+                entry = next(iter(self._pending))
+                request = self._pending.pop(entry)
+                error = None
+                try:
+                    # Shielded so that cancelling the session never abandons a match that
+                    # already holds a pool slot; the slot is released when it finishes
+                    reply = await asyncio.shield(self.pool.run(self._match, request))
+                except MatchPoolFull as e:
+                    error = f"Server is busy analyzing responses, please retry: {str(e)}"
+                except Exception as e:
+                    error = f"Error analyzing response: {str(e)}"
+
+                if self._closed:
+                    return
+                if error is not None:
+                    await send({'entry': entry, 'seq': request['seq'], 'image_id': request['image_id'], 'error': error})
+                    continue
+
+                self.matched += 1
+                if self._latest.get(entry) != request['seq']:
+                    # A newer edit arrived while this one was being matched
+                    self.discarded += 1
+                    continue
+
+                self._last[entry] = (request['key'], reply)
+                await send(reply)
+
+    def get_stats(self) -> Dict:
+        """Get how many messages were received, matched, reused or dropped as superseded."""
+        return {
+            'received': self.received,
+            'matched': self.matched,
+            'reused': self.reused,
+            'superseded': self.superseded,
+            'discarded': self.discarded
+        }
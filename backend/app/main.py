@@ -1,27 +1,54 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, Path as PathParam, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, List
 from pathlib import Path
 import json
+import os
+import secrets
 from datetime import datetime
 import asyncio
 
-from .pdf_parser import ResponseAnalyzer
+from .pdf_parser import ResponseAnalyzer, MATCH_SCORE_CUTOFF
+from .match_pool import MatchPool, MatchPoolFull
+from .live_session import LiveMatchSession
+from .reference_store import ReferenceData
+from .reference_watcher import ReferenceWatcher
 from .db import (
     PatientModel, 
     PatientResponse, 
-    PatientBasicInfo, 
+    PatientPage,
+    PatientSummary,
     ResponseEntry,
+    ResponseEntryPatch,
     ImageResponse,
+    VersionConflict,
     insert_patient, 
     get_patient_by_id,
-    get_all_patients,
+    get_patient_version,
+    get_patient_summary,
+    get_patients_page,
+    iter_patients,
+    decode_patient_cursor,
+    DEFAULT_PATIENT_PAGE_SIZE,
+    MAX_PATIENT_PAGE_SIZE,
     update_patient_responses,
-    create_indexes
+    replace_response_card,
+    delete_response_card,
+    add_response_entry,
+    update_response_entry,
+    delete_response_entry,
+    get_cohort_analytics,
+    rebuild_cohort_rollups,
+    RebuildInProgress,
+    sync_patient_cache,
+    patient_cache,
+    close_client,
+    get_pool_stats
 )
-from .test_data import add_test_data
-from .startup import check_mongodb_connection
+from .warmup import DatabaseWarmup
+from .cohort import COHORT_DIMENSIONS, DEFAULT_COMMON_RESPONSES
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -40,6 +67,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets the frontend send a patient ETag back as If-Match
+    expose_headers=["ETag"],
 )
 
 # Initialize the response analyzer
@@ -47,6 +76,21 @@ data_dir = Path(__file__).parent.parent / 'data'
 data_dir.mkdir(exist_ok=True)
 analyzer = ResponseAnalyzer(data_dir=str(data_dir))
 
+# CPU-bound matching runs on this pool so it doesn't block the event loop
+match_pool = MatchPool()
+
+# Optional background reload of the reference data when its files change
+reference_watcher = ReferenceWatcher(analyzer)
+
+# Waits for the database, creates indexes and seeds test data without holding up startup
+warmup = DatabaseWarmup()
+
+# Totals of the /ws/analyze sessions, updated when a session closes
+live_stats = {'sessions': 0, 'active': 0, 'received': 0, 'matched': 0, 'reused': 0, 'superseded': 0, 'discarded': 0}
+
+# Token required by admin endpoints (admin endpoints are disabled if not set)
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
 # Define request and response models
 class AnalyzeRequest(BaseModel):
     response_text: str
@@ -57,55 +101,242 @@ class AnalyzeResponse(BaseModel):
     fq: Optional[str] = None
     match_found: bool
     message: Optional[str] = None
+    reference_version: Optional[str] = None
+
+class BatchAnalyzeRequest(BaseModel):
+    responses: List[AnalyzeRequest]
+
+class SuggestRequest(BaseModel):
+    response_text: str
+    image_id: int
+    limit: int = Field(default=5, ge=1, le=20)
+    min_score: int = Field(default=MATCH_SCORE_CUTOFF, ge=0, le=100)
+
+class Suggestion(BaseModel):
+    response_text: str
+    location: str
+    fq: str
+    score: float
+
+class SuggestResponse(BaseModel):
+    suggestions: List[Suggestion]
+    reference_version: Optional[str] = None
+
+class Completion(BaseModel):
+    response_text: str
+    location: str
+    fq: str
+
+class AutocompleteResponse(BaseModel):
+    completions: List[Completion]
+    reference_version: Optional[str] = None
 
 class TableInfo(BaseModel):
     image_id: int
     table_name: str
     num_rows: int
+    source_rows: int
+    collapsed_rows: int
+    shrink_percent: float
+
+def build_analyze_response(result: Optional[Dict[str, str]], reference_version: str) -> AnalyzeResponse:
+    """Convert an analyzer result into the API response model."""
+    if result:
+        return AnalyzeResponse(
+            location=result["location"],
+            fq=result["fq"],
+            match_found=True,
+            reference_version=reference_version
+        )
+    return AnalyzeResponse(
+        match_found=False,
+        message="No matching response found in reference data",
+        reference_version=reference_version
+    )
+
+def auto_fill_responses(image_responses: List[ImageResponse], reference: ReferenceData) -> None:
+    """
+    Auto-fill location and fq for every entry, analyzing each card in a single batch call.
+    """
+    for image_response in image_responses:
+        entries = [entry for entry in image_response.entries if entry.response_text]
+        if not entries:
+            continue
+        
+        results = analyzer.analyze_batch(
+            [entry.response_text for entry in entries],
+            image_response.image_number,
+            reference=reference
+        )
+        for entry, result in zip(entries, results):
+            if result:
+                entry.location = result["location"]
+                entry.fq = result["fq"]
+
+async def run_matching(func, *args, **kwargs):
+    """
+    Run a matching function on the match pool, turning a full queue into a 503.
+    """
+    try:
+        return await match_pool.run(func, *args, **kwargs)
+    except MatchPoolFull as e:
+        raise HTTPException(status_code=503, detail=f"Server is busy analyzing responses, please retry: {str(e)}")
+
+def require_database() -> None:
+    """
+    Dependency of the database endpoints: answer 503 until the database is reachable,
+    instead of letting requests wait out the driver's server selection timeout.
+    """
+    if not warmup.database_ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Database is not ready yet, please retry",
+            headers={"Retry-After": str(int(warmup.retry_interval) or 1)}
+        )
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """
+    Dependency of the admin endpoints: they reload or rebuild shared state, so they are
+    refused outright unless ADMIN_TOKEN is configured and sent in X-Admin-Token.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled: ADMIN_TOKEN is not set")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
 @app.on_event("startup")
 async def startup_db_client():
     """
-    Startup event to initialize database connection and indexes
+    Startup event to start the database warm-up (connection check, indexes, test data)
     """
     print("Starting application initialization...")
-    
-    # Check MongoDB connection first
-    connection_ok = await check_mongodb_connection()
-    if not connection_ok:
-        print("⚠️ Warning: MongoDB connection check failed, but continuing startup...")
-    
-    try:
-        # Create indexes
-        await create_indexes()
-        
-        # Add test data if database is empty
-        await add_test_data()
-        
-        print("✅ Application initialization complete!")
-    except Exception as e:
-        print(f"❌ Error during startup: {str(e)}")
-        print("⚠️ Application will continue to run but may have limited functionality")
+    await warmup.start()
+
+@app.on_event("startup")
+async def start_reference_watcher():
+    """
+    Startup event to start watching the reference data files (if enabled)
+    """
+    reference_watcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_match_pool():
+    """
+    Shutdown event to stop the database warm-up, the match pool workers, the reference watcher and the MongoDB client
+    """
+    await warmup.stop()
+    reference_watcher.stop()
+    match_pool.shutdown()
+    close_client()
 
 @app.get("/")
 async def root():
     """Root endpoint to check if the API is running."""
     return {"message": "Psychological Test Response Analyzer API is running"}
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness check: 200 once the database is usable, 503 until then.
+    
+    The matching endpoints work before that; only the patient endpoints need the database.
+    """
+    status = warmup.get_status()
+    status['reference_version'] = analyzer.reference.version
+    return JSONResponse(status_code=200 if status['ready'] else 503, content=status)
+
+@app.get("/db-stats")
+async def get_db_stats():
+    """
+    Get the MongoDB connection pool settings and metrics of the worker handling the request.
+    
+    Shows open and in-use connections, how long requests waited to check out a
+    connection and per-command latencies, to size the pool against real load,
+    and the patient cache counters.
+    """
+    stats = get_pool_stats()
+    stats['patient_cache'] = patient_cache.get_stats()
+    return stats
+
 @app.get("/tables-info", response_model=List[TableInfo])
 async def get_tables_info():
     """
     Get information about all tables extracted from the CSV.
+    
+    num_rows counts the rows left after normalization collapsed duplicates;
+    source_rows counts the rows read from the reference file.
     """
     tables_info = analyzer.get_tables_info()
     return tables_info
 
+@app.get("/match-stats")
+async def get_match_stats():
+    """
+    Get per-tier hit counts of the response matching cascade.
+    
+    Shows how many analyzed responses were resolved by the exact lookup,
+    the quick scorer, the full token-set scorer, or not matched at all.
+    """
+    stats = analyzer.get_match_stats()
+    stats['pool'] = match_pool.get_stats()
+    stats['live'] = dict(live_stats)
+    return stats
+
+@app.post("/admin/reload-reference", dependencies=[Depends(require_admin)])
+async def reload_reference():
+    """
+    Reload the reference data without restarting the server.
+    
+    The worker handling the request reloads right away and bumps the reload
+    generation, which the reference watchers of the other workers pick up within
+    one watch interval. The new tables and indexes are built in a background thread
+    and swapped in atomically; requests already in flight finish against the
+    previous version. The response reports the version the workers converge to;
+    GET /ready shows the version each worker is serving. The generation is only
+    bumped once the reload succeeded here, so a failing reload stays on this worker.
+    """
+    previous_version = analyzer.reference.version
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, analyzer.load_data)
+        generation = await loop.run_in_executor(None, reference_watcher.request_reload)
+        reference_watcher.mark_current()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reloading reference data: {str(e)}")
+    
+    return {
+        "success": True,
+        "previous_version": previous_version,
+        **analyzer.get_reference_info(),
+        "generation": generation,
+        "scope": "cluster" if reference_watcher.enabled else "worker",
+        "converges_within_seconds": reference_watcher.interval if reference_watcher.enabled else None
+    }
+
+@app.post("/admin/rebuild-cohort-rollups", dependencies=[Depends(require_admin), Depends(require_database)])
+async def rebuild_cohort():
+    """
+    Recompute the cohort analytics rollups from all patient records.
+    
+    The rollups are kept up to date by every write; rebuilding corrects them if an
+    update was lost. The new rollups are swapped in once complete. Answers 409 while
+    another worker is rebuilding them.
+    """
+    try:
+        result = await rebuild_cohort_rollups()
+    except RebuildInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error rebuilding cohort rollups: {str(e)}")
+    return {"success": True, **result}
+
 @app.post("/analyze-response", response_model=AnalyzeResponse)
 async def analyze_response(request: AnalyzeRequest):
     """
     Analyze a response text for a specific image and return location and form quality values.
     
-    Uses fuzzy matching to find the closest match in the reference data.
+    Tries an exact lookup first, then a quick fuzzy scorer, and falls back to
+    full token-set fuzzy matching to find the closest match in the reference data.
     """
     if not request.response_text or not request.response_text.strip():
         raise HTTPException(status_code=400, detail="Response text cannot be empty")
@@ -113,22 +344,145 @@ async def analyze_response(request: AnalyzeRequest):
     if request.image_id < 1 or request.image_id > 10:
         raise HTTPException(status_code=400, detail="Image ID must be between 1 and 10")
     
-    result = analyzer.analyze_response(request.response_text, request.image_id)
+    # Pin the reference version so a concurrent reload can't change it mid-request
+    reference = analyzer.reference
+    result = await run_matching(analyzer.analyze_response, request.response_text, request.image_id, reference)
+    return build_analyze_response(result, reference.version)
+
+@app.post("/analyze-responses", response_model=List[AnalyzeResponse])
+async def analyze_responses(request: BatchAnalyzeRequest):
+    """
+    Analyze several response texts in one call.
     
-    if result:
-        return AnalyzeResponse(
-            location=result["location"],
-            fq=result["fq"],
-            match_found=True
-        )
-    else:
-        return AnalyzeResponse(
-            match_found=False,
-            message="No matching response found in reference data"
-        )
+    Responses are grouped by image and each image is scored in a single batch pass.
+    Results are returned in the same order as the request.
+    """
+    grouped: Dict[int, List[int]] = {}
+    for index, item in enumerate(request.responses):
+        if not item.response_text or not item.response_text.strip():
+            raise HTTPException(status_code=400, detail=f"Response text cannot be empty (item {index})")
+        
+        if item.image_id < 1 or item.image_id > 10:
+            raise HTTPException(status_code=400, detail=f"Image ID must be between 1 and 10 (item {index})")
+        
+        grouped.setdefault(item.image_id, []).append(index)
+    
+    reference = analyzer.reference
+    
+    def analyze_grouped() -> List[Optional[AnalyzeResponse]]:
+        results: List[Optional[AnalyzeResponse]] = [None] * len(request.responses)
+        for image_id, indexes in grouped.items():
+            batch_results = analyzer.analyze_batch(
+                [request.responses[i].response_text for i in indexes],
+                image_id,
+                reference=reference
+            )
+            for i, result in zip(indexes, batch_results):
+                results[i] = build_analyze_response(result, reference.version)
+        return results
+    
+    return await run_matching(analyze_grouped)
+
+@app.websocket("/ws/analyze")
+async def analyze_live(websocket: WebSocket):
+    """
+    Live matching session for response text that is being typed.
+    
+    The client sends {"entry", "seq", "image_id", "response_text"} messages as the
+    text changes and gets back the best match and top suggestions for each entry.
+    Pending text of an entry is replaced by newer text, and results that are
+    already outdated when they finish are not sent.
+    """
+    await websocket.accept()
+    session = LiveMatchSession(analyzer, match_pool)
+    worker = asyncio.create_task(session.run(websocket.send_json))
+    live_stats['sessions'] += 1
+    live_stats['active'] += 1
+    
+    try:
+        while True:
+            reply = session.submit(await websocket.receive_text())
+            if reply is not None:
+                await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Let the worker finish the match it is running instead of cancelling it mid pool call
+        session.close()
+        try:
+            await worker
+        except Exception as e:
+            print(f"⚠️ Live session worker stopped with an error: {str(e)}")
+        live_stats['active'] -= 1
+        for key, value in session.get_stats().items():
+            live_stats[key] += value
+
+async def get_suggestions(request: SuggestRequest) -> SuggestResponse:
+    """Validate a suggestion request and run it against the analyzer."""
+    if not request.response_text or not request.response_text.strip():
+        raise HTTPException(status_code=400, detail="Response text cannot be empty")
+    
+    if request.image_id < 1 or request.image_id > 10:
+        raise HTTPException(status_code=400, detail="Image ID must be between 1 and 10")
+    
+    reference = analyzer.reference
+    suggestions = await run_matching(
+        analyzer.suggest,
+        request.response_text,
+        request.image_id,
+        limit=request.limit,
+        score_cutoff=request.min_score,
+        reference=reference
+    )
+    return SuggestResponse(suggestions=suggestions, reference_version=reference.version)
+
+@app.get("/suggest", response_model=SuggestResponse)
+async def suggest_get(
+    response_text: str,
+    image_id: int,
+    limit: int = Query(default=5, ge=1, le=20),
+    min_score: int = Query(default=MATCH_SCORE_CUTOFF, ge=0, le=100)
+):
+    """
+    Get the top-k reference responses for a text, with scores, location and fq.
+    """
+    return await get_suggestions(SuggestRequest(
+        response_text=response_text,
+        image_id=image_id,
+        limit=limit,
+        min_score=min_score
+    ))
+
+@app.post("/suggest", response_model=SuggestResponse)
+async def suggest_post(request: SuggestRequest):
+    """
+    Get the top-k reference responses for a text, with scores, location and fq.
+    
+    Candidates scoring below min_score are pruned while scoring.
+    """
+    return await get_suggestions(request)
+
+@app.get("/autocomplete", response_model=AutocompleteResponse)
+async def autocomplete(
+    image_id: int,
+    q: str,
+    limit: int = Query(default=10, ge=1, le=50)
+):
+    """
+    Complete a partially typed response from the reference data of an image.
+    
+    Completions come from a sorted prefix index rather than fuzzy scoring, so this
+    is cheap enough to call on every keystroke and runs directly on the event loop.
+    """
+    if image_id < 1 or image_id > 10:
+        raise HTTPException(status_code=400, detail="Image ID must be between 1 and 10")
+    
+    reference = analyzer.reference
+    completions = analyzer.autocomplete(q, image_id, limit=limit, reference=reference)
+    return AutocompleteResponse(completions=completions, reference_version=reference.version)
 
 # MongoDB Patient Endpoints
-@app.post("/submit-patient", response_model=dict)
+@app.post("/submit-patient", response_model=dict, dependencies=[Depends(require_database)])
 async def submit_patient(patient: PatientModel):
     """
     Submit a new patient record with all responses.
@@ -137,55 +491,213 @@ async def submit_patient(patient: PatientModel):
     and stores the complete record in MongoDB.
     """
     # Process all responses to auto-fill location and fq
-    for image_response in patient.responses:
-        for entry in image_response.entries:
-            if entry.response_text:
-                result = analyzer.analyze_response(entry.response_text, image_response.image_number)
-                if result:
-                    entry.location = result["location"]
-                    entry.fq = result["fq"]
+    reference = analyzer.reference
+    await run_matching(auto_fill_responses, patient.responses, reference)
     
     # Convert Pydantic model to dict for MongoDB
     patient_dict = patient.dict(by_alias=True)
+    # Let MongoDB generate the _id rather than storing null (every insert after the first would collide)
+    if patient_dict.get("_id") is None:
+        patient_dict.pop("_id", None)
+    # Granular updates check and bump the version
+    patient_dict["version"] = 1
     
     # Insert into MongoDB
     try:
         inserted_id = await insert_patient(patient_dict)
-        return {"success": True, "patient_id": patient.patient_id, "id": inserted_id}
+        return {
+            "success": True,
+            "patient_id": patient.patient_id,
+            "id": inserted_id,
+            "reference_version": reference.version
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error inserting patient: {str(e)}")
 
-@app.get("/patient/{patient_id}", response_model=PatientResponse)
-async def get_patient(patient_id: str):
+# Patient reads carry strong ETags: the patient version for the whole record, with the
+# projection appended for partial fetches, and the patient cache generation for the list.
+# A conditional request is checked against the patient version before the record is
+# fetched: the version comes from the patient cache, or else from a version-only read,
+# so a 304 never reads or sends the record itself. A patient ETag also works as the If-Match version of
+# the granular updates.
+PATIENT_CACHE_CONTROL = "private, no-cache"
+
+def patient_etag(version: int, images: Optional[List[int]] = None, header_only: bool = False) -> str:
+    if header_only:
+        return f'"{version};header"'
+    if images:
+        return f'"{version};images={",".join(str(image) for image in images)}"'
+    return f'"{version}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison, as RFC 9110 specifies for it)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": PATIENT_CACHE_CONTROL})
+
+@app.get("/patient/{patient_id}", response_model=PatientResponse, dependencies=[Depends(require_database)])
+async def get_patient(
+    patient_id: str,
+    response: Response,
+    images: Optional[str] = Query(None, description="Comma-separated cards whose responses to return, e.g. 1,3"),
+    fields: str = Query("all", pattern="^(all|header)$", description="'header' for the patient details without responses"),
+    if_none_match: Optional[str] = Header(default=None)
+):
     """
     Retrieve a patient record by patient ID.
     
     Returns the complete patient record including all responses and auto-filled fields.
+    With `images` only the responses to those cards are returned, and with
+    `fields=header` no responses at all; the projection is applied by MongoDB,
+    so the rest of the document is neither read nor sent.
+    
+    Records are served from the in-process patient cache when possible, with an ETag;
+    send it back in If-None-Match to get a 304 while the record is unchanged. The
+    ETag is checked against the patient version before the record is fetched.
     """
-    patient = await get_patient_by_id(patient_id)
+    image_numbers = None
+    if images:
+        try:
+            image_numbers = sorted({int(image) for image in images.split(",") if image.strip()})
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid images: {images}")
+        if any(image < 1 or image > 10 for image in image_numbers):
+            raise HTTPException(status_code=400, detail="Image numbers must be between 1 and 10")
+        if fields == "header":
+            raise HTTPException(status_code=400, detail="images can't be combined with fields=header")
+    
+    if if_none_match:
+        version = await get_patient_version(patient_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail=f"Patient with ID {patient_id} not found")
+        etag = patient_etag(version, image_numbers, fields == "header")
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+    
+    patient = await get_patient_by_id(patient_id, images=image_numbers, header_only=fields == "header")
     if not patient:
         raise HTTPException(status_code=404, detail=f"Patient with ID {patient_id} not found")
     
+    etag = patient_etag(patient.get("version", 0), image_numbers, fields == "header")
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = PATIENT_CACHE_CONTROL
+    
     # Convert MongoDB ObjectId to string
     patient["_id"] = str(patient["_id"])
     return patient
 
-@app.get("/patients", response_model=List[PatientBasicInfo])
-async def list_patients():
+@app.get("/patient/{patient_id}/summary", response_model=PatientSummary, dependencies=[Depends(require_database)])
+async def get_summary(patient_id: str):
     """
-    List all patients with basic information.
+    Get the structural summary of a patient's responses.
     
-    Returns a list of all patients with ID, name, age, and date.
+    Counts per card, by location (W/D/Dd), form quality, developmental quality,
+    determinant, content and special score. The summary is kept up to date by every
+    write, so only it is read; the responses are neither loaded nor aggregated.
     """
-    patients = await get_all_patients()
+    try:
+        summary = await get_patient_summary(patient_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting patient summary: {str(e)}")
+    if not summary:
+        raise HTTPException(status_code=404, detail=f"Patient with ID {patient_id} not found")
+    return summary
+
+def patient_ndjson_line(patient: dict) -> str:
+    """Serialize a listed patient as one NDJSON line, with the fields of PatientBasicInfo."""
+    patient["_id"] = str(patient["_id"])
+    return json.dumps(patient, default=lambda value: value.isoformat()) + "\n"
+
+@app.get("/patients", response_model=PatientPage, dependencies=[Depends(require_database)])
+async def list_patients(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PATIENT_PAGE_SIZE, description=f"Patients per page (default {DEFAULT_PATIENT_PAGE_SIZE})"),
+    after: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    stream: bool = Query(False, description="Stream the patients as NDJSON instead of returning one page"),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    List patients with basic information, newest first.
+    
+    Returns one page of at most `limit` patients and the `next_cursor` to pass as
+    `after` for the following page. With `stream=true` the patients are sent as
+    newline-delimited JSON while they are read from the database, all of them
+    unless `limit` is given.
+    
+    The ETag is the patient cache generation, which every write to a patient bumps;
+    with a matching If-None-Match the list isn't read at all and a 304 is returned.
+    """
+    try:
+        after_key = decode_patient_cursor(after) if after else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        etag = f'"g{await sync_patient_cache()}"'
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing patients: {str(e)}")
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    headers = {"ETag": etag, "Cache-Control": PATIENT_CACHE_CONTROL}
+    
+    if stream:
+        patients = iter_patients(after_key, limit or 0)
+        # Read the first patient before the response starts, so errors still get a status code
+        try:
+            first = await patients.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error listing patients: {str(e)}")
+        
+        async def lines():
+            if first is None:
+                return
+            yield patient_ndjson_line(first)
+            async for patient in patients:
+                yield patient_ndjson_line(patient)
+        
+        return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+    
+    try:
+        patients, next_cursor = await get_patients_page(limit or DEFAULT_PATIENT_PAGE_SIZE, after_key)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing patients: {str(e)}")
     
     # Convert MongoDB ObjectId to string
     for patient in patients:
         patient["_id"] = str(patient["_id"])
     
-    return patients
+    response.headers.update(headers)
+    return {"patients": patients, "next_cursor": next_cursor}
 
-@app.put("/patient/{patient_id}/responses", response_model=dict)
+@app.get("/cohort", dependencies=[Depends(require_database)])
+async def get_cohort(
+    by: str = Query("all", pattern=f"^({'|'.join(COHORT_DIMENSIONS)})$", description="Break the analytics down by gender or age_band"),
+    card: Optional[int] = Query(None, ge=1, le=10, description="Only include this card"),
+    top: int = Query(DEFAULT_COMMON_RESPONSES, ge=1, le=100, description="Most common responses listed per card")
+):
+    """
+    Get population-level analytics across all patients.
+    
+    For each group (all patients, or each gender or age band): the number of patients
+    and responses, and per card the location and fq distributions and the most common
+    responses. Read from the rollups that writes keep up to date, so the cost doesn't
+    grow with the number of patients.
+    """
+    try:
+        return await get_cohort_analytics(by, card, top)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting cohort analytics: {str(e)}")
+
+@app.put("/patient/{patient_id}/responses", response_model=dict, dependencies=[Depends(require_database)])
 async def update_responses(patient_id: str, responses: List[ImageResponse]):
     """
     Update a patient's responses.
@@ -193,13 +705,8 @@ async def update_responses(patient_id: str, responses: List[ImageResponse]):
     This endpoint allows updating just the responses for a patient.
     """
     # Process all responses to auto-fill location and fq
-    for image_response in responses:
-        for entry in image_response.entries:
-            if entry.response_text:
-                result = analyzer.analyze_response(entry.response_text, image_response.image_number)
-                if result:
-                    entry.location = result["location"]
-                    entry.fq = result["fq"]
+    reference = analyzer.reference
+    await run_matching(auto_fill_responses, responses, reference)
     
     # Convert Pydantic models to dict for MongoDB
     responses_dict = []
@@ -211,7 +718,178 @@ async def update_responses(patient_id: str, responses: List[ImageResponse]):
     if not success:
         raise HTTPException(status_code=404, detail=f"Patient with ID {patient_id} not found or responses not updated")
     
-    return {"success": True, "message": f"Responses updated for patient {patient_id}"}
+    return {
+        "success": True,
+        "message": f"Responses updated for patient {patient_id}",
+        "reference_version": reference.version
+    }
+
+# Granular response updates: each changes one card or entry, and only that part is
+# re-analyzed. The client sends the record version it edited in If-Match; a stale
+# version gets a 409 with the current one, so concurrent edits don't overwrite each other.
+
+def expected_version(if_match: Optional[str]) -> int:
+    """Parse the patient version from an If-Match header (the version or a patient ETag)."""
+    if if_match is None:
+        raise HTTPException(status_code=428, detail="If-Match header with the patient version is required")
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        # A patient ETag of a partial fetch has the projection after the version
+        return int(value.strip('"').split(";")[0])
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid If-Match version: {if_match}")
+
+async def apply_granular_update(update, *args, not_found: str) -> int:
+    """Run a versioned update, turning version conflicts into 409s and missing targets into 404s."""
+    try:
+        version = await update(*args)
+    except HTTPException:
+        raise
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "current_version": e.current_version})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error updating responses: {str(e)}")
+    
+    if version is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    return version
+
+def analyze_entry_fields(fields: Dict, image_number: int, reference: ReferenceData) -> None:
+    """Auto-fill location and fq of a patched entry whose response text changed."""
+    result = analyzer.analyze_response(fields["response_text"], image_number, reference)
+    if result:
+        fields["location"] = result["location"]
+        fields["fq"] = result["fq"]
+
+@app.put("/patient/{patient_id}/responses/{image_number}", response_model=dict, dependencies=[Depends(require_database)])
+async def replace_card(
+    patient_id: str,
+    entries: List[ResponseEntry],
+    image_number: int = PathParam(..., ge=1, le=10),
+    if_match: Optional[str] = Header(default=None)
+):
+    """
+    Replace the entries of one card (adding the card if it has no responses yet).
+    
+    Only this card's entries are analyzed and written.
+    """
+    version = expected_version(if_match)
+    reference = analyzer.reference
+    card = ImageResponse(image_number=image_number, entries=entries)
+    await run_matching(auto_fill_responses, [card], reference)
+    
+    entries_dict = json.loads(card.json())["entries"]
+    new_version = await apply_granular_update(
+        replace_response_card, patient_id, image_number, entries_dict, version,
+        not_found=f"Patient with ID {patient_id} not found"
+    )
+    return {
+        "success": True,
+        "image_number": image_number,
+        "entries": entries_dict,
+        "version": new_version,
+        "reference_version": reference.version
+    }
+
+@app.delete("/patient/{patient_id}/responses/{image_number}", response_model=dict, dependencies=[Depends(require_database)])
+async def delete_card(
+    patient_id: str,
+    image_number: int = PathParam(..., ge=1, le=10),
+    if_match: Optional[str] = Header(default=None)
+):
+    """
+    Remove one card and all its entries.
+    """
+    new_version = await apply_granular_update(
+        delete_response_card, patient_id, image_number, expected_version(if_match),
+        not_found=f"Patient with ID {patient_id} or card {image_number} not found"
+    )
+    return {"success": True, "image_number": image_number, "version": new_version}
+
+@app.post("/patient/{patient_id}/responses/{image_number}/entries", response_model=dict, dependencies=[Depends(require_database)])
+async def add_entry(
+    patient_id: str,
+    entry: ResponseEntry,
+    image_number: int = PathParam(..., ge=1, le=10),
+    if_match: Optional[str] = Header(default=None)
+):
+    """
+    Append an entry to a card, analyzing only the new entry.
+    """
+    version = expected_version(if_match)
+    reference = analyzer.reference
+    card = ImageResponse(image_number=image_number, entries=[entry])
+    await run_matching(auto_fill_responses, [card], reference)
+    
+    entry_dict = json.loads(card.entries[0].json())
+    new_version = await apply_granular_update(
+        add_response_entry, patient_id, image_number, entry_dict, version,
+        not_found=f"Patient with ID {patient_id} not found"
+    )
+    return {
+        "success": True,
+        "image_number": image_number,
+        "entry": entry_dict,
+        "version": new_version,
+        "reference_version": reference.version
+    }
+
+@app.patch("/patient/{patient_id}/responses/{image_number}/entries/{entry_index}", response_model=dict, dependencies=[Depends(require_database)])
+async def update_entry(
+    patient_id: str,
+    changes: ResponseEntryPatch,
+    image_number: int = PathParam(..., ge=1, le=10),
+    entry_index: int = PathParam(..., ge=0),
+    if_match: Optional[str] = Header(default=None)
+):
+    """
+    Change some fields of one entry (entries are numbered from 0 within their card).
+    
+    Only the given fields are written. The entry is re-analyzed only if its response
+    text differs from the stored one, so resending the same text keeps hand-corrected
+    location and fq values.
+    """
+    version = expected_version(if_match)
+    fields = changes.model_dump(exclude_none=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    
+    reference = analyzer.reference
+    
+    async def analyze_changed_text(stored_entry: Dict, fields: Dict) -> None:
+        if fields.get("response_text") and fields["response_text"] != stored_entry.get("response_text"):
+            await run_matching(analyze_entry_fields, fields, image_number, reference)
+    
+    new_version = await apply_granular_update(
+        update_response_entry, patient_id, image_number, entry_index, fields, version, analyze_changed_text,
+        not_found=f"Patient with ID {patient_id}, card {image_number} or entry {entry_index} not found"
+    )
+    return {
+        "success": True,
+        "image_number": image_number,
+        "entry_index": entry_index,
+        "changes": fields,
+        "version": new_version,
+        "reference_version": reference.version
+    }
+
+@app.delete("/patient/{patient_id}/responses/{image_number}/entries/{entry_index}", response_model=dict, dependencies=[Depends(require_database)])
+async def delete_entry(
+    patient_id: str,
+    image_number: int = PathParam(..., ge=1, le=10),
+    entry_index: int = PathParam(..., ge=0),
+    if_match: Optional[str] = Header(default=None)
+):
+    """
+    Remove one entry of a card; the entries after it move up by one.
+    """
+    new_version = await apply_granular_update(
+        delete_response_entry, patient_id, image_number, entry_index, expected_version(if_match),
+        not_found=f"Patient with ID {patient_id}, card {image_number} or entry {entry_index} not found"
+    )
+    return {"success": True, "image_number": image_number, "entry_index": entry_index, "version": new_version}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,283 @@
+"""
+Offline extraction of the reference tables in data/Manual-pages.pdf.
+
+The manual is parsed page by page into per-card reference rows (image_id,
+response_text, location, fq) and written to a compiled CSV artifact named after
+the PDF's content hash. Server startup loads the artifact and only re-extracts
+when the PDF changes.
+
+Run with: python -m app.manual_extractor [--force]
+or, to check the parsing rules on extracted text (e.g. data/fixtures/manual-page.txt):
+python -m app.manual_extractor --parse-text FILE
+"""
+
+import argparse
+import csv
+import hashlib
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+MANUAL_PDF_NAME = 'Manual-pages.pdf'
+COMPILED_DIR_NAME = 'compiled'
+ARTIFACT_FIELDS = ['image_id', 'response_text', 'location', 'fq']
+
+# Bump when the parsing rules change so existing artifacts get re-extracted
+EXTRACTOR_VERSION = 1
+
+# The manual's tables are laid out in side-by-side columns
+MANUAL_COLUMNS = int(os.environ.get("MANUAL_COLUMNS", 3))
+
+# Resolution used when a page has no text layer and has to be OCR'd
+OCR_RESOLUTION = 300
+
+ROMAN_NUMERALS = {
+    'I': 1, 'II': 2, 'III': 3, 'IV': 4, 'V': 5,
+    'VI': 6, 'VII': 7, 'VIII': 8, 'IX': 9, 'X': 10
+}
+
+CARD_PATTERN = re.compile(r"^CARD\s*([IVX]+)?\b", re.IGNORECASE)
+ROMAN_PATTERN = re.compile(r"^([IVX]+)$")
+LOCATION_PATTERN = re.compile(r"^(WS?|DS?\d{1,2}|DdS?\d{1,3})$")
+ENTRY_PATTERN = re.compile(r"^([ou+\-–—])\s+(.+)$")
+
+def file_content_hash(path: Path) -> str:
+    """Get the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def artifact_path(data_dir: Path, content_hash: str) -> Path:
+    """Get the compiled artifact path for a manual with the given content hash."""
+    return Path(data_dir) / COMPILED_DIR_NAME / f"manual-{content_hash[:16]}-v{EXTRACTOR_VERSION}.csv"
+
+def empty_marker_path(data_dir: Path, content_hash: str) -> Path:
+    """
+    Get the marker recording that a manual yielded no rows.
+
+    Keyed on whether OCR is available too, since installing it can turn a scanned
+    manual that yielded nothing into one with rows.
+    """
+    ocr = 'ocr' if ocr_available() else 'no-ocr'
+    return Path(data_dir) / COMPILED_DIR_NAME / f"manual-{content_hash[:16]}-v{EXTRACTOR_VERSION}-{ocr}.empty"
+
+def ocr_available() -> bool:
+    """Check whether pytesseract and the Tesseract binary are installed."""
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def extract_page_lines(page) -> List[str]:
+    """
+    Get the text lines of a pdfplumber page, column by column.
+
+    Falls back to OCR (pytesseract) when the page has no text layer and OCR is installed.
+    """
+    lines = []
+    column_width = page.width / MANUAL_COLUMNS
+    for column in range(MANUAL_COLUMNS):
+        crop = page.crop((column * column_width, 0, (column + 1) * column_width, page.height))
+        text = crop.extract_text() or ''
+
+        if not text.strip():
+            text = ocr_page_region(crop)
+
+        lines.extend(line.strip() for line in text.splitlines() if line.strip())
+    return lines
+
+def ocr_page_region(page) -> str:
+    """OCR a (cropped) pdfplumber page, or return an empty string if OCR isn't available."""
+    try:
+        import pytesseract
+    except ImportError:
+        return ''
+
+    try:
+        image = page.to_image(resolution=OCR_RESOLUTION).original
+        return pytesseract.image_to_string(image)
+    except Exception as e:
+        print(f"OCR failed on page {page.page_number}: {str(e)}")
+        return ''
+
+class ManualTableParser:
+    """Turns the manual's text lines into reference rows, keeping card/location state across pages."""
+
+    def __init__(self):
+        self.image_id: Optional[int] = None
+        self.location: Optional[str] = None
+        self.expecting_card_number = False
+        self.rows: List[Dict[str, str]] = []
+
+    def feed(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.feed_line(line)
+
+    def feed_line(self, line: str) -> None:
+        # "CARD" and its numeral can be printed on separate lines
+        if self.expecting_card_number:
+            self.expecting_card_number = False
+            match = ROMAN_PATTERN.match(line)
+            if match and match.group(1) in ROMAN_NUMERALS:
+                self._start_card(ROMAN_NUMERALS[match.group(1)])
+                return
+
+        match = CARD_PATTERN.match(line)
+        if match:
+            numeral = match.group(1)
+            if numeral and numeral.upper() in ROMAN_NUMERALS:
+                self._start_card(ROMAN_NUMERALS[numeral.upper()])
+            else:
+                self.expecting_card_number = True
+            return
+
+        if self.image_id is None:
+            return
+
+        if LOCATION_PATTERN.match(line):
+            self.location = line
+            return
+
+        if self.location is None:
+            return
+
+        match = ENTRY_PATTERN.match(line)
+        if match:
+            fq = match.group(1).replace('–', '-').replace('—', '-')
+            self.rows.append({
+                'image_id': str(self.image_id),
+                'response_text': match.group(2).strip().lower(),
+                'location': self.location,
+                'fq': fq
+            })
+        elif self.rows and (line[0].islower() or line[0] == '('):
+            # Wrapped continuation of the previous entry
+            self.rows[-1]['response_text'] += ' ' + line.lower()
+
+    def _start_card(self, image_id: int) -> None:
+        self.image_id = image_id
+        self.location = None
+
+def extract_manual(pdf_path: Path) -> List[Dict[str, str]]:
+    """Parse the manual page by page into reference rows."""
+    import pdfplumber
+
+    parser = ManualTableParser()
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            lines = extract_page_lines(page)
+            parser.feed(lines)
+            print(f"Extracted page {page.page_number}: {len(lines)} lines, {len(parser.rows)} rows so far")
+    return parser.rows
+
+def write_artifact(rows: List[Dict[str, str]], path: Path) -> None:
+    """Write reference rows to a compiled artifact, replacing it atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique temp name so concurrent workers extracting the same manual don't collide
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=ARTIFACT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+def read_artifact(path: Path) -> List[Dict[str, str]]:
+    """Read the reference rows of a compiled artifact."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def artifact_has_rows(path: Path) -> bool:
+    """Check whether a compiled artifact holds any rows, without reading all of it."""
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return next(reader, None) is not None
+
+def remove_stale_outputs(current: Path) -> None:
+    """Remove the artifacts and empty markers of other manual versions than the current one."""
+    # Workers extracting together race to remove the same files
+    try:
+        for stale in [*current.parent.glob('manual-*.csv'), *current.parent.glob('manual-*.empty')]:
+            if stale != current:
+                stale.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"⚠️ Could not remove stale manual artifacts: {str(e)}")
+
+def compile_manual(data_dir: Path, force: bool = False) -> Optional[Path]:
+    """
+    Make sure a compiled artifact exists for the current manual PDF.
+
+    The PDF is only parsed when no artifact with rows matches its content hash (or
+    when forced). Extraction that yields no rows (e.g. a scanned manual without OCR
+    installed) writes an empty marker instead of an artifact, so later loads skip
+    the PDF until it, the extractor version or OCR availability changes. Artifacts
+    of earlier PDF versions are removed.
+
+    Args:
+        data_dir: Directory containing the manual PDF
+        force: Re-extract even if an artifact for the current PDF exists
+
+    Returns:
+        Path of the artifact, or None if there is no manual or it yielded no rows
+    """
+    pdf_path = Path(data_dir) / MANUAL_PDF_NAME
+    if not pdf_path.exists():
+        return None
+
+    content_hash = file_content_hash(pdf_path)
+    path = artifact_path(data_dir, content_hash)
+    empty_marker = empty_marker_path(data_dir, content_hash)
+    if not force:
+        if path.exists():
+            if artifact_has_rows(path):
+                return path
+            print(f"Compiled artifact {path.name} has no rows, extracting again")
+        elif empty_marker.exists():
+            return None
+
+    print(f"Extracting reference tables from {pdf_path.name}...")
+    try:
+        rows = extract_manual(pdf_path)
+    except ImportError:
+        print("⚠️ pdfplumber is not installed, cannot extract the manual")
+        return None
+    except Exception as e:
+        print(f"❌ Error extracting the manual: {str(e)}")
+        return None
+
+    if not rows:
+        print(f"⚠️ No reference rows found in {pdf_path.name} (scanned pages need pytesseract for OCR)")
+        path.unlink(missing_ok=True)
+        empty_marker.parent.mkdir(parents=True, exist_ok=True)
+        empty_marker.touch()
+        remove_stale_outputs(empty_marker)
+        return None
+
+    write_artifact(rows, path)
+    remove_stale_outputs(path)
+
+    print(f"✅ Wrote {len(rows)} reference rows to {path}")
+    return path
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compile the manual's reference tables")
+    arg_parser.add_argument("--data-dir", default=str(Path(__file__).parent.parent / 'data'))
+    arg_parser.add_argument("--force", action="store_true", help="Re-extract even if the artifact is up to date")
+    arg_parser.add_argument("--parse-text", metavar="FILE", help="Parse a text file of manual lines and print the rows instead")
+    args = arg_parser.parse_args()
+
+    if args.parse_text:
+        text_parser = ManualTableParser()
+        with open(args.parse_text, 'r', encoding='utf-8') as f:
+            text_parser.feed(line.strip() for line in f if line.strip())
+        writer = csv.DictWriter(sys.stdout, fieldnames=ARTIFACT_FIELDS)
+        writer.writeheader()
+        writer.writerows(text_parser.rows)
+    else:
+        compile_manual(Path(args.data_dir), force=args.force)
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# Response matching is CPU-bound and synchronous, so running it inside an async handler
+# blocks the event loop for every other request. The pool runs it on dedicated worker
+# threads instead and bounds how much work may wait for a free worker.
+
+MATCH_POOL_WORKERS = int(os.environ.get("MATCH_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+MATCH_POOL_QUEUE = int(os.environ.get("MATCH_POOL_QUEUE", 100))
+
+class MatchPoolFull(Exception):
+    """Raised when the match pool's wait queue is full."""
+    pass
+
+class MatchPool:
+    """Bounded thread pool that async handlers await for CPU-bound matching work."""
+
+    def __init__(self, max_workers: int = MATCH_POOL_WORKERS, max_queue: int = MATCH_POOL_QUEUE):
+        """
+        Args:
+            max_workers: Number of worker threads
+            max_queue: Maximum number of tasks waiting for a free worker
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="match-worker")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a function on the pool and await its result.
+
+        Raises:
+            MatchPoolFull: If max_queue tasks are already waiting for a worker
+        """
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise MatchPoolFull(f"Match queue is full ({self.max_queue} tasks waiting)")
+            self.queued += 1
+
+        submitted_at = time.perf_counter()
+
+        def task():
+            started_at = time.perf_counter()
+            wait = started_at - submitted_at
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.total_run += time.perf_counter() - started_at
+
+        def release_if_cancelled(future):
+            # A caller cancelled while its task was still queued cancels the future
+            # before task() starts, so the queue slot has to be released here
+            if future.cancelled():
+                with self._lock:
+                    self.queued -= 1
+
+        future = self._executor.submit(task)
+        future.add_done_callback(release_if_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        """Stop the worker threads once the pending tasks have finished."""
+        self._executor.shutdown(wait=True)
+
+    def get_stats(self) -> Dict:
+        """Get the pool size, queue depth and wait/run time metrics in milliseconds."""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queue_depth': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'avg_wait_ms': self.total_wait * 1000 / self.completed if self.completed else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+                'avg_run_ms': self.total_run * 1000 / self.completed if self.completed else 0.0
+            }
@@ -0,0 +1,33 @@
+import re
+from typing import FrozenSet
+
+# Reference rows are normalized once when they are loaded, and incoming responses go
+# through the same function before matching. Rows that only differ in case,
+# punctuation, articles or filler words ("A butterfly." / "butterfly") then have the
+# same text, so duplicates can be collapsed instead of being rescored on every request.
+
+# Bump when the normalization rules change so compiled snapshots get rebuilt
+NORMALIZATION_VERSION = 1
+
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Articles and filler words that don't help tell reference responses apart
+STOPWORDS: FrozenSet[str] = frozenset({
+    'a', 'an', 'the',
+    'it', 'its', 'this', 'that', 'is', 'are', 'of', 'some',
+    'looks', 'like'
+})
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a response text for matching.
+
+    Lowercases, drops apostrophes, turns other punctuation into spaces, removes
+    stopwords and folds whitespace. A text made only of stopwords keeps them,
+    so it doesn't normalize to an empty string.
+    """
+    folded = PUNCTUATION_PATTERN.sub(' ', text.lower().replace("'", ''))
+    folded = WHITESPACE_PATTERN.sub(' ', folded).strip()
+    words = [word for word in folded.split(' ') if word not in STOPWORDS]
+    return ' '.join(words) if words else folded
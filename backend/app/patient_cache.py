@@ -0,0 +1,110 @@
+import os
+import time
+from typing import Any, Dict, Hashable, List, Optional
+
+from .match_cache import MISSING, MatchCache
+
+# In-process read-through cache of patient documents. Writes made by this worker drop the
+# patient's entries right away. Writes made by other workers are found through a
+# generation counter in the database that every write increments, together with a short
+# log of the patients it changed: at most every PATIENT_CACHE_CHECK_INTERVAL seconds a
+# worker reads the counter and drops the entries of the patients changed since it last
+# looked, or everything if it fell further behind than the log goes back. Another worker's
+# write can so be served stale for up to that interval.
+
+PATIENT_CACHE_SIZE = int(os.environ.get("PATIENT_CACHE_SIZE", 1000))
+# Seconds between reads of the generation counter; 0 reads it on every lookup
+PATIENT_CACHE_CHECK_INTERVAL = float(os.environ.get("PATIENT_CACHE_CHECK_INTERVAL", 1))
+# Changed patient IDs kept in the generation document
+GENERATION_LOG_SIZE = 100
+
+class PatientCache:
+    """Bounded LRU cache of patient documents, kept in sync with the database generation counter."""
+
+    def __init__(self, maxsize: int = PATIENT_CACHE_SIZE, check_interval: float = PATIENT_CACHE_CHECK_INTERVAL):
+        """
+        Args:
+            maxsize: Maximum number of cached patients; 0 disables caching
+            check_interval: Seconds between reads of the generation counter
+        """
+        self.check_interval = check_interval
+        # Patient ID -> {variant: document}, variants being the partial fetches of a patient
+        self._patients = MatchCache(maxsize=maxsize)
+        # Database generation the cache is in sync with, None before the first check
+        self.generation: Optional[int] = None
+        # Bumped by every invalidation, so a read that started before one isn't cached
+        self.epoch = 0
+        self._checked_at: Optional[float] = None
+        self.invalidations = 0
+        self.clears = 0
+
+    def get(self, patient_id: str, variant: Hashable) -> Any:
+        """Get a cached document, or MISSING."""
+        variants = self._patients.get(patient_id)
+        if variants is MISSING:
+            return MISSING
+        return variants.get(variant, MISSING)
+
+    def get_version(self, patient_id: str) -> Optional[int]:
+        """Get the version of a patient from any of its cached documents, or None."""
+        variants = self._patients.get(patient_id)
+        if variants is MISSING:
+            return None
+        for document in variants.values():
+            if "version" in document:
+                return document["version"]
+        return None
+
+    def put(self, patient_id: str, variant: Hashable, document: Dict, epoch: int) -> None:
+        """Cache a document read from the database, unless the cache was invalidated since the read started."""
+        if epoch != self.epoch:
+            return
+        variants = self._patients.get(patient_id)
+        if variants is MISSING:
+            variants = {}
+        self._patients.put(patient_id, {**variants, variant: document})
+
+    def invalidate(self, patient_id: str) -> None:
+        self.epoch += 1
+        self.invalidations += 1
+        self._patients.pop(patient_id)
+
+    def clear(self) -> None:
+        self.epoch += 1
+        self.clears += 1
+        self._patients.clear()
+
+    def check_due(self) -> bool:
+        """Check whether the generation counter should be read again."""
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval
+
+    def sync(self, generation: int, changes: List[str]) -> None:
+        """
+        Catch up with the database generation counter.
+
+        Args:
+            generation: The current generation
+            changes: IDs of the patients changed by the latest generations, oldest first
+        """
+        self._checked_at = time.monotonic()
+        if self.generation is not None and generation <= self.generation:
+            # Nothing new, or a read that finished after a newer one
+            return
+
+        behind = generation - self.generation if self.generation is not None else None
+        if behind is not None and behind <= len(changes):
+            for patient_id in set(changes[-behind:]):
+                self.invalidate(patient_id)
+        else:
+            self.clear()
+        self.generation = generation
+
+    def get_stats(self) -> Dict:
+        """Get the cache counters and the generation it is in sync with."""
+        return {
+            **self._patients.get_stats(),
+            'generation': self.generation,
+            'check_interval': self.check_interval,
+            'invalidations': self.invalidations,
+            'clears': self.clears
+        }
@@ -1,86 +1,721 @@
 import csv
 import os
+import threading
+import time
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
 from rapidfuzz import process, fuzz
 
-# For a real application, you would use pdfplumber or PyMuPDF to extract tables from PDF
-# Here we'll use the CSV file as a mock for PDF data
+from .manual_extractor import COMPILED_DIR_NAME, MANUAL_PDF_NAME, compile_manual, file_content_hash
+from .match_cache import MISSING, MatchCache
+from .match_pool import MATCH_POOL_WORKERS
+from .normalization import normalize_text
+from .reference_snapshot import open_snapshot, snapshot_path, write_snapshot
+from .reference_store import ReferenceData, ReferenceTable, ReferenceTableBuilder
+
+# Reference rows come from the compiled artifact of data/Manual-pages.pdf (see
+# manual_extractor.py). The sample CSV is used when the manual yields no rows.
+#   auto   - manual artifact if it has rows, otherwise sample_table.csv
+#   manual - manual artifact only
+#   sample - sample_table.csv only
+REFERENCE_SOURCES = ('auto', 'manual', 'sample')
+REFERENCE_SOURCE = os.environ.get("REFERENCE_SOURCE", "auto")
+
+# Serve the tables from a memory-mapped snapshot (see reference_snapshot.py) so worker
+# processes share one read-only copy instead of each building their own
+USE_REFERENCE_SNAPSHOT = os.environ.get("USE_REFERENCE_SNAPSHOT", "true").lower() in ("1", "true", "yes")
+
+# Minimum fuzzy score for a reference response to count as a match
+MATCH_SCORE_CUTOFF = 70
+
+# Matching cascade tiers, tried in order until one produces a match:
+#   exact - hash lookup of the normalized text
+#   quick - plain fuzz.ratio, accepted only above QUICK_SCORE_CUTOFF
+#   full  - fuzz.token_set_ratio, accepted above MATCH_SCORE_CUTOFF
+MATCH_TIERS = ('exact', 'quick', 'full')
+DEFAULT_MATCH_TIERS = os.environ.get("MATCH_TIERS", ",".join(MATCH_TIERS))
+QUICK_SCORE_CUTOFF = int(os.environ.get("QUICK_SCORE_CUTOFF", 90))
+
+# Candidate blocking with the inverted token / n-gram index. Small tables are cheaper
+# to scan exhaustively, so the index is only used from CANDIDATE_INDEX_MIN_ROWS rows.
+USE_CANDIDATE_INDEX = os.environ.get("USE_CANDIDATE_INDEX", "true").lower() in ("1", "true", "yes")
+CANDIDATE_INDEX_MIN_ROWS = int(os.environ.get("CANDIDATE_INDEX_MIN_ROWS", 500))
+CANDIDATE_INDEX_LIMIT = int(os.environ.get("CANDIDATE_INDEX_LIMIT", 200))
+
+# Matching engine:
+#   fuzzy - the rapidfuzz cascade above
+#   tfidf - exact lookup (if enabled in MATCH_TIERS), then hashed character n-gram TF-IDF
+#           cosine similarity computed with sparse matrix products (see tfidf_engine.py).
+#           The TFIDF_RERANK most similar rows are rescored with token_set_ratio and the
+#           best one above MATCH_SCORE_CUTOFF wins; with TFIDF_RERANK=0 the most similar
+#           row wins if its similarity reaches TFIDF_MIN_SIMILARITY.
+MATCH_ENGINES = ('fuzzy', 'tfidf')
+MATCH_ENGINE = os.environ.get("MATCH_ENGINE", "fuzzy")
+TFIDF_RERANK = int(os.environ.get("TFIDF_RERANK", 5))
+TFIDF_MIN_SIMILARITY = float(os.environ.get("TFIDF_MIN_SIMILARITY", 0.5))
+
+# LRU cache of analysis results; a size of 0 disables it, a TTL of 0 keeps entries until evicted
+MATCH_CACHE_SIZE = int(os.environ.get("MATCH_CACHE_SIZE", 10000))
+MATCH_CACHE_TTL = float(os.environ.get("MATCH_CACHE_TTL", 0))
+
+# Threads each batch scoring call (process.cdist) may use. Matching already runs on
+# MATCH_POOL_WORKERS pool threads, so the cores are split between them instead of
+# every call spawning one thread per core. run.py sets it per process in production,
+# where WEB_CONCURRENCY processes share the cores
+CDIST_WORKERS = int(os.environ.get("CDIST_WORKERS", max(1, (os.cpu_count() or 1) // max(1, MATCH_POOL_WORKERS))))
 
 class ResponseAnalyzer:
-    def __init__(self, data_dir: str = None):
-        """Initialize the response analyzer with data directory path."""
+    def __init__(
+        self,
+        data_dir: str = None,
+        match_tiers: Optional[Sequence[str]] = None,
+        quick_score_cutoff: int = QUICK_SCORE_CUTOFF,
+        use_candidate_index: bool = USE_CANDIDATE_INDEX,
+        candidate_index_min_rows: int = CANDIDATE_INDEX_MIN_ROWS,
+        candidate_index_limit: int = CANDIDATE_INDEX_LIMIT,
+        cache_size: int = MATCH_CACHE_SIZE,
+        cache_ttl: float = MATCH_CACHE_TTL,
+        reference_source: str = REFERENCE_SOURCE,
+        use_snapshot: bool = USE_REFERENCE_SNAPSHOT,
+        match_engine: str = MATCH_ENGINE,
+        tfidf_rerank: int = TFIDF_RERANK,
+        tfidf_min_similarity: float = TFIDF_MIN_SIMILARITY
+    ):
+        """
+        Initialize the response analyzer with data directory path.
+        
+        Args:
+            data_dir: Directory containing the reference data
+            match_tiers: Cascade tiers to use, in order (defaults to the MATCH_TIERS env var or all tiers)
+            quick_score_cutoff: Minimum fuzz.ratio score for the quick tier to accept a match
+            use_candidate_index: Shortlist fuzzy candidates with the inverted index instead of scanning every row
+            candidate_index_min_rows: Minimum table size for the candidate index to be used
+            candidate_index_limit: Maximum number of shortlisted candidates per query
+            cache_size: Maximum number of cached analysis results (0 disables the cache)
+            cache_ttl: Seconds a cached result stays valid (0 keeps it until evicted or reloaded)
+            reference_source: Where reference rows are loaded from ("auto", "manual" or "sample")
+            use_snapshot: Open the tables from a memory-mapped snapshot, building it if needed
+            match_engine: "fuzzy" for the rapidfuzz cascade or "tfidf" for sparse TF-IDF matching
+            tfidf_rerank: Number of most similar rows the tfidf engine rescores with token_set_ratio (0 disables)
+            tfidf_min_similarity: Minimum cosine similarity for a tfidf match when re-ranking is disabled
+        """
         if data_dir is None:
             # Use default relative path if not provided
             current_dir = Path(__file__).parent.parent
             data_dir = current_dir / 'data'
         
+        if match_tiers is None:
+            match_tiers = [tier.strip() for tier in DEFAULT_MATCH_TIERS.split(",") if tier.strip()]
+        
+        unknown_tiers = [tier for tier in match_tiers if tier not in MATCH_TIERS]
+        if unknown_tiers:
+            raise ValueError(f"Unknown match tiers: {unknown_tiers}. Valid tiers: {list(MATCH_TIERS)}")
+        
+        if match_engine not in MATCH_ENGINES:
+            raise ValueError(f"Unknown match engine: {match_engine}. Valid engines: {list(MATCH_ENGINES)}")
+        
+        if match_engine == 'tfidf':
+            # The TF-IDF tier replaces the fuzzy tiers; the exact lookup stays in front of it
+            match_tiers = [tier for tier in match_tiers if tier == 'exact'] + ['tfidf']
+        
+        if reference_source not in REFERENCE_SOURCES:
+            raise ValueError(f"Unknown reference source: {reference_source}. Valid sources: {list(REFERENCE_SOURCES)}")
+        
         self.data_dir = Path(data_dir)
-        self.response_data: Dict[int, List[Dict[str, str]]] = {}
+        self.reference_source = reference_source
+        self.use_snapshot = use_snapshot
+        self.match_tiers: Tuple[str, ...] = tuple(match_tiers)
+        self.quick_score_cutoff = quick_score_cutoff
+        self.use_candidate_index = use_candidate_index
+        self.candidate_index_min_rows = candidate_index_min_rows
+        self.candidate_index_limit = candidate_index_limit
+        self.match_engine = match_engine
+        self.tfidf_rerank = tfidf_rerank
+        self.tfidf_min_similarity = tfidf_min_similarity
+        
+        # The loaded reference data is replaced as a whole on reload. Requests read
+        # self.reference once, so in-flight work finishes against the version it started on.
+        self.reference: Optional[ReferenceData] = None
+        self.reloads = 0
+        self._reload_lock = threading.Lock()
+        
+        # Results are cached per (normalized text, image_id, reference version)
+        self.cache = MatchCache(maxsize=cache_size, ttl=cache_ttl)
+        
+        # Per-tier hit counters ("miss" counts responses no tier could match)
+        self._stats_lock = threading.Lock()
+        self.tier_hits: Dict[str, int] = {tier: 0 for tier in self.match_tiers}
+        self.tier_hits['miss'] = 0
+        self.shortlist_lookups = 0
+        self.shortlisted_candidates = 0
+        
         self.load_data()
     
-    def load_data(self) -> None:
-        """Load response data from CSV file."""
+    def resolve_reference_file(self) -> Path:
+        """Get the file the reference rows should be loaded from, per the configured source."""
+        if self.reference_source != 'sample':
+            # Only parses the PDF when no artifact with rows matches its content hash
+            manual_artifact = compile_manual(self.data_dir)
+            if manual_artifact is not None:
+                return manual_artifact
+            if self.reference_source == 'manual':
+                raise FileNotFoundError(f"No compiled manual could be loaded from {self.data_dir}")
+        
         sample_data_path = self.data_dir / 'sample_table.csv'
         
         if not sample_data_path.exists():
             raise FileNotFoundError(f"Data file not found: {sample_data_path}")
         
-        # Read data from CSV
-        with open(sample_data_path, 'r', encoding='utf-8') as f:
+        return sample_data_path
+    
+    def build_tables(self, reference_file: Path) -> Dict[int, ReferenceTable]:
+        """
+        Read a reference CSV file into one columnar table per image.
+        
+        Response texts are normalized here, once, and rows that normalize to the
+        same text with the same location and fq are collapsed into one.
+        """
+        builders: Dict[int, ReferenceTableBuilder] = {}
+        with open(reference_file, 'r', encoding='utf-8') as f:
             reader = csv.DictReader(f)
             for row in reader:
                 image_id = int(row['image_id'])
                 
-                if image_id not in self.response_data:
-                    self.response_data[image_id] = []
+                if image_id not in builders:
+                    builders[image_id] = ReferenceTableBuilder(image_id)
                 
-                self.response_data[image_id].append({
-                    'response_text': row['response_text'].lower(),
-                    'location': row['location'],
-                    'fq': row['fq']
-                })
+                builders[image_id].add(
+                    normalize_text(row['response_text']),
+                    row['location'],
+                    row['fq']
+                )
+        
+        return {image_id: builder.build() for image_id, builder in builders.items()}
+    
+    def load_snapshot_tables(self, reference_file: Path, source_hash: str) -> Tuple[Dict[int, ReferenceTable], str]:
+        """
+        Open the snapshot of a reference file, building it first if it doesn't exist yet.
+        
+        Returns:
+            Tuple of the tables and the name of the reference file they were built from
+        """
+        compiled_dir = self.data_dir / COMPILED_DIR_NAME
+        path = snapshot_path(compiled_dir, source_hash)
+        
+        if not path.exists():
+            print(f"Building reference snapshot {path.name} from {reference_file.name}...")
+            write_snapshot(self.build_tables(reference_file), path, reference_file.name)
+            # Every worker reloads after a change, so another one may have removed them already;
+            # a failed cleanup mustn't keep this worker off the snapshot it just wrote
+            try:
+                for stale in compiled_dir.glob('snapshot-*.bin'):
+                    if stale != path:
+                        stale.unlink(missing_ok=True)
+            except OSError as e:
+                print(f"⚠️ Could not remove stale reference snapshots: {str(e)}")
+        
+        return open_snapshot(path)
+    
+    def watched_files(self) -> List[Path]:
+        """Get the files whose changes should trigger a reload of the reference data."""
+        return [self.data_dir / 'sample_table.csv', self.data_dir / MANUAL_PDF_NAME]
+    
+    def load_data(self) -> ReferenceData:
+        """
+        Load response data from the manual artifact or the sample CSV file.
+        
+        The new tables and indexes are built off to the side and swapped in with a
+        single assignment, so this can run in the background while requests are served.
+        
+        Returns:
+            The newly loaded reference data
+        """
+        with self._reload_lock:
+            reference_file = self.resolve_reference_file()
+            source_hash = file_content_hash(reference_file)
+            
+            tables = None
+            loaded_from = reference_file.name
+            if self.use_snapshot:
+                try:
+                    tables, loaded_from = self.load_snapshot_tables(reference_file, source_hash)
+                except Exception as e:
+                    print(f"⚠️ Could not use the reference snapshot, loading {reference_file.name} directly: {str(e)}")
+            
+            if tables is None:
+                tables = self.build_tables(reference_file)
+            
+            reference = ReferenceData(tables, source_hash[:16], loaded_from)
+            previous = self.reference
+            
+            if self.match_engine == 'tfidf':
+                # Each table keeps its own TF-IDF matrix, so the swap below replaces both at
+                # once; built before it so the first requests on the new version don't pay for it
+                for table in tables.values():
+                    table.tfidf_index
+            
+            source_rows = sum(table.source_rows for table in tables.values())
+            rows = sum(len(table) for table in tables.values())
+            print(f"Loaded {rows} reference rows from {loaded_from} ({source_rows - rows} duplicates collapsed)")
+            
+            # Atomic swap: readers see either the old or the new reference data, never a mix
+            self.reference = reference
+            
+            if previous is not None:
+                self.reloads += 1
+                if previous.version != reference.version:
+                    # Old results are keyed on the old version and can't be hit anymore
+                    self.cache.clear()
+                print(f"Reference data reloaded: version {previous.version} -> {reference.version}")
+            
+            return reference
+    
+    @property
+    def tables(self) -> Dict[int, ReferenceTable]:
+        """The currently loaded reference tables."""
+        return self.reference.tables
+    
+    def _record_hits(self, tier: str, count: int = 1) -> None:
+        if count:
+            with self._stats_lock:
+                self.tier_hits[tier] += count
+    
+    def _tier_scorer(self, tier: str):
+        """Get the scorer and score cutoff of a fuzzy cascade tier."""
+        if tier == 'quick':
+            # Cheap scorer; the high cutoff lets rapidfuzz skip candidates early
+            return fuzz.ratio, self.quick_score_cutoff
+        return fuzz.token_set_ratio, MATCH_SCORE_CUTOFF
+    
+    def _uses_candidate_index(self, table: ReferenceTable, use_candidate_index: Optional[bool] = None) -> bool:
+        """Decide whether to shortlist with the candidate index; an explicit choice overrides the settings."""
+        if use_candidate_index is not None:
+            return use_candidate_index
+        return self.use_candidate_index and len(table) >= self.candidate_index_min_rows
+    
+    def _query_shortlists(self, queries: Sequence[str], table: ReferenceTable, record: bool = True) -> List[np.ndarray]:
+        """Get the candidate index shortlist of each of the given queries."""
+        shortlists = [table.candidate_index.shortlist(query, self.candidate_index_limit) for query in queries]
+        
+        if record:
+            with self._stats_lock:
+                self.shortlist_lookups += len(queries)
+                self.shortlisted_candidates += sum(len(shortlist) for shortlist in shortlists)
+        
+        return shortlists
+    
+    def _shortlist(self, queries: Sequence[str], table: ReferenceTable, record: bool = True) -> np.ndarray:
+        """Get the sorted union of the candidate index shortlists of the given queries."""
+        shortlists = self._query_shortlists(queries, table, record)
+        return np.unique(np.concatenate(shortlists)) if shortlists else np.empty(0, dtype=np.int32)
+    
+    def _tfidf_match(self, queries: Sequence[str], table: ReferenceTable) -> List[Optional[int]]:
+        """
+        Match normalized texts with the TF-IDF engine, scoring all of them in one sparse product.
+        
+        Returns:
+            The matched row index per query, or None
+        """
+        candidates = table.tfidf_index.top_candidates(queries, max(self.tfidf_rerank, 1))
+        
+        indexes: List[Optional[int]] = []
+        for query, (rows, similarities) in zip(queries, candidates):
+            if not len(rows):
+                indexes.append(None)
+            elif self.tfidf_rerank:
+                match = process.extractOne(
+                    query,
+                    [table.texts[row] for row in rows],
+                    scorer=fuzz.token_set_ratio,
+                    score_cutoff=MATCH_SCORE_CUTOFF
+                )
+                indexes.append(int(rows[match[2]]) if match is not None else None)
+            else:
+                indexes.append(int(rows[0]) if similarities[0] >= self.tfidf_min_similarity else None)
+        
+        return indexes
+    
+    def _match_index(
+        self,
+        response_text: str,
+        table: ReferenceTable,
+        use_candidate_index: Optional[bool] = None,
+        record: bool = True
+    ) -> Optional[int]:
+        """Run the matching cascade for one normalized text and return the matched row index."""
+        shortlist = None
+        
+        for tier in self.match_tiers:
+            if tier == 'exact':
+                index = table.find_exact(response_text)
+            elif tier == 'tfidf':
+                index = self._tfidf_match([response_text], table)[0]
+            else:
+                choices = table.texts
+                if self._uses_candidate_index(table, use_candidate_index):
+                    if shortlist is None:
+                        shortlist = self._shortlist([response_text], table, record)
+                    choices = [table.texts[i] for i in shortlist]
+                
+                scorer, score_cutoff = self._tier_scorer(tier)
+                match = process.extractOne(
+                    response_text,
+                    choices,
+                    scorer=scorer,
+                    score_cutoff=score_cutoff
+                )
+                
+                index = None
+                if match is not None:
+                    index = match[2] if choices is table.texts else int(shortlist[match[2]])
+            
+            if index is not None:
+                if record:
+                    self._record_hits(tier)
+                return index
+        
+        if record:
+            self._record_hits('miss')
+        return None
     
-    def analyze_response(self, response_text: str, image_id: int) -> Optional[Dict[str, str]]:
+    def analyze_response(
+        self,
+        response_text: str,
+        image_id: int,
+        reference: Optional[ReferenceData] = None
+    ) -> Optional[Dict[str, str]]:
         """
-        Analyze a response using fuzzy matching.
+        Analyze a response using the matching cascade.
         
         Args:
             response_text: The text response to analyze
             image_id: The ID of the image being analyzed
+            reference: Reference data to match against (defaults to the currently loaded data)
             
         Returns:
             Dict with location and fq values, or None if no match found
         """
-        if image_id not in self.response_data:
+        reference = reference or self.reference
+        table = reference.tables.get(image_id)
+        if table is None or len(table) == 0:
             return None
         
-        # Normalize the input
-        response_text = response_text.lower().strip()
+        # Normalize the input the same way as the reference rows
+        response_text = normalize_text(response_text)
+        
+        cache_key = (response_text, image_id, reference.version)
+        index = self.cache.get(cache_key)
+        if index is MISSING:
+            index = self._match_index(response_text, table)
+            self.cache.put(cache_key, index)
+        
+        if index is None:
+            return None
+        
+        return table.row(index)
+    
+    def analyze_batch(
+        self,
+        response_texts: List[str],
+        image_id: int,
+        reference: Optional[ReferenceData] = None
+    ) -> List[Optional[Dict[str, str]]]:
+        """
+        Analyze several responses for the same image in one pass.
+        
+        Each cascade tier runs once over all still-unmatched texts. The fuzzy tiers
+        score them as a single matrix (rapidfuzz cdist, spread across all cores),
+        instead of one full scan per response. On tables that use the candidate
+        index, each response is scored against its own shortlist instead.
+        
+        Args:
+            response_texts: The text responses to analyze
+            image_id: The ID of the image being analyzed
+            reference: Reference data to match against (defaults to the currently loaded data)
+            
+        Returns:
+            List with one entry per input text: a dict with location and fq
+            values, or None if no match was found
+        """
+        if not response_texts:
+            return []
+        
+        reference = reference or self.reference
+        table = reference.tables.get(image_id)
+        if table is None or len(table) == 0:
+            return [None] * len(response_texts)
+        
+        # Normalize the inputs the same way as the reference rows
+        normalized = [normalize_text(text) for text in response_texts]
+        
+        # Only texts that are neither cached nor repeated within the batch get scored
+        cached: Dict[str, Optional[int]] = {}
+        queries: List[str] = []
+        queued = set()
+        for text in normalized:
+            if text in cached or text in queued:
+                continue
+            index = self.cache.get((text, image_id, reference.version))
+            if index is MISSING:
+                queries.append(text)
+                queued.add(text)
+            else:
+                cached[text] = index
         
-        # Get all response texts for this image ID
-        candidates = [item['response_text'] for item in self.response_data[image_id]]
+        indexes: List[Optional[int]] = [None] * len(queries)
+        pending = list(range(len(queries)))
+        # Candidate index shortlists, computed once and shared by the fuzzy tiers
+        query_shortlists: Dict[int, np.ndarray] = {}
+        
+        for tier in self.match_tiers:
+            if not pending:
+                break
+            
+            if tier == 'exact':
+                still_pending = []
+                for i in pending:
+                    indexes[i] = table.find_exact(queries[i])
+                    if indexes[i] is None:
+                        still_pending.append(i)
+            elif tier == 'tfidf':
+                still_pending = []
+                tfidf_indexes = self._tfidf_match([queries[i] for i in pending], table)
+                for i, index in zip(pending, tfidf_indexes):
+                    indexes[i] = index
+                    if index is None:
+                        still_pending.append(i)
+            else:
+                scorer, score_cutoff = self._tier_scorer(tier)
+                still_pending = []
+                
+                if self._uses_candidate_index(table):
+                    # Each query is scored against its own shortlist: a shared matrix over the
+                    # union of all shortlists grows with the batch and costs more than it saves
+                    if not query_shortlists:
+                        pending_queries = [queries[i] for i in pending]
+                        query_shortlists = dict(zip(pending, self._query_shortlists(pending_queries, table)))
+                    
+                    for i in pending:
+                        rows = query_shortlists[i]
+                        match = process.extractOne(
+                            queries[i],
+                            [table.texts[row] for row in rows],
+                            scorer=scorer,
+                            score_cutoff=score_cutoff
+                        ) if len(rows) else None
+                        if match is None:
+                            still_pending.append(i)
+                        else:
+                            indexes[i] = int(rows[match[2]])
+                else:
+                    # One row of scores per query, one column per reference row
+                    scores = process.cdist(
+                        [queries[i] for i in pending],
+                        table.texts,
+                        scorer=scorer,
+                        score_cutoff=score_cutoff,
+                        workers=CDIST_WORKERS
+                    )
+                    
+                    for i, query_scores in zip(pending, scores):
+                        # argmax keeps the first best candidate, like extractOne
+                        best_index = int(query_scores.argmax())
+                        if query_scores[best_index] < score_cutoff:
+                            still_pending.append(i)
+                        else:
+                            indexes[i] = best_index
+            
+            self._record_hits(tier, len(pending) - len(still_pending))
+            pending = still_pending
+        
+        self._record_hits('miss', len(pending))
+        
+        for query, index in zip(queries, indexes):
+            self.cache.put((query, image_id, reference.version), index)
+            cached[query] = index
+        
+        return [table.row(cached[text]) if cached[text] is not None else None for text in normalized]
+    
+    def suggest(
+        self,
+        response_text: str,
+        image_id: int,
+        limit: int = 5,
+        score_cutoff: int = MATCH_SCORE_CUTOFF,
+        reference: Optional[ReferenceData] = None
+    ) -> List[Dict]:
+        """
+        Get the top reference responses for a text, best first.
+        
+        The cutoff is passed to the scorer so candidates below it are pruned
+        while scoring instead of being ranked and filtered afterwards.
+        
+        Args:
+            response_text: The text response to analyze
+            image_id: The ID of the image being analyzed
+            limit: Maximum number of suggestions to return
+            score_cutoff: Minimum token-set score for a candidate to be suggested
+            reference: Reference data to match against (defaults to the currently loaded data)
+            
+        Returns:
+            List of dictionaries with the reference text, location, fq and score
+        """
+        reference = reference or self.reference
+        table = reference.tables.get(image_id)
+        if table is None or len(table) == 0:
+            return []
         
-        # Find the best match using fuzzy matching
-        best_match, score, _ = process.extractOne(
-            response_text, 
-            candidates,
-            scorer=fuzz.token_set_ratio  # Use token set for better partial matching
+        # Normalize the input the same way as the reference rows
+        response_text = normalize_text(response_text)
+        
+        choices = table.texts
+        shortlist = None
+        if self._uses_candidate_index(table):
+            shortlist = self._shortlist([response_text], table)
+            choices = [table.texts[i] for i in shortlist]
+        
+        matches = process.extract(
+            response_text,
+            choices,
+            scorer=fuzz.token_set_ratio,
+            limit=limit,
+            score_cutoff=score_cutoff
         )
         
-        # Only accept matches with decent scores
-        if score < 70:
-            return None
+        suggestions = []
+        for _, score, choice_index in matches:
+            index = choice_index if shortlist is None else int(shortlist[choice_index])
+            suggestion = table.row(index)
+            suggestion['response_text'] = table.texts[index]
+            suggestion['score'] = float(score)
+            suggestions.append(suggestion)
+        
+        return suggestions
+    
+    def autocomplete(
+        self,
+        prefix: str,
+        image_id: int,
+        limit: int = 10,
+        reference: Optional[ReferenceData] = None
+    ) -> List[Dict]:
+        """
+        Get reference responses that complete a partially typed text.
+        
+        Uses the table's sorted prefix index, so no fuzzy scoring is involved.
+        
+        Args:
+            prefix: The text typed so far
+            image_id: The ID of the image being analyzed
+            limit: Maximum number of completions to return
+            reference: Reference data to complete from (defaults to the currently loaded data)
             
-        # Find the corresponding data for the best match
-        for item in self.response_data[image_id]:
-            if item['response_text'] == best_match:
-                return {
-                    'location': item['location'],
-                    'fq': item['fq']
-                }
+        Returns:
+            List of dictionaries with the reference text, location and fq
+        """
+        reference = reference or self.reference
+        table = reference.tables.get(image_id)
+        if table is None or len(table) == 0:
+            return []
         
-        return None
+        # Normalize the input, keeping a trailing space since it ends the last word
+        trailing_space = prefix[-1:].isspace()
+        prefix = normalize_text(prefix)
+        if prefix and trailing_space:
+            prefix += ' '
+        
+        completions = []
+        for index in table.prefix_index.complete(prefix, limit):
+            completion = table.row(index)
+            completion['response_text'] = table.texts[index]
+            completions.append(completion)
+        
+        return completions
+    
+    def get_match_stats(self) -> Dict:
+        """
+        Get how many analyzed responses each cascade tier has absorbed.
+        
+        Returns:
+            Dictionary with the configured tiers, per-tier hit counts and the total
+        """
+        with self._stats_lock:
+            hits = dict(self.tier_hits)
+            lookups = self.shortlist_lookups
+            candidates = self.shortlisted_candidates
+        
+        return {
+            'engine': self.match_engine,
+            'tiers': list(self.match_tiers),
+            'hits': hits,
+            'total': sum(hits.values()),
+            'candidate_index': {
+                'enabled': self.use_candidate_index,
+                'min_rows': self.candidate_index_min_rows,
+                'limit': self.candidate_index_limit,
+                'lookups': lookups,
+                'avg_candidates': candidates / lookups if lookups else 0.0
+            },
+            'tfidf': {
+                'rerank': self.tfidf_rerank,
+                'min_similarity': self.tfidf_min_similarity
+            } if self.match_engine == 'tfidf' else None,
+            'cache': self.cache.get_stats(),
+            'reference': self.get_reference_info()
+        }
+    
+    def get_reference_info(self) -> Dict:
+        """Get the version and origin of the currently loaded reference data."""
+        reference = self.reference
+        return {
+            'version': reference.version,
+            'loaded_from': reference.loaded_from,
+            'loaded_at': reference.loaded_at.isoformat(),
+            'reloads': self.reloads
+        }
+    
+    def compare_candidate_index(self, samples: Sequence[Tuple[str, int]]) -> Dict:
+        """
+        Compare the candidate index against the exhaustive scan on sample queries.
+        
+        Both modes run the full cascade on every sample without touching the hit
+        counters. Recall is the share of samples where the indexed mode resolves to
+        the same row as the exhaustive scan.
+        
+        Args:
+            samples: (response_text, image_id) pairs to match
+            
+        Returns:
+            Dictionary with the recall and per-mode latency in milliseconds
+        """
+        timings = {'exhaustive': 0.0, 'indexed': 0.0}
+        agreed = 0
+        compared = 0
+        
+        for response_text, image_id in samples:
+            table = self.tables.get(image_id)
+            if table is None or len(table) == 0:
+                continue
+            
+            query = normalize_text(response_text)
+            results = {}
+            for mode, use_index in (('exhaustive', False), ('indexed', True)):
+                start = time.perf_counter()
+                # An explicit mode bypasses the min_rows threshold so small tables can be compared too
+                results[mode] = self._match_index(query, table, use_candidate_index=use_index, record=False)
+                timings[mode] += time.perf_counter() - start
+            
+            compared += 1
+            if results['indexed'] == results['exhaustive']:
+                agreed += 1
+        
+        return {
+            'samples': compared,
+            'recall': agreed / compared if compared else 0.0,
+            'exhaustive_ms': timings['exhaustive'] * 1000 / compared if compared else 0.0,
+            'indexed_ms': timings['indexed'] * 1000 / compared if compared else 0.0
+        }
     
     def get_tables_info(self) -> List[Dict]:
         """
@@ -91,11 +726,14 @@ class ResponseAnalyzer:
         """
         tables_info = []
         
-        for image_id, data in self.response_data.items():
+        for image_id, table in self.tables.items():
             tables_info.append({
                 'image_id': image_id,
                 'table_name': f"Image {image_id}",
-                'num_rows': len(data)
+                'num_rows': len(table),
+                'source_rows': table.source_rows,
+                'collapsed_rows': table.collapsed_rows,
+                'shrink_percent': round(table.collapsed_rows * 100 / table.source_rows, 1) if table.source_rows else 0.0
             })
         
         return tables_info
@@ -0,0 +1,112 @@
+from bisect import bisect_left
+from collections.abc import Sequence as SequenceABC
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .candidate_index import TOKEN_PATTERN
+
+# Sorted-array prefix index for autocomplete. Completions are found with two binary
+# searches over sorted keys instead of fuzzy scoring, so a lookup costs microseconds
+# and can run on every keystroke. The keys aren't stored as strings: each one is a row
+# (and, for word suffixes, the position of the word in the row's text), so the index is
+# a few integer arrays that a reference snapshot can hold and map like its other indexes.
+
+# Sorts after every character a key can contain, to close the prefix range
+PREFIX_RANGE_END = '\U0010ffff'
+
+class IndexKeys(SequenceABC):
+    """Sorted keys of a prefix index, read from the table's texts on access."""
+
+    def __init__(self, texts: Sequence[str], rows: np.ndarray, starts: Optional[np.ndarray] = None):
+        self._texts = texts
+        # memoryview indexing returns plain ints, which is faster than numpy scalars
+        self._rows = memoryview(rows)
+        self._starts = memoryview(starts) if starts is not None else None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, position: int) -> str:
+        text = self._texts[self._rows[position]]
+        return text[self._starts[position]:] if self._starts is not None else text
+
+def build_prefix_arrays(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort the keys of a prefix index.
+
+    Returns:
+        The rows of the distinct texts in text order, and the rows and start positions
+        of their later words in suffix order
+    """
+    first_rows = {}
+    for row, text in enumerate(texts):
+        first_rows.setdefault(text, row)
+    text_rows = [row for _, row in sorted(first_rows.items())]
+
+    suffixes = set()
+    for text, row in first_rows.items():
+        for match in TOKEN_PATTERN.finditer(text):
+            if match.start() > 0:
+                suffixes.add((text[match.start():], row, match.start()))
+    suffixes_by_key = sorted(suffixes)
+
+    return (
+        np.array(text_rows, dtype=np.uint32),
+        np.array([row for _, row, _ in suffixes_by_key], dtype=np.uint32),
+        np.array([position for _, _, position in suffixes_by_key], dtype=np.uint32)
+    )
+
+class PrefixIndex:
+    """Prefix lookup over the normalized texts of one reference table."""
+
+    def __init__(
+        self,
+        texts: Sequence[str],
+        arrays: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+    ):
+        """
+        Index every distinct text by its full text and, as a fallback, by each of
+        its words, so "bat" also completes to "a bat flying in the air".
+
+        Args:
+            texts: The normalized texts of the table
+            arrays: Prebuilt key arrays from build_prefix_arrays (e.g. from a snapshot)
+        """
+        if arrays is None:
+            arrays = build_prefix_arrays(texts)
+        self.text_rows, self.suffix_rows, self.suffix_starts = arrays
+        # bisect works directly on the key sequences
+        self.text_keys = IndexKeys(texts, self.text_rows)
+        self.suffix_keys = IndexKeys(texts, self.suffix_rows, self.suffix_starts)
+
+    @staticmethod
+    def _range(keys: Sequence[str], prefix: str) -> range:
+        return range(bisect_left(keys, prefix), bisect_left(keys, prefix + PREFIX_RANGE_END))
+
+    def complete(self, prefix: str, limit: int) -> List[int]:
+        """
+        Get the rows whose text starts with a normalized prefix, followed by rows
+        with a later word starting with it, each group in alphabetical order.
+
+        Args:
+            prefix: The normalized prefix typed so far
+            limit: Maximum number of rows to return
+
+        Returns:
+            Row indexes of distinct texts, at most limit of them
+        """
+        if not prefix or limit <= 0:
+            return []
+
+        rows: List[int] = []
+        seen = set()
+        for keys, key_rows in ((self.text_keys, self.text_rows), (self.suffix_keys, self.suffix_rows)):
+            for position in self._range(keys, prefix):
+                row = int(key_rows[position])
+                if row not in seen:
+                    seen.add(row)
+                    rows.append(row)
+                    if len(rows) == limit:
+                        return rows
+        return rows
@@ -0,0 +1,249 @@
+"""
+Binary snapshot of the compiled reference tables, opened with mmap.
+
+A snapshot holds the normalized texts, the location/fq code columns, the exact-match
+hash index, the candidate index postings and the sorted autocomplete keys of every
+table as flat arrays. Worker
+processes map the same file read-only, so the operating system shares its pages between
+them: adding workers doesn't add matcher memory, and opening a snapshot costs about the
+same no matter how many rows it holds.
+
+File layout (little-endian):
+    8 bytes   magic (SNAPSHOT_MAGIC)
+    8 bytes   JSON header length
+    N bytes   JSON header: per table, the location/fq pools, the number of source
+              rows and the offset, dtype and length of each array
+    ...       array data, each array aligned to 8 bytes
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .candidate_index import CandidateIndex
+from .normalization import NORMALIZATION_VERSION
+from .prefix_index import PrefixIndex, build_prefix_arrays
+from .reference_store import ReferenceTable
+
+SNAPSHOT_MAGIC = b'INKSNAP1'
+# Bump when the layout changes so existing snapshots get rebuilt
+SNAPSHOT_VERSION = 3
+
+# Separates texts in the text blob, so iterating a table can decode it in one call
+TEXT_SEPARATOR = '\x00'
+
+def snapshot_path(compiled_dir: Path, source_hash: str) -> Path:
+    """Get the snapshot path for reference data with the given content hash."""
+    # Snapshots hold normalized texts, so a normalization change needs a new snapshot too
+    return Path(compiled_dir) / f"snapshot-{source_hash[:16]}-v{SNAPSHOT_VERSION}n{NORMALIZATION_VERSION}.bin"
+
+def key_hash(key: str) -> int:
+    """Stable 64-bit hash of a string (Python's hash() differs between processes)."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class MappedTexts(Sequence):
+    """Read-only sequence of texts decoded on demand from a snapshot's text blob."""
+
+    def __init__(self, blob: memoryview, offsets: np.ndarray):
+        self._blob = blob
+        # memoryview indexing returns plain ints, which is faster than numpy scalars
+        self._offsets = memoryview(offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        # The stored end offset includes the separator
+        return str(self._blob[self._offsets[index]:self._offsets[index + 1] - 1], 'utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        # Full scans decode the whole blob at once instead of text by text
+        if len(self) == 0:
+            return iter(())
+        return iter(str(self._blob[:-1], 'utf-8').split(TEXT_SEPARATOR))
+
+class MappedExactIndex:
+    """Exact-match lookup over sorted text hashes, returning the first row with the text."""
+
+    def __init__(self, hashes: np.ndarray, rows: np.ndarray, texts: MappedTexts):
+        self._hashes = hashes
+        self._rows = rows
+        self._texts = texts
+
+    def get(self, text: str, default: Optional[int] = None) -> Optional[int]:
+        target = np.uint64(key_hash(text))
+        position = int(np.searchsorted(self._hashes, target))
+        # Hashes can collide, so confirm the text of every row sharing the hash
+        while position < len(self._hashes) and self._hashes[position] == target:
+            row = int(self._rows[position])
+            if self._texts[row] == text:
+                return row
+            position += 1
+        return default
+
+class MappedPostings:
+    """Posting lists keyed by sorted key hashes, with the same get() as a dict of arrays."""
+
+    def __init__(self, hashes: np.ndarray, offsets: np.ndarray, rows: np.ndarray):
+        self._hashes = hashes
+        self._offsets = offsets
+        self._rows = rows
+
+    def get(self, key: str, default=None):
+        target = np.uint64(key_hash(key))
+        position = int(np.searchsorted(self._hashes, target))
+        if position == len(self._hashes) or self._hashes[position] != target:
+            return default
+        # A colliding key would only widen the shortlist, never drop a candidate
+        return self._rows[self._offsets[position]:self._offsets[position + 1]]
+
+def _table_arrays(table: ReferenceTable) -> Dict[str, np.ndarray]:
+    """Flatten a table and its indexes into the arrays stored in a snapshot."""
+    texts = [text.replace(TEXT_SEPARATOR, ' ') for text in table.texts]
+    encoded = [(text + TEXT_SEPARATOR).encode('utf-8') for text in texts]
+    text_offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(item) for item in encoded], out=text_offsets[1:])
+
+    first_rows: Dict[str, int] = {}
+    for index, text in enumerate(texts):
+        first_rows.setdefault(text, index)
+    exact_pairs = sorted((key_hash(text), row) for text, row in first_rows.items())
+
+    arrays = {
+        'text_blob': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        'text_offsets': text_offsets,
+        'location_codes': np.asarray(table.location_codes, dtype=np.uint16),
+        'fq_codes': np.asarray(table.fq_codes, dtype=np.uint16),
+        'exact_hashes': np.array([pair[0] for pair in exact_pairs], dtype=np.uint64),
+        'exact_rows': np.array([pair[1] for pair in exact_pairs], dtype=np.uint32)
+    }
+
+    # Sorted from the stored texts, so the key order matches what is read back
+    arrays['prefix_text_rows'], arrays['prefix_suffix_rows'], arrays['prefix_suffix_starts'] = build_prefix_arrays(texts)
+
+    for name, postings in (('token', table.candidate_index.token_postings),
+                           ('ngram', table.candidate_index.ngram_postings)):
+        keyed = sorted((key_hash(key), rows) for key, rows in postings.items())
+        offsets = np.zeros(len(keyed) + 1, dtype=np.uint64)
+        np.cumsum([len(rows) for _, rows in keyed], out=offsets[1:])
+        arrays[f'{name}_hashes'] = np.array([item[0] for item in keyed], dtype=np.uint64)
+        arrays[f'{name}_offsets'] = offsets
+        arrays[f'{name}_rows'] = (
+            np.concatenate([rows for _, rows in keyed]).astype(np.int32)
+            if keyed else np.empty(0, dtype=np.int32)
+        )
+
+    return arrays
+
+def write_snapshot(tables: Dict[int, ReferenceTable], path: Path, loaded_from: str) -> None:
+    """
+    Write reference tables to a snapshot file, replacing it atomically.
+
+    Args:
+        tables: The tables to store, keyed by image ID
+        path: Snapshot file path
+        loaded_from: Name of the reference file the tables were built from
+    """
+    header = {'version': SNAPSHOT_VERSION, 'loaded_from': loaded_from, 'tables': []}
+    blobs: List[Tuple[int, np.ndarray]] = []
+    offset = 0
+
+    for image_id, table in tables.items():
+        entry = {
+            'image_id': image_id,
+            'locations': list(table.locations),
+            'fqs': list(table.fqs),
+            'source_rows': table.source_rows,
+            'arrays': {}
+        }
+        for name, values in _table_arrays(table).items():
+            entry['arrays'][name] = {'offset': offset, 'dtype': values.dtype.str, 'length': len(values)}
+            blobs.append((offset, values))
+            # Keep every array 8-byte aligned so it can be viewed in place
+            offset += (values.nbytes + 7) // 8 * 8
+        header['tables'].append(entry)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+    data_start = len(SNAPSHOT_MAGIC) + 8 + len(header_bytes)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique temp name so concurrent workers building the same snapshot don't collide
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for array_offset, values in blobs:
+            f.seek(data_start + array_offset)
+            f.write(values.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+def open_snapshot(path: Path) -> Tuple[Dict[int, ReferenceTable], str]:
+    """
+    Open a snapshot read-only with mmap.
+
+    Returns:
+        Tuple of the tables keyed by image ID and the name of the reference file they were built from
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError(f"Not a reference snapshot: {path}")
+
+    header_length = struct.unpack_from('<Q', mapped, len(SNAPSHOT_MAGIC))[0]
+    header_start = len(SNAPSHOT_MAGIC) + 8
+    header = json.loads(bytes(mapped[header_start:header_start + header_length]))
+    if header['version'] != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {header['version']}: {path}")
+
+    buffer = memoryview(mapped)
+    data_start = header_start + header_length
+
+    tables: Dict[int, ReferenceTable] = {}
+    for entry in header['tables']:
+        arrays = {
+            name: np.frombuffer(buffer, dtype=np.dtype(spec['dtype']), count=spec['length'],
+                                offset=data_start + spec['offset'])
+            for name, spec in entry['arrays'].items()
+        }
+
+        texts = MappedTexts(buffer[data_start + entry['arrays']['text_blob']['offset']:][:len(arrays['text_blob'])],
+                            arrays['text_offsets'])
+        candidate_index = CandidateIndex(
+            texts,
+            token_postings=MappedPostings(arrays['token_hashes'], arrays['token_offsets'], arrays['token_rows']),
+            ngram_postings=MappedPostings(arrays['ngram_hashes'], arrays['ngram_offsets'], arrays['ngram_rows'])
+        )
+
+        image_id = entry['image_id']
+        tables[image_id] = ReferenceTable(
+            image_id,
+            texts,
+            arrays['location_codes'],
+            arrays['fq_codes'],
+            entry['locations'],
+            entry['fqs'],
+            exact_index=MappedExactIndex(arrays['exact_hashes'], arrays['exact_rows'], texts),
+            candidate_index=candidate_index,
+            prefix_index=PrefixIndex(
+                texts,
+                (arrays['prefix_text_rows'], arrays['prefix_suffix_rows'], arrays['prefix_suffix_starts'])
+            ),
+            source_rows=entry['source_rows']
+        )
+
+    return tables, header['loaded_from']
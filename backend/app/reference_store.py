@@ -0,0 +1,186 @@
+import threading
+from array import array
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from .candidate_index import CandidateIndex
+from .prefix_index import PrefixIndex
+from .tfidf_engine import TfidfIndex
+
+# Reference rows are stored column by column: one sequence of normalized texts plus
+# small integer codes for the location and fq columns. A match found by index can be
+# resolved back to its row in O(1) without scanning or allocating per-row dicts.
+
+class ReferenceTable:
+    """Immutable columnar store of the reference rows for a single image."""
+
+    __slots__ = (
+        'image_id', 'texts', 'location_codes', 'fq_codes', 'locations', 'fqs',
+        'exact_index', 'candidate_index', 'prefix_index', '_tfidf_index', '_build_lock', 'source_rows'
+    )
+
+    def __init__(
+        self,
+        image_id: int,
+        texts: Sequence[str],
+        location_codes: Sequence[int],
+        fq_codes: Sequence[int],
+        locations: Sequence[str],
+        fqs: Sequence[str],
+        exact_index: Optional[Mapping[str, int]] = None,
+        candidate_index: Optional[CandidateIndex] = None,
+        prefix_index: Optional[PrefixIndex] = None,
+        source_rows: Optional[int] = None
+    ):
+        """
+        The exact, candidate and prefix indexes are built from the texts unless
+        prebuilt ones are passed in (e.g. when the table is opened from a snapshot).
+        The TF-IDF index is only needed by the tfidf engine, so it is built on first
+        use rather than every time a table is opened.
+        source_rows is the number of rows read before duplicates were collapsed.
+        """
+        object.__setattr__(self, 'image_id', image_id)
+        # Lists are frozen; other sequences (such as snapshot-backed texts) are already immutable
+        object.__setattr__(self, 'texts', tuple(texts) if isinstance(texts, list) else texts)
+        # Read-only views so the code columns can't be modified after construction
+        object.__setattr__(self, 'location_codes', memoryview(location_codes).toreadonly())
+        object.__setattr__(self, 'fq_codes', memoryview(fq_codes).toreadonly())
+        object.__setattr__(self, 'locations', tuple(locations))
+        object.__setattr__(self, 'fqs', tuple(fqs))
+        object.__setattr__(self, 'source_rows', len(self.texts) if source_rows is None else source_rows)
+
+        if exact_index is None:
+            # Hash map from normalized text to its first row, for exact-match lookups
+            first_rows: Dict[str, int] = {}
+            for index, text in enumerate(self.texts):
+                first_rows.setdefault(text, index)
+            exact_index = MappingProxyType(first_rows)
+        object.__setattr__(self, 'exact_index', exact_index)
+
+        if candidate_index is None:
+            # Inverted token / n-gram index for shortlisting fuzzy-match candidates
+            candidate_index = CandidateIndex(self.texts)
+        object.__setattr__(self, 'candidate_index', candidate_index)
+
+        if prefix_index is None:
+            # Sorted prefix index for autocomplete
+            prefix_index = PrefixIndex(self.texts)
+        object.__setattr__(self, 'prefix_index', prefix_index)
+        object.__setattr__(self, '_tfidf_index', None)
+        object.__setattr__(self, '_build_lock', threading.Lock())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ReferenceTable is immutable")
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @property
+    def tfidf_index(self) -> TfidfIndex:
+        """TF-IDF matrix of the texts for the tfidf engine, built on first use."""
+        if self._tfidf_index is None:
+            with self._build_lock:
+                if self._tfidf_index is None:
+                    object.__setattr__(self, '_tfidf_index', TfidfIndex(self.texts))
+        return self._tfidf_index
+
+    @property
+    def collapsed_rows(self) -> int:
+        """Number of duplicate rows dropped when the table was built."""
+        return self.source_rows - len(self.texts)
+
+    def find_exact(self, text: str) -> Optional[int]:
+        """Get the index of the first row whose normalized text equals the given text."""
+        return self.exact_index.get(text)
+
+    def location(self, index: int) -> str:
+        """Get the location value of the row at the given index."""
+        return self.locations[self.location_codes[index]]
+
+    def fq(self, index: int) -> str:
+        """Get the fq value of the row at the given index."""
+        return self.fqs[self.fq_codes[index]]
+
+    def row(self, index: int) -> Dict[str, str]:
+        """Resolve the row at the given index to its location and fq values."""
+        return {
+            'location': self.location(index),
+            'fq': self.fq(index)
+        }
+
+class ReferenceTableBuilder:
+    """
+    Accumulates rows for one image and builds an immutable ReferenceTable.
+
+    Rows repeating the normalized text, location and fq of an earlier row are
+    dropped, since they can only ever produce the same result.
+    """
+
+    def __init__(self, image_id: int):
+        self.image_id = image_id
+        self.source_rows = 0
+        self._seen: Set[Tuple[str, str, str]] = set()
+        self.texts: List[str] = []
+        self.location_codes = array('H')
+        self.fq_codes = array('H')
+        self.location_pool: Dict[str, int] = {}
+        self.fq_pool: Dict[str, int] = {}
+
+    @staticmethod
+    def _intern(pool: Dict[str, int], value: str) -> int:
+        code = pool.get(value)
+        if code is None:
+            code = len(pool)
+            pool[value] = code
+        return code
+
+    def add(self, response_text: str, location: str, fq: str) -> bool:
+        """
+        Append a row with an already normalized response text.
+
+        Returns:
+            False if the row duplicates an earlier one and was dropped
+        """
+        self.source_rows += 1
+        key = (response_text, location, fq)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+
+        self.texts.append(response_text)
+        self.location_codes.append(self._intern(self.location_pool, location))
+        self.fq_codes.append(self._intern(self.fq_pool, fq))
+        return True
+
+    def build(self) -> ReferenceTable:
+        # Codes are assigned in insertion order, so the pool keys are already indexed by code
+        return ReferenceTable(
+            self.image_id,
+            self.texts,
+            self.location_codes,
+            self.fq_codes,
+            tuple(self.location_pool),
+            tuple(self.fq_pool),
+            source_rows=self.source_rows
+        )
+
+class ReferenceData:
+    """Immutable set of per-image tables loaded from one version of the reference data."""
+
+    __slots__ = ('tables', 'version', 'loaded_from', 'loaded_at')
+
+    def __init__(self, tables: Dict[int, ReferenceTable], version: str, loaded_from: str):
+        """
+        Args:
+            tables: The reference tables, keyed by image ID
+            version: Identifier of the reference data (derived from its content hash)
+            loaded_from: Name of the file the tables were loaded from
+        """
+        object.__setattr__(self, 'tables', MappingProxyType(dict(tables)))
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'loaded_from', loaded_from)
+        object.__setattr__(self, 'loaded_at', datetime.now())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ReferenceData is immutable")
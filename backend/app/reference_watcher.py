@@ -0,0 +1,114 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .manual_extractor import COMPILED_DIR_NAME
+
+# Polls the reference data files and reloads the analyzer in the background when one of
+# them changes. Polling the file stats avoids an extra dependency and works the same on
+# every platform; the interval is a few seconds, so the cost is negligible.
+#
+# Every worker process runs its own watcher. A reload requested through the API bumps a
+# generation number in a token file next to the compiled reference data, which the
+# watchers poll along with the reference files, so all workers reload within one interval.
+
+REFERENCE_WATCH_INTERVAL = float(os.environ.get("REFERENCE_WATCH_INTERVAL", 0))
+RELOAD_TOKEN_NAME = "reload-generation"
+
+FileSignature = Optional[Tuple[int, int]]
+
+class ReferenceWatcher:
+    """Background thread that reloads the analyzer's reference data when its files change."""
+
+    def __init__(self, analyzer, interval: float = REFERENCE_WATCH_INTERVAL):
+        """
+        Args:
+            analyzer: The ResponseAnalyzer to reload
+            interval: Seconds between checks of the watched files
+        """
+        self.analyzer = analyzer
+        self.interval = interval
+        self.token_path = Path(analyzer.data_dir) / COMPILED_DIR_NAME / RELOAD_TOKEN_NAME
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._signatures = self._current_signatures()
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def _current_signatures(self) -> Dict[Path, FileSignature]:
+        signatures = {}
+        for path in [*self.analyzer.watched_files(), self.token_path]:
+            try:
+                stat = path.stat()
+                signatures[path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                signatures[path] = None
+        return signatures
+
+    def check(self) -> bool:
+        """
+        Reload the reference data if any watched file changed since the last check.
+
+        Returns:
+            True if a reload was triggered
+        """
+        signatures = self._current_signatures()
+        if signatures == self._signatures:
+            return False
+
+        changed = [path.name for path, signature in signatures.items() if self._signatures.get(path) != signature]
+        print(f"Reference files changed ({', '.join(changed)}), reloading...")
+        try:
+            self.analyzer.load_data()
+        except Exception as e:
+            # Keep serving the current version; the change is retried on the next check
+            print(f"❌ Error reloading reference data: {str(e)}")
+            return False
+
+        self._signatures = signatures
+        return True
+
+    def generation(self) -> int:
+        """Get the reload generation in the token file (0 before the first requested reload)."""
+        try:
+            return int(self.token_path.read_text().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def request_reload(self) -> int:
+        """
+        Bump the reload generation so the watchers of all workers reload.
+
+        Returns:
+            The new generation
+        """
+        generation = self.generation() + 1
+        self.token_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.token_path.with_name(f"{RELOAD_TOKEN_NAME}.{os.getpid()}.tmp")
+        temporary.write_text(str(generation))
+        os.replace(temporary, self.token_path)
+        return generation
+
+    def mark_current(self) -> None:
+        """Record the current file state as loaded, after reloading outside of check()."""
+        self._signatures = self._current_signatures()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self) -> None:
+        if self._thread is not None or not self.enabled:
+            return
+        self._thread = threading.Thread(target=self._run, name="reference-watcher", daemon=True)
+        self._thread.start()
+        print(f"Watching reference data for changes every {self.interval:g}s")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,13 +1,13 @@
 import asyncio
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
-import ssl
-import certifi
+
+from .db import get_client, DATABASE_NAME
 
 async def check_mongodb_connection():
     """
     Verify that the MongoDB connection is working properly
-    This is a separate function from the main app to diagnose connection issues
+    Uses the app's own client, so the check also opens the first pooled connection
+    instead of a throwaway client of its own
     """
     try:
         mongo_uri = os.environ.get("MONGO_URI")
@@ -17,29 +17,21 @@ async def check_mongodb_connection():
         
         print(f"Testing MongoDB connection...")
         
-        # Create client with TLS/SSL options
-        client = AsyncIOMotorClient(
-            mongo_uri,
-            serverSelectionTimeoutMS=10000,
-            connectTimeoutMS=10000,
-            ssl=True,
-            ssl_cert_reqs=ssl.CERT_NONE,
-            tls=True,
-            tlsAllowInvalidCertificates=True
-        )
+        client = get_client()
+        if client is None:
+            raise Exception("Database connection not established")
         
         # Force a connection to verify it works
         await client.admin.command('ping')
         
-        # Get server info
-        server_info = await client.admin.command('serverStatus')
+        # Get server info (buildInfo needs no special privileges, unlike serverStatus)
+        server_info = await client.server_info()
         version = server_info.get('version', 'unknown')
         
         print(f"✅ MongoDB connection successful!")
         print(f"   Server version: {version}")
-        print(f"   Database: {client.get_default_database().name}")
+        print(f"   Database: {DATABASE_NAME}")
         
-        await client.close()
         return True
     except Exception as e:
         print(f"❌ MongoDB connection error: {str(e)}")
@@ -0,0 +1,89 @@
+from collections import Counter
+from typing import Dict, Iterable, List
+
+# Structural summary of a patient's responses: how many responses there are per card,
+# by location (W / D / Dd), form quality, developmental quality, determinant, content
+# and special score. It is stored in the patient document (`summary`) and kept current
+# by every write: whole-record writes store a freshly built summary, and per-card or
+# per-entry writes apply the difference between the old and new entries as $inc
+# counter updates, so serving it never needs the entries.
+
+# Bucket counted for entries without a location, fq or dq
+UNSCORED = "none"
+
+def location_category(location: str) -> str:
+    """Group a location code into W, D or Dd (e.g. D1 -> D, DdS -> Dd, WS -> W)."""
+    location = location.strip()
+    if not location:
+        return UNSCORED
+    if location.startswith("W"):
+        return "W"
+    if location.startswith("Dd"):
+        return "Dd"
+    if location.startswith("D"):
+        return "D"
+    return "other"
+
+def summary_key(code: str) -> str:
+    """Make a scoring code usable as a document field name."""
+    code = code.strip().replace(".", "_")
+    if code.startswith("$"):
+        code = "_" + code[1:]
+    return code or UNSCORED
+
+def entry_counts(entry: Dict, image_number: int) -> Counter:
+    """Get the summary counters (as dotted paths) one entry adds to."""
+    counts = Counter({
+        "total_responses": 1,
+        f"per_card.{image_number}": 1,
+        f"location.{location_category(entry.get('location') or '')}": 1,
+        f"fq.{summary_key(entry.get('fq') or '')}": 1,
+        f"dq.{summary_key(entry.get('dq') or '')}": 1
+    })
+    for field, group in (("determinants", "determinants"), ("content", "content"), ("special_score", "special_scores")):
+        for code in entry.get(field) or []:
+            if code.strip():
+                counts[f"{group}.{summary_key(code)}"] += 1
+    return counts
+
+def entries_counts(entries: Iterable[Dict], image_number: int) -> Counter:
+    counts = Counter()
+    for entry in entries:
+        counts.update(entry_counts(entry, image_number))
+    return counts
+
+def build_summary(responses: List[Dict]) -> Dict:
+    """Build the summary of a whole set of responses."""
+    counts = Counter()
+    for card in responses:
+        counts.update(entries_counts(card.get("entries") or [], card["image_number"]))
+
+    summary: Dict = {
+        "total_responses": counts.pop("total_responses", 0),
+        "per_card": {}, "location": {}, "fq": {}, "dq": {},
+        "determinants": {}, "content": {}, "special_scores": {}
+    }
+    for path, count in counts.items():
+        group, key = path.split(".", 1)
+        summary[group][key] = count
+    return summary
+
+def summary_increments(old_entries: Iterable[Dict], new_entries: Iterable[Dict], image_number: int) -> Dict[str, int]:
+    """
+    Get the $inc update that turns the summary of old_entries into that of new_entries.
+
+    Returns:
+        Non-zero counter changes keyed by their path in the patient document
+    """
+    delta = entries_counts(new_entries, image_number)
+    delta.subtract(entries_counts(old_entries, image_number))
+    return {f"summary.{path}": change for path, change in delta.items() if change}
+
+def present_summary(summary: Dict) -> Dict:
+    """Drop the counters that dropped back to zero and add the number of cards with responses."""
+    presented = {
+        group: {key: count for key, count in counts.items() if count} if isinstance(counts, dict) else counts
+        for group, counts in summary.items()
+    }
+    presented["cards_with_responses"] = len(presented.get("per_card", {}))
+    return presented
@@ -3,7 +3,8 @@ import json
 from datetime import datetime
 from bson import ObjectId
 
-from .db import get_all_patients, db
+from .db import has_patients, get_database, patient_changed
+from .summary import build_summary
 
 # Sample test patient data
 test_patients = [
@@ -102,25 +103,45 @@ test_patients = [
     }
 ]
 
-async def add_test_data():
-    """Add test data to MongoDB if the database is empty."""
-    # Check if we already have patients
-    patients = await get_all_patients()
+async def add_test_data() -> bool:
+    """
+    Add test data to MongoDB if the database is empty.
     
-    if len(patients) == 0:
-        print("Adding test patients to MongoDB...")
-        
-        for patient in test_patients:
-            try:
-                # Insert into MongoDB directly
-                await db.patients.insert_one(patient)
-                print(f"Added patient {patient['name']} with ID {patient['patient_id']}")
-            except Exception as e:
-                print(f"Error adding test patient: {str(e)}")
-        
-        print("Test data added successfully!")
-    else:
-        print(f"Database already has {len(patients)} patients. Skipping test data.")
+    Returns:
+        True if the test data was added or the database already had patients
+    """
+    # Check if we already have patients (reads at most one document)
+    try:
+        if await has_patients():
+            print("Database already has patients. Skipping test data.")
+            return True
+    except Exception as e:
+        print(f"Error checking for existing patients: {str(e)}")
+        return False
+    
+    print("Adding test patients to MongoDB...")
+    db = get_database()
+    
+    try:
+        # One round trip; unordered so a patient added concurrently by another worker doesn't stop
+        # the rest. That relies on the unique patient_id index, which the warm-up creates first.
+        await db.patients.insert_many(
+            [
+                {**patient, "summary": build_summary(patient["responses"]), "updated_at": patient["created_at"]}
+                for patient in test_patients
+            ],
+            ordered=False
+        )
+    except Exception as e:
+        print(f"Error adding test patients: {str(e)}")
+        return False
+    
+    for patient in test_patients:
+        # Bypasses insert_patient, so tell the patient caches here
+        await patient_changed(patient["patient_id"])
+        print(f"Added patient {patient['name']} with ID {patient['patient_id']}")
+    print("Test data added successfully!")
+    return True
 
 if __name__ == "__main__":
     # Run the function to add test data
@@ -0,0 +1,102 @@
+import os
+import zlib
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+# Alternative matching engine: every text becomes a sparse vector of hashed character
+# n-gram TF-IDF weights, so a batch of queries is scored against a whole table with one
+# sparse matrix product instead of one fuzzy comparison per (query, row) pair.
+
+TFIDF_NGRAM_SIZE = 3
+# Width of the hashed feature space; collisions only blur similarities slightly
+TFIDF_FEATURES = int(os.environ.get("TFIDF_FEATURES", 2 ** 18))
+
+def text_ngrams(text: str, size: int = TFIDF_NGRAM_SIZE) -> List[str]:
+    """Get the character n-grams of a normalized text, padded so word edges count too."""
+    padded = f" {text} "
+    return [padded[start:start + size] for start in range(len(padded) - size + 1)]
+
+def hash_feature(gram: str, features: int = TFIDF_FEATURES) -> int:
+    """Map an n-gram to its feature column (crc32 is stable across processes, unlike hash())."""
+    return zlib.crc32(gram.encode('utf-8')) % features
+
+class TfidfIndex:
+    """L2-normalized TF-IDF matrix of the texts of one reference table."""
+
+    def __init__(self, texts: Sequence[str], features: int = TFIDF_FEATURES):
+        """
+        Args:
+            texts: The normalized texts of the table
+            features: Width of the hashed feature space
+        """
+        self.features = features
+        counts = self._count_matrix(texts)
+
+        # Smoothed idf, as if one extra document contained every n-gram
+        document_frequency = np.bincount(counts.indices, minlength=features)
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        # Stored transposed (features x rows) so scoring is queries @ matrix
+        self.matrix = self._weigh(counts).T.tocsr()
+
+    def __len__(self) -> int:
+        return self.matrix.shape[1]
+
+    def _count_matrix(self, texts: Sequence[str]) -> sparse.csr_matrix:
+        """Count the hashed n-grams of each text, one row per text."""
+        indptr = [0]
+        indices: List[int] = []
+        for text in texts:
+            indices.extend(hash_feature(gram, self.features) for gram in text_ngrams(text))
+            indptr.append(len(indices))
+
+        counts = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(texts), self.features)
+        )
+        counts.sum_duplicates()
+        return counts
+
+    def _weigh(self, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+        """Turn n-gram counts into L2-normalized sublinear TF-IDF weights."""
+        weights = counts.copy()
+        weights.data = (1 + np.log(weights.data)) * self.idf[weights.indices]
+
+        norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / norms) @ weights, dtype=np.float32)
+
+    def vectorize(self, queries: Sequence[str]) -> sparse.csr_matrix:
+        """Get the TF-IDF vectors of normalized query texts, one row per query."""
+        return self._weigh(self._count_matrix(queries))
+
+    def top_candidates(self, queries: Sequence[str], limit: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Score a batch of queries against every row with one sparse matrix product.
+
+        Args:
+            queries: The normalized query texts
+            limit: Maximum number of candidates to keep per query
+
+        Returns:
+            One (rows, similarities) pair of arrays per query, best first
+            (ties in row order); rows sharing no n-gram with the query are left out
+        """
+        scores = (self.vectorize(queries) @ self.matrix).tocsr()
+
+        candidates = []
+        for query_index in range(scores.shape[0]):
+            start, end = scores.indptr[query_index], scores.indptr[query_index + 1]
+            rows = scores.indices[start:end]
+            similarities = scores.data[start:end]
+
+            if len(rows) > limit:
+                top = np.argpartition(similarities, -limit)[-limit:]
+                rows, similarities = rows[top], similarities[top]
+
+            order = np.lexsort((rows, -similarities))
+            candidates.append((rows[order], similarities[order]))
+
+        return candidates
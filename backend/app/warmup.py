@@ -0,0 +1,145 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+
+from .db import get_database, create_indexes, warm_pool, ensure_cohort_rollups, MONGO_MIN_POOL_SIZE
+from .test_data import add_test_data
+
+# Database warm-up. In the default "background" startup mode the server takes requests
+# as soon as the reference data is loaded: /, /analyze-response and the other matching
+# endpoints don't need the database. The warm-up pings the database until it answers,
+# then creates the indexes, seeds the test data (and builds the cohort rollups if they
+# were never built) and opens the minimum number of pooled connections concurrently. Until the first ping succeeds, database endpoints answer
+# 503 and /ready reports not ready.
+# "blocking" mode waits for the first warm-up attempt before serving, as startup used to.
+
+STARTUP_MODES = ('background', 'blocking')
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background")
+# Seconds between database pings while the database isn't reachable
+READY_RETRY_INTERVAL = float(os.environ.get("READY_RETRY_INTERVAL", 5))
+# Seconds each ping may take
+READY_PING_TIMEOUT = float(os.environ.get("READY_PING_TIMEOUT", 5))
+
+class DatabaseWarmup:
+    """Background task that waits for the database, then creates indexes, seeds test data and fills the pool."""
+
+    def __init__(
+        self,
+        mode: str = STARTUP_MODE,
+        retry_interval: float = READY_RETRY_INTERVAL,
+        ping_timeout: float = READY_PING_TIMEOUT
+    ):
+        """
+        Args:
+            mode: "background" to serve right away, "blocking" to wait for the first attempt
+            retry_interval: Seconds between pings while the database isn't reachable
+            ping_timeout: Seconds each ping may take
+        """
+        if mode not in STARTUP_MODES:
+            raise ValueError(f"Unknown startup mode {mode!r}, expected one of {', '.join(STARTUP_MODES)}")
+        self.mode = mode
+        self.retry_interval = retry_interval
+        self.ping_timeout = ping_timeout
+        self.database_ready = False
+        self.indexes_created: Optional[bool] = None
+        self.test_data_added: Optional[bool] = None
+        self.cohort_rollups_ready: Optional[bool] = None
+        self.pool_connections: Optional[int] = None
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+        self.ready_after: Optional[float] = None
+        self._started_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._first_attempt: Optional[asyncio.Event] = None
+
+    async def ping(self) -> None:
+        """Ping the database through the app's own client."""
+        db = get_database()
+        if db is None:
+            raise Exception("Database connection not established")
+        await asyncio.wait_for(db.command("ping"), self.ping_timeout)
+
+    async def warm_pool(self) -> None:
+        """Open the minimum number of pooled connections before requests need them."""
+        try:
+            self.pool_connections = await warm_pool(MONGO_MIN_POOL_SIZE)
+        except Exception as e:
+            print(f"⚠️ Could not warm up the connection pool: {str(e)}")
+
+    async def add_data(self) -> None:
+        """
+        Create the indexes, then add the test data and build the cohort rollups if they don't exist yet.
+        
+        The test data is only seeded once the unique patient_id index exists: workers
+        starting together can all find the collection empty, and only the index keeps
+        their inserts from creating duplicate patients.
+        """
+        self.indexes_created = await create_indexes()
+        if self.indexes_created:
+            self.test_data_added = await add_test_data()
+        else:
+            print("⚠️ Skipping test data, the patient_id index could not be created")
+        self.cohort_rollups_ready = await ensure_cohort_rollups()
+
+    async def run(self) -> None:
+        """Ping the database until it answers, then create the indexes, add the test data and warm the pool."""
+        while True:
+            self.attempts += 1
+            try:
+                await self.ping()
+                break
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                print(f"⚠️ Database not reachable yet (attempt {self.attempts}): {self.last_error}")
+                self._first_attempt.set()
+                await asyncio.sleep(self.retry_interval)
+
+        self.database_ready = True
+        self.last_error = None
+        self.ready_after = time.monotonic() - self._started_at
+        print(f"✅ Database ready after {self.ready_after:.1f}s")
+
+        # Only the pool warm-up runs alongside; the data setup is ordered after the indexes
+        await asyncio.gather(self.add_data(), self.warm_pool())
+        self._first_attempt.set()
+        print("✅ Application initialization complete!")
+
+    async def start(self) -> None:
+        """Start the warm-up; in blocking mode, return once its first attempt is over."""
+        if self._task is not None:
+            return
+        self._started_at = time.monotonic()
+        self._first_attempt = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+        if self.mode == 'blocking':
+            await self._first_attempt.wait()
+            if not self.database_ready:
+                print("⚠️ Warning: MongoDB connection check failed, retrying in the background...")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_status(self) -> Dict:
+        """Get whether the database is usable and how far the warm-up got."""
+        return {
+            'ready': self.database_ready,
+            'startup_mode': self.mode,
+            'database': {
+                'ready': self.database_ready,
+                'attempts': self.attempts,
+                'last_error': self.last_error,
+                'ready_after_s': self.ready_after
+            },
+            'indexes_created': self.indexes_created,
+            'test_data_added': self.test_data_added,
+            'cohort_rollups_ready': self.cohort_rollups_ready,
+            'pool_connections': self.pool_connections
+        }
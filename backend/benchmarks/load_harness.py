@@ -0,0 +1,385 @@
+"""
+API load harness.
+
+Drives the API with a scripted mix of /analyze-response, /submit-patient,
+/patients, /patient/{id} and PUT /patient/{id}/responses requests from a number
+of concurrent clients, then reports requests/sec and p50/p90/p99 latency per
+endpoint, plus the match cache and pool counters of the server.
+
+By default the app runs in-process (ASGI, no sockets) against an in-memory
+stand-in for MongoDB, so no database server is needed; --db-latency-ms adds a
+simulated round trip to every database operation. The load generator then shares
+the event loop with the app, so absolute numbers are lower than what a separate
+server reaches. With --url the same mix is sent to a running server instead (e.g.
+`python run.py` in development or production mode) to compare server modes; its
+records are written to whatever database that server uses.
+
+Run from the backend directory:
+    python -m benchmarks.load_harness                                  # in-process, in-memory database
+    python -m benchmarks.load_harness --concurrency 64 --duration 30
+    python -m benchmarks.load_harness --mix analyze=1 --unique-ratio 1  # only uncached analysis
+    python -m benchmarks.load_harness --db-latency-ms 2                 # simulate a remote database
+    python -m benchmarks.load_harness --url http://127.0.0.1:8000      # a running server
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from .match_benchmark import percentile_ms
+from .memory_db import MemoryDatabase
+
+# Scripted operations and the endpoint each one calls
+ENDPOINTS = {
+    'analyze': 'POST /analyze-response',
+    'submit': 'POST /submit-patient',
+    'list': 'GET /patients',
+    'get': 'GET /patient/{id}',
+    'summary': 'GET /patient/{id}/summary',
+    'update': 'PUT /patient/{id}/responses'
+}
+DEFAULT_MIX = "analyze=50,get=20,list=10,submit=10,update=10"
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_DURATION = 10.0
+DEFAULT_PATIENTS = 50
+DEFAULT_SEED = 7
+REQUEST_TIMEOUT = 60.0
+
+# Typical responses; unique texts get a random extra word so they miss the match cache
+RESPONSE_TEXTS = (
+    "A bat flying in the air", "Two people dancing", "A butterfly", "A human figure",
+    "Two bears climbing", "A pair of lungs", "A person wearing a mask", "Two animals fighting",
+    "A fox head", "A creature with wings", "moth", "an insect", "a spider",
+    "two women talking", "a map", "something I can't name"
+)
+POSITIONS = ('^', '<', '>', 'v')
+DETERMINANTS = ('F', 'M', 'FC', 'CF', 'FM', 'C')
+CONTENTS = ('A', 'H', 'Ad', 'Hd', 'Bt', 'Cg')
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """Parse an "operation=weight,..." mix into operation weights."""
+    weights = {}
+    for part in mix.split(","):
+        if not part.strip():
+            continue
+        operation, _, weight = part.partition("=")
+        operation = operation.strip()
+        if operation not in ENDPOINTS:
+            raise ValueError(f"Unknown operation {operation!r}, expected one of {', '.join(ENDPOINTS)}")
+        weights[operation] = float(weight or 1)
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError("The mix needs at least one operation with a positive weight")
+    return weights
+
+class LoadScript:
+    """Generates the requests of a load run and tracks the patients it created."""
+
+    def __init__(self, mix: Dict[str, float], unique_ratio: float, run_id: str):
+        """
+        Args:
+            mix: Relative weight of each operation
+            unique_ratio: Share of analyzed texts made unique, so they can't be served from a cache
+            run_id: Prefix of the IDs of the patients submitted by this run
+        """
+        self.operations = list(mix)
+        self.weights = [mix[operation] for operation in self.operations]
+        self.unique_ratio = unique_ratio
+        self.run_id = run_id
+        self.patient_ids: List[str] = []
+        self._submitted = 0
+
+    def response_text(self, rng: random.Random) -> str:
+        text = rng.choice(RESPONSE_TEXTS)
+        if rng.random() < self.unique_ratio:
+            text = f"{text} {uuid.UUID(int=rng.getrandbits(128)).hex[:8]}"
+        return text
+
+    def responses(self, rng: random.Random) -> List[Dict]:
+        """Generate the responses to all ten cards, with one to three entries each."""
+        return [
+            {
+                'image_number': image_number,
+                'entries': [
+                    {
+                        'position': rng.choice(POSITIONS),
+                        'response_text': self.response_text(rng),
+                        'determinants': [rng.choice(DETERMINANTS)],
+                        'content': [rng.choice(CONTENTS)],
+                        'dq': rng.choice(('o', '+', 'v')),
+                        'z_score': "",
+                        'special_score': []
+                    }
+                    for _ in range(rng.randint(1, 3))
+                ]
+            }
+            for image_number in range(1, 11)
+        ]
+
+    def new_patient(self, rng: random.Random) -> Dict:
+        self._submitted += 1
+        return {
+            'patient_id': f"LOAD-{self.run_id}-{self._submitted}",
+            'name': f"Load Test {self._submitted}",
+            'age': rng.randint(18, 80),
+            'gender': rng.choice(('Male', 'Female')),
+            'examiner_name': "Load Harness",
+            'responses': self.responses(rng)
+        }
+
+    def next_request(self, rng: random.Random) -> Tuple[str, str, str, Optional[object]]:
+        """
+        Pick the next request of the mix.
+
+        Returns:
+            (operation, method, path, JSON body or None)
+        """
+        operation = rng.choices(self.operations, self.weights)[0]
+        if operation in ('get', 'summary', 'update') and not self.patient_ids:
+            operation = 'submit'
+
+        if operation == 'analyze':
+            body = {'response_text': self.response_text(rng), 'image_id': rng.randint(1, 10)}
+            return operation, 'POST', '/analyze-response', body
+        if operation == 'submit':
+            return operation, 'POST', '/submit-patient', self.new_patient(rng)
+        if operation == 'list':
+            return operation, 'GET', '/patients', None
+
+        patient_id = rng.choice(self.patient_ids)
+        if operation == 'get':
+            return operation, 'GET', f'/patient/{patient_id}', None
+        if operation == 'summary':
+            return operation, 'GET', f'/patient/{patient_id}/summary', None
+        return operation, 'PUT', f'/patient/{patient_id}/responses', self.responses(rng)
+
+class LoadStats:
+    """Latencies and status codes recorded per operation."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {operation: [] for operation in ENDPOINTS}
+        self.statuses: Dict[str, Counter] = {operation: Counter() for operation in ENDPOINTS}
+
+    def record(self, operation: str, status: str, latency: float) -> None:
+        self.latencies[operation].append(latency)
+        self.statuses[operation][status] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Dict]:
+        """Get requests, errors, requests/sec and latency percentiles per endpoint and in total."""
+        summary = {}
+        rows = [(ENDPOINTS[operation], operation) for operation in ENDPOINTS if self.latencies[operation]]
+        rows.append(('total', None))
+        for label, operation in rows:
+            operations = [operation] if operation else list(ENDPOINTS)
+            latencies = [latency for name in operations for latency in self.latencies[name]]
+            if not latencies:
+                continue
+            statuses = Counter()
+            for name in operations:
+                statuses.update(self.statuses[name])
+            summary[label] = {
+                'requests': len(latencies),
+                'errors': sum(count for status, count in statuses.items() if not status.startswith('2')),
+                'rps': len(latencies) / elapsed,
+                'p50_ms': percentile_ms(latencies, 50),
+                'p90_ms': percentile_ms(latencies, 90),
+                'p99_ms': percentile_ms(latencies, 99),
+                'max_ms': max(latencies) * 1000,
+                'statuses': dict(statuses)
+            }
+        return summary
+
+async def send(client: httpx.AsyncClient, script: LoadScript, rng: random.Random, stats: Optional[LoadStats]) -> None:
+    """Send one scripted request and record its latency and status."""
+    operation, method, path, body = script.next_request(rng)
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, path, json=body)
+        status = str(response.status_code)
+    except httpx.HTTPError as e:
+        response = None
+        status = type(e).__name__
+    latency = time.perf_counter() - started
+
+    if stats is not None:
+        stats.record(operation, status, latency)
+    if operation == 'submit' and response is not None and response.status_code == 200:
+        script.patient_ids.append(body['patient_id'])
+
+async def run_clients(
+    client: httpx.AsyncClient,
+    script: LoadScript,
+    concurrency: int,
+    duration: float,
+    max_requests: int,
+    seed: int
+) -> Tuple[LoadStats, float]:
+    """
+    Run concurrent closed-loop clients until the duration or the request budget runs out.
+
+    Returns:
+        The recorded stats and the elapsed wall time in seconds
+    """
+    stats = LoadStats()
+    deadline = time.perf_counter() + duration
+    budget = {'left': max_requests or -1}
+
+    async def client_loop(index: int) -> None:
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < deadline and budget['left'] != 0:
+            budget['left'] -= 1
+            await send(client, script, rng, stats)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop(index) for index in range(concurrency)))
+    return stats, time.perf_counter() - started
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float) -> None:
+    """Poll /ready until the server's database is usable."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        response = await client.get('/ready')
+        if response.status_code == 200:
+            return
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"Server not ready after {timeout:g}s: {response.text[:200]}")
+        await asyncio.sleep(0.1)
+
+def install_memory_database(db_latency_ms: float) -> MemoryDatabase:
+    """Point the app's database accessors at an in-memory stand-in (before the app is imported)."""
+    # Without MONGO_URI the startup connection check returns right away
+    os.environ.pop("MONGO_URI", None)
+    from app import db, test_data
+
+    database = MemoryDatabase(latency_ms=db_latency_ms)
+    db.get_database = lambda: database
+    test_data.get_database = db.get_database
+    return database
+
+async def run_load(args) -> Dict:
+    mix = parse_mix(args.mix)
+    script = LoadScript(mix, args.unique_ratio, args.run_id or uuid.uuid4().hex[:8])
+    timeout = httpx.Timeout(REQUEST_TIMEOUT)
+
+    app = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=timeout,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+        target = args.url
+    else:
+        install_memory_database(args.db_latency_ms)
+        from app.main import app
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load-harness", timeout=timeout)
+        target = f"in-process app, in-memory database ({args.db_latency_ms:g} ms simulated latency)"
+
+    try:
+        print(f"Target: {target}")
+        await wait_until_ready(client, args.ready_timeout)
+        print(f"Seeding {args.patients} patients...")
+        seed_rng = random.Random(args.seed)
+        for _ in range(args.patients):
+            patient = script.new_patient(seed_rng)
+            response = await client.post('/submit-patient', json=patient)
+            if response.status_code != 200:
+                raise RuntimeError(f"Seeding failed with {response.status_code}: {response.text[:200]}")
+            script.patient_ids.append(patient['patient_id'])
+
+        if args.warmup:
+            print(f"Warming up for {args.warmup:g}s...")
+            await run_clients(client, script, args.concurrency, args.warmup, 0, args.seed + 1)
+
+        print(f"Running {args.mix} with {args.concurrency} clients for "
+              f"{f'{args.requests} requests' if args.requests else f'{args.duration:g}s'}...")
+        duration = float('inf') if args.requests else args.duration
+        stats, elapsed = await run_clients(client, script, args.concurrency, duration, args.requests, args.seed)
+
+        match_stats = None
+        response = await client.get('/match-stats')
+        if response.status_code == 200:
+            match_stats = response.json()
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+
+    return {
+        'config': {
+            'target': args.url or 'in-process',
+            'mix': mix,
+            'concurrency': args.concurrency,
+            'unique_ratio': args.unique_ratio,
+            'db_latency_ms': None if args.url else args.db_latency_ms,
+            'patients': args.patients,
+            'seed': args.seed
+        },
+        'elapsed_s': elapsed,
+        'endpoints': stats.summary(elapsed),
+        'server': {
+            'cache': match_stats.get('cache'),
+            'pool': match_stats.get('pool')
+        } if match_stats else None
+    }
+
+def print_report(report: Dict) -> None:
+    columns = ('requests', 'errors', 'rps', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms')
+    print("endpoint".ljust(30) + "".join(column.rjust(11) for column in columns))
+    for label, metrics in report['endpoints'].items():
+        print(label.ljust(30) + "".join(f"{metrics[column]:11.4g}" for column in columns))
+        errors = {status: count for status, count in metrics['statuses'].items() if not status.startswith('2')}
+        if errors and label != 'total':
+            print(" " * 32 + "errors: " + ", ".join(f"{status} x{count}" for status, count in errors.items()))
+
+    server = report.get('server')
+    if server and server.get('cache'):
+        cache = server['cache']
+        print(f"\nMatch cache: {cache['hits']} hits, {cache['misses']} misses (hit rate {cache['hit_rate']:.1%})")
+    if server and server.get('pool'):
+        print(f"Match pool: {json.dumps(server['pool'])}")
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Load-test the API with a scripted request mix")
+    arg_parser.add_argument("--url", help="Base URL of a running server (default: run the app in-process)")
+    arg_parser.add_argument("--mix", default=DEFAULT_MIX,
+                            help=f"Weighted operations, from {', '.join(ENDPOINTS)} (default: {DEFAULT_MIX})")
+    arg_parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Concurrent clients")
+    arg_parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="Seconds to run the mix")
+    arg_parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests (0: run for --duration)")
+    arg_parser.add_argument("--warmup", type=float, default=1.0, help="Seconds of unmeasured load before the run")
+    arg_parser.add_argument("--patients", type=int, default=DEFAULT_PATIENTS, help="Patients submitted before the run")
+    arg_parser.add_argument("--unique-ratio", type=float, default=0.2,
+                            help="Share of response texts made unique so they miss the match cache")
+    arg_parser.add_argument("--db-latency-ms", type=float, default=0.0,
+                            help="Simulated round trip per operation of the in-memory database")
+    arg_parser.add_argument("--ready-timeout", type=float, default=60.0, help="Seconds to wait for /ready before the run")
+    arg_parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    arg_parser.add_argument("--run-id", help="Prefix of the submitted patient IDs (default: random)")
+    arg_parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        report = asyncio.run(run_load(args))
+    except (ValueError, RuntimeError, httpx.HTTPError) as e:
+        print(f"❌ {str(e)}")
+        return 1
+
+    print()
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    failed = report['endpoints'].get('total', {}).get('errors', 0)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,425 @@
+"""
+Response matcher benchmark suite.
+
+Generates synthetic reference tables (100 up to 1M rows per card) and a labeled query
+corpus with typos, reorderings, dropped words and filler, then measures:
+  - p50/p99 latency and throughput of single, batch and cached analysis
+  - memory used by the loaded tables and indexes
+  - recall and false matches of the matcher against the labeled queries
+  - a scorer / score cutoff sweep (the MATCH_SCORE_CUTOFF of 70 included)
+  - optionally, how often the candidate index shortlist finds the same row as the
+    exhaustive scan, and what each costs per query
+
+Results can be stored as a baseline and later runs checked against it; the check
+exits non-zero when a metric regresses beyond the allowed tolerance.
+
+Run from the backend directory:
+    python -m benchmarks.match_benchmark                          # default sizes
+    python -m benchmarks.match_benchmark --sizes 100,1000000      # up to 1M rows
+    python -m benchmarks.match_benchmark --check                  # compare with baseline.json
+    python -m benchmarks.match_benchmark --save-baseline          # store a new baseline
+    python -m benchmarks.match_benchmark --compare-index          # candidate index vs exhaustive scan
+"""
+
+import argparse
+import csv
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from app.match_cache import MatchCache
+from app.normalization import normalize_text
+from app.pdf_parser import MATCH_SCORE_CUTOFF, ResponseAnalyzer
+
+BASELINE_PATH = Path(__file__).parent / 'baseline.json'
+
+DEFAULT_SIZES = (100, 1000, 10000)
+DEFAULT_QUERIES = 200
+DEFAULT_SEED = 7
+DEFAULT_REPEAT = 5
+
+# Card the synthetic rows are generated for
+BENCHMARK_IMAGE_ID = 1
+
+LOCATIONS = ('W', 'D1', 'D2', 'D3', 'D4', 'D5', 'D6', 'D7', 'Dd', 'S')
+FQS = ('o', 'u', '-', '+')
+
+# Reference words and negative-query words come from disjoint syllables, so
+# negative queries should never match
+REFERENCE_SYLLABLES = ('ba', 'ke', 'lo', 'mi', 'nu', 'ra', 'ti', 'vo', 'sel', 'dar', 'fen', 'gor', 'pim', 'tus')
+NEGATIVE_SYLLABLES = ('qy', 'zx', 'jw', 'xo', 'qua', 'zyl', 'jix', 'wyq')
+
+# Reference vocabulary size: grows with the table, up to VOCABULARY_SIZE words
+VOCABULARY_SIZE = 5000
+MIN_VOCABULARY_SIZE = 200
+
+PERTURBATIONS = ('exact', 'case', 'typo', 'reorder', 'drop', 'filler')
+
+SWEEP_SCORERS = {
+    'ratio': fuzz.ratio,
+    'token_sort_ratio': fuzz.token_sort_ratio,
+    'token_set_ratio': fuzz.token_set_ratio,
+    'WRatio': fuzz.WRatio,
+    'QRatio': fuzz.QRatio
+}
+SWEEP_CUTOFFS = (50, 60, 70, 80, 90)
+
+# How a metric regresses: higher is worse, or lower is worse
+HIGHER_IS_WORSE = ('single_p50_ms', 'single_p99_ms', 'cached_p50_ms', 'batch_ms', 'memory_mb', 'false_match_rate')
+LOWER_IS_WORSE = ('single_qps', 'batch_qps', 'recall')
+# Quality metrics are compared in absolute terms, the others relative to the baseline
+ABSOLUTE_METRICS = ('recall', 'false_match_rate')
+# Latency differences below this are timer and scheduler noise, whatever their ratio
+MIN_LATENCY_DELTA_MS = 0.05
+
+def make_vocabulary(rng: random.Random, syllables: Sequence[str], size: int, max_syllables: int = 4) -> List[str]:
+    """Generate distinct pseudo-words of 1 to max_syllables syllables."""
+    possible = sum(len(syllables) ** length for length in range(1, max_syllables + 1))
+    if size > possible:
+        raise ValueError(f"Only {possible} distinct words can be made from {len(syllables)} syllables")
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(1, max_syllables))))
+    return sorted(words)
+
+def generate_rows(rng: random.Random, vocabulary: Sequence[str], rows: int) -> List[Dict[str, str]]:
+    """Generate synthetic reference rows of 1-5 words with random locations and fq values."""
+    return [
+        {
+            'image_id': str(BENCHMARK_IMAGE_ID),
+            'response_text': ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(1, 5))),
+            'location': rng.choice(LOCATIONS),
+            'fq': rng.choice(FQS)
+        }
+        for _ in range(rows)
+    ]
+
+def perturb(rng: random.Random, text: str, kind: str) -> str:
+    """Apply one kind of perturbation to a reference text."""
+    words = text.split()
+    if kind == 'case':
+        return f"A {text.title()}."
+    if kind == 'typo':
+        candidates = [i for i, word in enumerate(words) if len(word) > 3]
+        if candidates:
+            i = rng.choice(candidates)
+            position = rng.randrange(len(words[i]))
+            edit = rng.choice(('delete', 'swap', 'replace'))
+            word = words[i]
+            if edit == 'delete':
+                word = word[:position] + word[position + 1:]
+            elif edit == 'swap' and position < len(word) - 1:
+                word = word[:position] + word[position + 1] + word[position] + word[position + 2:]
+            else:
+                word = word[:position] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[position + 1:]
+            words[i] = word
+    elif kind == 'reorder':
+        rng.shuffle(words)
+    elif kind == 'drop' and len(words) >= 3:
+        del words[rng.randrange(len(words))]
+    elif kind == 'filler':
+        words = ['looks', 'like', 'a'] + words
+    return ' '.join(words)
+
+def generate_queries(
+    rng: random.Random,
+    rows: Sequence[Dict[str, str]],
+    count: int,
+    negative_share: float = 0.2
+) -> List[Tuple[str, Optional[Tuple[str, str]]]]:
+    """
+    Generate labeled queries: perturbed reference texts labeled with their row's
+    (location, fq), and unrelated texts labeled None.
+    """
+    negative_vocabulary = make_vocabulary(rng, NEGATIVE_SYLLABLES, MIN_VOCABULARY_SIZE, max_syllables=3)
+    queries = []
+    for _ in range(count):
+        if rng.random() < negative_share:
+            text = ' '.join(rng.choice(negative_vocabulary) for _ in range(rng.randint(1, 4)))
+            queries.append((text, None))
+        else:
+            row = rng.choice(rows)
+            text = perturb(rng, row['response_text'], rng.choice(PERTURBATIONS))
+            queries.append((text, (row['location'], row['fq'])))
+    return queries
+
+def write_table(rows: Sequence[Dict[str, str]], data_dir: Path) -> None:
+    with open(data_dir / 'sample_table.csv', 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['image_id', 'response_text', 'location', 'fq'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+def percentile_ms(latencies: Sequence[float], q: float) -> float:
+    return float(np.percentile(latencies, q)) * 1000 if len(latencies) else 0.0
+
+def score_results(
+    results: Sequence[Optional[Dict[str, str]]],
+    queries: Sequence[Tuple[str, Optional[Tuple[str, str]]]]
+) -> Dict[str, float]:
+    """Get the recall on positive queries and the false match rate on negative ones."""
+    positives = correct = negatives = false_matches = 0
+    for result, (_, label) in zip(results, queries):
+        if label is None:
+            negatives += 1
+            false_matches += result is not None
+        else:
+            positives += 1
+            correct += result is not None and (result['location'], result['fq']) == label
+    return {
+        'recall': correct / positives if positives else 0.0,
+        'false_match_rate': false_matches / negatives if negatives else 0.0
+    }
+
+def build_analyzer(data_dir: Path, engine: str) -> Tuple[ResponseAnalyzer, float]:
+    """Load an analyzer (cache disabled) over the synthetic table and measure the memory it holds, in MB."""
+    tracemalloc.start()
+    analyzer = ResponseAnalyzer(
+        data_dir=str(data_dir),
+        reference_source='sample',
+        use_snapshot=False,
+        cache_size=0,
+        match_engine=engine
+    )
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return analyzer, current / (1024 * 1024)
+
+def benchmark_size(size: int, query_count: int, engine: str, seed: int, repeat: int = DEFAULT_REPEAT) -> Dict[str, float]:
+    """Run the latency, throughput, memory and recall measurements on one table size."""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, REFERENCE_SYLLABLES, max(MIN_VOCABULARY_SIZE, min(size, VOCABULARY_SIZE)))
+    rows = generate_rows(rng, vocabulary, size)
+    queries = generate_queries(rng, rows, query_count)
+    texts = [text for text, _ in queries]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        write_table(rows, data_dir)
+        analyzer, memory_mb = build_analyzer(data_dir, engine)
+
+    def time_queries() -> Tuple[List[float], List[Optional[Dict[str, str]]]]:
+        latencies, results = [], []
+        for text in texts:
+            start = time.perf_counter()
+            results.append(analyzer.analyze_response(text, BENCHMARK_IMAGE_ID))
+            latencies.append(time.perf_counter() - start)
+        return latencies, results
+
+    # Every measurement is repeated and the fastest round kept, which filters out
+    # scheduler and GC noise that would otherwise make the regression check flaky
+
+    # Single analysis, cache disabled
+    rounds = [time_queries() for _ in range(repeat)]
+    latencies = np.min([round_latencies for round_latencies, _ in rounds], axis=0)
+    results = rounds[0][1]
+
+    # Batch analysis of the whole corpus in one call
+    batch_seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        batch_results = analyzer.analyze_batch(texts, BENCHMARK_IMAGE_ID)
+        batch_seconds = min(batch_seconds, time.perf_counter() - start)
+    if batch_results != results:
+        print(f"⚠️ Batch and single analysis disagree on {size} rows")
+
+    # Cached analysis: a warm-up pass fills the cache, the measured rounds hit it
+    analyzer.cache = MatchCache(maxsize=len(texts))
+    time_queries()
+    cached_latencies = np.min([time_queries()[0] for _ in range(repeat)], axis=0)
+
+    return {
+        'rows': size,
+        'queries': len(texts),
+        'single_p50_ms': percentile_ms(latencies, 50),
+        'single_p99_ms': percentile_ms(latencies, 99),
+        'single_qps': len(texts) / float(np.sum(latencies)),
+        'batch_ms': batch_seconds * 1000,
+        'batch_qps': len(texts) / batch_seconds,
+        'cached_p50_ms': percentile_ms(cached_latencies, 50),
+        'memory_mb': memory_mb,
+        **score_results(results, queries)
+    }
+
+def sweep_scorers(size: int, query_count: int, seed: int) -> List[Dict]:
+    """Measure recall and false matches of each scorer / cutoff pair on one table size."""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, REFERENCE_SYLLABLES, max(MIN_VOCABULARY_SIZE, min(size, VOCABULARY_SIZE)))
+    rows = generate_rows(rng, vocabulary, size)
+    queries = generate_queries(rng, rows, query_count)
+
+    choices = [normalize_text(row['response_text']) for row in rows]
+    normalized = [normalize_text(text) for text, _ in queries]
+
+    sweep = []
+    for name, scorer in SWEEP_SCORERS.items():
+        # Score every query once; each cutoff then just filters the best scores
+        scores = process.cdist(normalized, choices, scorer=scorer, workers=-1)
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(normalized)), best]
+        for cutoff in SWEEP_CUTOFFS:
+            results = [
+                {'location': rows[index]['location'], 'fq': rows[index]['fq']} if score >= cutoff else None
+                for index, score in zip(best, best_scores)
+            ]
+            sweep.append({
+                'scorer': name,
+                'cutoff': cutoff,
+                'current': name == 'token_set_ratio' and cutoff == MATCH_SCORE_CUTOFF,
+                **score_results(results, queries)
+            })
+    return sweep
+
+def compare_index(size: int, query_count: int, seed: int) -> Dict[str, float]:
+    """Compare the candidate index with the exhaustive scan on one table size."""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, REFERENCE_SYLLABLES, max(MIN_VOCABULARY_SIZE, min(size, VOCABULARY_SIZE)))
+    rows = generate_rows(rng, vocabulary, size)
+    queries = generate_queries(rng, rows, query_count)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        write_table(rows, data_dir)
+        analyzer, _ = build_analyzer(data_dir, 'fuzzy')
+
+    comparison = analyzer.compare_candidate_index([(text, BENCHMARK_IMAGE_ID) for text, _ in queries])
+    return {'rows': size, **comparison}
+
+def check_against_baseline(results: Dict[str, Dict], baseline: Dict, tolerance: float, quality_tolerance: float) -> List[str]:
+    """
+    Compare results with a stored baseline.
+
+    Args:
+        results: Metrics per table size of the current run
+        baseline: Stored baseline with the same layout
+        tolerance: Allowed relative slowdown of timing, throughput and memory metrics
+        quality_tolerance: Allowed absolute drop in recall (or rise in false match rate)
+
+    Returns:
+        Descriptions of the regressions found (empty if none)
+    """
+    regressions = []
+    for size, metrics in results.items():
+        expected = baseline.get(size)
+        if expected is None:
+            continue
+        for metric, value in metrics.items():
+            if metric not in expected:
+                continue
+            reference = expected[metric]
+            if metric in ABSOLUTE_METRICS:
+                limit = quality_tolerance
+                worse = (value - reference) if metric in HIGHER_IS_WORSE else (reference - value)
+            elif metric in HIGHER_IS_WORSE:
+                limit = reference * tolerance
+                if metric.endswith('_ms'):
+                    limit = max(limit, MIN_LATENCY_DELTA_MS)
+                worse = value - reference
+            elif metric in LOWER_IS_WORSE:
+                limit = reference * tolerance
+                worse = reference - value
+            else:
+                continue
+            if worse > limit:
+                regressions.append(f"{size} rows: {metric} {value:.4g} vs baseline {reference:.4g}")
+    return regressions
+
+def print_results(results: Dict[str, Dict]) -> None:
+    columns = ('single_p50_ms', 'single_p99_ms', 'single_qps', 'batch_qps', 'cached_p50_ms', 'memory_mb', 'recall', 'false_match_rate')
+    print("rows".rjust(9) + "".join(column.rjust(17) for column in columns))
+    for size, metrics in results.items():
+        print(size.rjust(9) + "".join(f"{metrics[column]:17.4g}" for column in columns))
+
+def print_sweep(sweep: Sequence[Dict]) -> None:
+    print(f"{'scorer'.ljust(18)}{'cutoff'.rjust(8)}{'recall'.rjust(10)}{'false'.rjust(10)}")
+    for entry in sweep:
+        marker = '  <- current' if entry['current'] else ''
+        print(f"{entry['scorer'].ljust(18)}{entry['cutoff']:8d}{entry['recall']:10.3f}{entry['false_match_rate']:10.3f}{marker}")
+
+def print_index_comparison(comparison: Dict[str, Dict]) -> None:
+    columns = ('samples', 'recall', 'exhaustive_ms', 'indexed_ms')
+    print("rows".rjust(9) + "".join(column.rjust(15) for column in columns))
+    for size, metrics in comparison.items():
+        print(size.rjust(9) + "".join(f"{metrics[column]:15.4g}" for column in columns))
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    arg_parser = argparse.ArgumentParser(description="Benchmark the response matcher")
+    arg_parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                            help="Comma-separated reference table sizes (rows per card)")
+    arg_parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Queries per table size")
+    arg_parser.add_argument("--engine", default="fuzzy", help="Matching engine to benchmark (fuzzy or tfidf)")
+    arg_parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    arg_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Timing rounds; the fastest is kept")
+    arg_parser.add_argument("--sweep-size", type=int, default=1000, help="Table size of the scorer sweep (0 skips it)")
+    arg_parser.add_argument("--compare-index", action="store_true",
+                            help="Also compare the candidate index with the exhaustive scan on each table size")
+    arg_parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    arg_parser.add_argument("--check", action="store_true", help="Fail if results regress against the baseline")
+    arg_parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    arg_parser.add_argument("--tolerance", type=float, default=0.5,
+                            help="Allowed relative regression of timings, throughput and memory")
+    arg_parser.add_argument("--quality-tolerance", type=float, default=0.02,
+                            help="Allowed absolute regression of recall and false match rate")
+    arg_parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = arg_parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    config = {'engine': args.engine, 'queries': args.queries, 'seed': args.seed}
+
+    results: Dict[str, Dict] = {}
+    for size in sizes:
+        print(f"Benchmarking {size} rows ({args.engine} engine, {args.queries} queries)...")
+        results[str(size)] = benchmark_size(size, args.queries, args.engine, args.seed, args.repeat)
+
+    print()
+    print_results(results)
+
+    report = {'config': config, 'results': results}
+    if args.sweep_size:
+        print(f"\nScorer sweep on {args.sweep_size} rows:")
+        report['sweep'] = sweep_scorers(args.sweep_size, args.queries, args.seed)
+        print_sweep(report['sweep'])
+
+    if args.compare_index:
+        print("\nCandidate index vs exhaustive scan (recall = share of queries resolving to the same row):")
+        report['candidate_index'] = {
+            str(size): compare_index(size, args.queries, args.seed) for size in sizes
+        }
+        print_index_comparison(report['candidate_index'])
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    baseline_path = Path(args.baseline)
+    status = 0
+    if args.check:
+        if not baseline_path.exists():
+            print(f"❌ No baseline found at {baseline_path}")
+            return 1
+        baseline = json.loads(baseline_path.read_text())
+        if baseline.get('config') != config:
+            print(f"⚠️ Baseline was recorded with {baseline.get('config')}, comparing anyway")
+        regressions = check_against_baseline(results, baseline['results'], args.tolerance, args.quality_tolerance)
+        if regressions:
+            print("\n❌ Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            status = 1
+        else:
+            print("\n✅ No regressions against the baseline")
+
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps({'config': config, 'results': results}, indent=2) + "\n")
+        print(f"Baseline written to {baseline_path}")
+
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,509 @@
+"""
+In-memory stand-in for the MongoDB database used by the app.
+
+Implements the subset of the Motor API the app calls (ping, insert_one/many,
+find_one, find with projection/sort/skip/limit, update_one and find_one_and_update
+with $set/$setOnInsert/$unset/$inc/$push/$pull, array filters and upserts, bulk_write
+of UpdateOne requests, count_documents, create_index, drop, rename; $elemMatch
+and $filter projections), so the API can be load-tested without a MongoDB server. Documents are copied on the way in and out, like they would be
+(de)serialized by the driver, and an optional per-operation delay stands in for the
+network round trip to the database.
+"""
+
+import asyncio
+import copy
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+def get_field(document: Dict, path: str) -> Any:
+    """Get a (dotted) field of a document, or None if it is missing."""
+    value: Any = document
+    for part in path.split('.'):
+        if isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else None
+        elif isinstance(value, dict):
+            value = value.get(part)
+        else:
+            return None
+    return value
+
+def set_field(document: Dict, path: str, value: Any) -> None:
+    """Set a (dotted) field of a document, creating missing sub-documents."""
+    parts = path.split('.')
+    target: Any = document
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+        else:
+            target = target.setdefault(part, {})
+    if isinstance(target, list):
+        target[int(parts[-1])] = value
+    else:
+        target[parts[-1]] = value
+
+def sort_key(value: Any) -> Tuple[bool, Any]:
+    return (value is not None, value)
+
+def get_values(value: Any, parts: List[str]) -> List[Any]:
+    """Get every value a (dotted) query path reaches, descending into arrays like MongoDB does."""
+    if not parts:
+        return [value]
+    part, rest = parts[0], parts[1:]
+    if isinstance(value, list):
+        if part.isdigit():
+            index = int(part)
+            return get_values(value[index], rest) if index < len(value) else []
+        return [found for item in value for found in get_values(item, parts)]
+    if isinstance(value, dict) and part in value:
+        return get_values(value[part], rest)
+    return []
+
+def equals(values: List[Any], operand: Any) -> bool:
+    """Check whether a field equals a value, or is an array containing it (a missing field equals None)."""
+    if not values:
+        return operand is None
+    return any(value == operand or isinstance(value, list) and operand in value for value in values)
+
+def compare(operator: str, values: List[Any], operand: Any) -> bool:
+    """Evaluate one query operator against the values a field path reaches."""
+    if operator == '$eq':
+        return equals(values, operand)
+    if operator == '$ne':
+        return not equals(values, operand)
+    if operator == '$in':
+        return any(equals(values, item) for item in operand)
+    if operator == '$nin':
+        return not any(equals(values, item) for item in operand)
+    if operator == '$exists':
+        return bool(values) == bool(operand)
+    if operator == '$elemMatch':
+        return any(
+            isinstance(value, list) and any(isinstance(item, dict) and matches(item, operand) for item in value)
+            for value in values
+        )
+
+    scalars = [value for value in values if value is not None and not isinstance(value, list)]
+    if operator == '$gt':
+        return any(value > operand for value in scalars)
+    if operator == '$gte':
+        return any(value >= operand for value in scalars)
+    if operator == '$lt':
+        return any(value < operand for value in scalars)
+    if operator == '$lte':
+        return any(value <= operand for value in scalars)
+    raise NotImplementedError(f"Query operator {operator} is not supported by the stand-in")
+
+def matches(document: Dict, query: Optional[Dict]) -> bool:
+    """Check whether a document matches a MongoDB query filter."""
+    for key, condition in (query or {}).items():
+        if key == '$or':
+            if not any(matches(document, clause) for clause in condition):
+                return False
+            continue
+        if key == '$and':
+            if not all(matches(document, clause) for clause in condition):
+                return False
+            continue
+
+        values = get_values(document, key.split('.'))
+        if isinstance(condition, dict) and condition and all(operator.startswith('$') for operator in condition):
+            if not all(compare(operator, values, operand) for operator, operand in condition.items()):
+                return False
+        elif not equals(values, condition):
+            return False
+    return True
+
+def update_targets(value: Any, parts: List[str], array_filters: Dict[str, Dict]) -> List[Tuple[Any, Any]]:
+    """
+    Resolve an update path to the (container, key) pairs it writes to.
+    
+    Supports numeric indexes and $[identifier] filtered positional operators;
+    missing sub-documents on the way are created.
+    """
+    part, rest = parts[0], parts[1:]
+    if part.startswith('$[') and part.endswith(']'):
+        name = part[2:-1]
+        keys = [index for index, item in enumerate(value) if matches_array_filter(item, name, array_filters)]
+    elif isinstance(value, list):
+        keys = [int(part)]
+    else:
+        keys = [part]
+
+    if not rest:
+        return [(value, key) for key in keys]
+
+    targets = []
+    for key in keys:
+        if isinstance(value, dict):
+            value.setdefault(key, {})
+        targets.extend(update_targets(value[key], rest, array_filters))
+    return targets
+
+def matches_array_filter(item: Any, name: str, array_filters: Dict[str, Dict]) -> bool:
+    if name not in array_filters:
+        raise ValueError(f"No array filter found for identifier {name}")
+    condition = array_filters[name]
+    if name in condition:
+        return matches({'value': item}, {'value': condition[name]})
+    prefix = f"{name}."
+    return isinstance(item, dict) and matches(item, {key[len(prefix):]: value for key, value in condition.items()})
+
+def apply_update(document: Dict, update: Dict, array_filters: Optional[List[Dict]] = None, inserting: bool = False) -> None:
+    """Apply $set, $setOnInsert, $unset, $inc, $push and $pull update operators to a document in place."""
+    filters: Dict[str, Dict] = {}
+    for array_filter in array_filters or []:
+        name = next(iter(array_filter)).split('.')[0]
+        filters.setdefault(name, {}).update(array_filter)
+
+    for operator, fields in update.items():
+        if operator == '$setOnInsert':
+            if not inserting:
+                continue
+            operator = '$set'
+        for path, operand in fields.items():
+            for container, key in update_targets(document, path.split('.'), filters):
+                if operator == '$set':
+                    container[key] = copy.deepcopy(operand)
+                elif operator == '$unset':
+                    if isinstance(container, list):
+                        container[key] = None
+                    else:
+                        container.pop(key, None)
+                elif operator == '$inc':
+                    current = container[key] if isinstance(container, list) else container.get(key)
+                    container[key] = (current or 0) + operand
+                elif operator == '$push':
+                    if isinstance(container, dict):
+                        container.setdefault(key, [])
+                    if isinstance(operand, dict) and '$each' in operand:
+                        container[key].extend(copy.deepcopy(operand['$each']))
+                        for sort_field, direction in reversed(list(operand.get('$sort', {}).items())):
+                            container[key].sort(key=lambda item: sort_key(get_field(item, sort_field)), reverse=direction < 0)
+                        if '$slice' in operand:
+                            size = operand['$slice']
+                            container[key] = container[key][size:] if size < 0 else container[key][:size]
+                    else:
+                        container[key].append(copy.deepcopy(operand))
+                elif operator == '$pull':
+                    items = container[key] if isinstance(container, list) else container.get(key, [])
+                    container[key] = [
+                        item for item in items
+                        if not (matches(item, operand) if isinstance(operand, dict) and isinstance(item, dict) else item == operand)
+                    ]
+                else:
+                    raise NotImplementedError(f"Update operator {operator} is not supported by the stand-in")
+
+def project(document: Dict, projection: Optional[Dict]) -> Dict:
+    """Apply an inclusion or exclusion projection to a copy of a document."""
+    if not projection:
+        return copy.deepcopy(document)
+
+    included = {key for key, flag in projection.items() if flag and key != '_id'}
+    if not included:
+        # Exclusion projection
+        excluded = {key for key, flag in projection.items() if not flag}
+        return copy.deepcopy({key: value for key, value in document.items() if key not in excluded})
+
+    result = {}
+    if projection.get('_id', 1) and '_id' in document:
+        result['_id'] = document['_id']
+    for path in included:
+        value = get_field(document, path)
+        if isinstance(projection[path], dict):
+            value = project_expression(projection[path], value, document)
+            if value is not None:
+                set_field(result, path, copy.deepcopy(value))
+        elif value is not None or path.split('.')[0] in document:
+            set_field(result, path, copy.deepcopy(value))
+    return result
+
+def project_expression(expression: Dict, value: Any, document: Dict) -> Any:
+    """Evaluate an $elemMatch or aggregation expression projection of a field."""
+    if '$elemMatch' in expression:
+        match = next((item for item in value or [] if matches(item, expression['$elemMatch'])), None)
+        return [match] if match is not None else None
+    return evaluate(expression, document, {})
+
+def evaluate(expression: Any, document: Dict, variables: Dict[str, Any]) -> Any:
+    """Evaluate the aggregation expressions supported by the stand-in ($filter, $in, $eq, $and, $or)."""
+    if isinstance(expression, str) and expression.startswith('$$'):
+        name, _, path = expression[2:].partition('.')
+        return get_field(variables[name], path) if path else variables[name]
+    if isinstance(expression, str) and expression.startswith('$'):
+        return get_field(document, expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(item, document, variables) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+
+    (operator, operand), = expression.items()
+    if operator == '$filter':
+        name = operand.get('as', 'this')
+        items = evaluate(operand['input'], document, variables) or []
+        return [item for item in items if evaluate(operand['cond'], document, {**variables, name: item})]
+    arguments = evaluate(operand, document, variables)
+    if operator == '$in':
+        return arguments[0] in arguments[1]
+    if operator == '$eq':
+        return arguments[0] == arguments[1]
+    if operator == '$and':
+        return all(arguments)
+    if operator == '$or':
+        return any(arguments)
+    raise NotImplementedError(f"Expression operator {operator} is not supported by the stand-in")
+
+class InsertOneResult:
+    def __init__(self, inserted_id: Any):
+        self.inserted_id = inserted_id
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_id: Any = None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+
+class BulkWriteResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_count: int):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_count = upserted_count
+
+class MemoryCursor:
+    """Async cursor over the documents matched by find()."""
+
+    def __init__(self, collection: 'MemoryCollection', query: Optional[Dict], projection: Optional[Dict]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[List[Dict]] = None
+
+    def sort(self, key, direction: int = 1) -> 'MemoryCursor':
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, count: int) -> 'MemoryCursor':
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> 'MemoryCursor':
+        self._limit = count
+        return self
+
+    def batch_size(self, count: int) -> 'MemoryCursor':
+        return self
+
+    async def _fetch(self) -> List[Dict]:
+        if self._results is None:
+            await self._collection.database.round_trip()
+            documents = [document for document in self._collection.documents.values() if matches(document, self._query)]
+            for key, direction in reversed(self._sort):
+                # Missing fields sort first, like null in MongoDB
+                documents.sort(key=lambda document: sort_key(get_field(document, key)), reverse=direction < 0)
+            documents = documents[self._skip:]
+            if self._limit:
+                documents = documents[:self._limit]
+            self._results = [project(document, self._projection) for document in documents]
+        return self._results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in await self._fetch():
+            yield document
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict]:
+        documents = await self._fetch()
+        return documents if length is None else documents[:length]
+
+class MemoryCollection:
+    """A collection of documents keyed by _id, in insertion order."""
+
+    def __init__(self, database: 'MemoryDatabase', name: str):
+        self.database = database
+        self.name = name
+        self.documents: Dict[Any, Dict] = {}
+        # Unique index field -> {value: _id}
+        self._unique: Dict[str, Dict[Any, Any]] = {}
+
+    def _index_keys(self, keys) -> List[str]:
+        if isinstance(keys, str):
+            return [keys]
+        return [key for key, _ in keys]
+
+    async def create_index(self, keys, unique: bool = False, **kwargs) -> str:
+        fields = self._index_keys(keys)
+        if unique and len(fields) == 1:
+            self._unique[fields[0]] = {get_field(document, fields[0]): _id for _id, document in self.documents.items()}
+        return "_".join(f"{field}_1" for field in fields)
+
+    def _check_unique(self, document: Dict, ignore_id: Any = None) -> None:
+        for field, values in self._unique.items():
+            existing = values.get(get_field(document, field))
+            if existing is not None and existing != ignore_id:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {field}_1")
+
+    def _reindex(self, document: Dict, old: Optional[Dict] = None) -> None:
+        for field, values in self._unique.items():
+            if old is not None:
+                values.pop(get_field(old, field), None)
+            values[get_field(document, field)] = document['_id']
+
+    async def insert_one(self, document: Dict) -> InsertOneResult:
+        await self.database.round_trip()
+        # Like the driver, add a generated _id to the caller's document if it has none
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+        if document['_id'] in self.documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+        self._check_unique(document)
+        stored = copy.deepcopy(document)
+        self.documents[stored['_id']] = stored
+        self._reindex(stored)
+        return InsertOneResult(stored['_id'])
+
+    async def insert_many(self, documents: List[Dict], ordered: bool = True) -> List[Any]:
+        inserted = []
+        for document in documents:
+            try:
+                inserted.append((await self.insert_one(document)).inserted_id)
+            except DuplicateKeyError:
+                if ordered:
+                    raise
+        return inserted
+
+    def _first(self, query: Optional[Dict]) -> Optional[Dict]:
+        # Use the _id or a unique index to find the only candidate, like an index lookup
+        for field, values in [('_id', None), *self._unique.items()]:
+            if query and field in query and not isinstance(query[field], dict):
+                _id = query[field] if values is None else values.get(query[field])
+                document = self.documents.get(_id) if _id is not None else None
+                return document if document is not None and matches(document, query) else None
+        return next((document for document in self.documents.values() if matches(document, query)), None)
+
+    async def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> Optional[Dict]:
+        await self.database.round_trip()
+        document = self._first(query)
+        return project(document, projection) if document is not None else None
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> MemoryCursor:
+        return MemoryCursor(self, query, projection)
+
+    async def count_documents(self, query: Optional[Dict] = None, limit: int = 0) -> int:
+        await self.database.round_trip()
+        if not query:
+            count = len(self.documents)
+        else:
+            count = sum(1 for document in self.documents.values() if matches(document, query))
+        return min(count, limit) if limit else count
+
+    def _update(self, query: Dict, update: Dict, upsert: bool = False,
+                array_filters: Optional[List[Dict]] = None) -> Tuple[UpdateResult, Optional[Dict], Optional[Dict]]:
+        """Update the first matching document; returns the result and the document before and after."""
+        document = self._first(query)
+        if document is None:
+            if not upsert:
+                return UpdateResult(0, 0), None, None
+            # Start from the query's equality conditions, like MongoDB does
+            inserted = {key: copy.deepcopy(value) for key, value in query.items()
+                        if not key.startswith('$') and not isinstance(value, dict)}
+            apply_update(inserted, update, array_filters, inserting=True)
+            inserted.setdefault('_id', ObjectId())
+            if inserted['_id'] in self.documents:
+                # An upsert whose filter missed an existing _id collides with it
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+            self._check_unique(inserted)
+            self.documents[inserted['_id']] = inserted
+            self._reindex(inserted)
+            return UpdateResult(0, 0, inserted['_id']), None, inserted
+
+        updated = copy.deepcopy(document)
+        apply_update(updated, update, array_filters)
+
+        if updated == document:
+            return UpdateResult(1, 0), document, document
+        self._check_unique(updated, ignore_id=document['_id'])
+        self.documents[document['_id']] = updated
+        self._reindex(updated, document)
+        return UpdateResult(1, 1), document, updated
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False,
+                         array_filters: Optional[List[Dict]] = None) -> UpdateResult:
+        await self.database.round_trip()
+        return self._update(query, update, upsert, array_filters)[0]
+
+    async def find_one_and_update(self, query: Dict, update: Dict, projection: Optional[Dict] = None,
+                                  return_document: bool = ReturnDocument.BEFORE, upsert: bool = False,
+                                  array_filters: Optional[List[Dict]] = None) -> Optional[Dict]:
+        await self.database.round_trip()
+        _, before, after = self._update(query, update, upsert, array_filters)
+        document = after if return_document == ReturnDocument.AFTER else before
+        return project(document, projection) if document is not None else None
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True) -> BulkWriteResult:
+        """Apply UpdateOne requests in one round trip."""
+        await self.database.round_trip()
+        matched = modified = upserted = 0
+        for request in requests:
+            # pymongo keeps the request's arguments in private attributes
+            result = self._update(request._filter, request._doc, request._upsert, request._array_filters)[0]
+            matched += result.matched_count
+            modified += result.modified_count
+            upserted += result.upserted_id is not None
+        return BulkWriteResult(matched, modified, upserted)
+
+    async def drop(self) -> None:
+        await self.database.round_trip()
+        self.database._collections.pop(self.name, None)
+
+    async def rename(self, new_name: str, dropTarget: bool = False) -> None:
+        await self.database.round_trip()
+        collections = self.database._collections
+        if new_name in collections and not dropTarget:
+            raise ValueError(f"Collection {new_name} already exists")
+        collections.pop(self.name, None)
+        self.name = new_name
+        collections[new_name] = self
+
+class MemoryDatabase:
+    """Database of in-memory collections, created on first access like in MongoDB."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        """
+        Args:
+            latency_ms: Simulated round-trip time added to every database operation
+        """
+        self.latency_ms = latency_ms
+        self.operations = 0
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    async def round_trip(self) -> None:
+        self.operations += 1
+        # Always yield to the event loop, like real I/O would
+        await asyncio.sleep(self.latency_ms / 1000)
+
+    async def command(self, name: str, **kwargs) -> Dict:
+        await self.round_trip()
+        if name != 'ping':
+            raise NotImplementedError(f"Command {name} is not supported by the stand-in")
+        return {'ok': 1.0}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self) -> List[str]:
+        return list(self._collections)
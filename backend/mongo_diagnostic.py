@@ -11,12 +11,13 @@ import sys
 import ssl
 import certifi
 import pymongo
-from motor.motor_asyncio import AsyncIOMotorClient
 import urllib.parse
 import socket
 import platform
 import subprocess
 
+from app.db import client_options, create_client
+
 def print_header(text):
     print("\n" + "=" * 60)
     print(f" {text}")
@@ -112,15 +113,11 @@ async def test_mongodb_connection(uri, options=None):
                     check_dns_resolution(host_port)
                     check_connection_to_host(host_port, 27017)
         
-        # Create MongoDB client with options
+        # Create MongoDB client with the app's options (shorter timeouts for the test)
         conn_options = {
+            **client_options(uri),
             'serverSelectionTimeoutMS': 10000,
-            'connectTimeoutMS': 10000,
-            'ssl': True,
-            'ssl_cert_reqs': ssl.CERT_NONE,
-            'retryWrites': False,
-            'tls': True,
-            'tlsAllowInvalidCertificates': True
+            'connectTimeoutMS': 10000
         }
         
         # Update with user options if provided
@@ -133,7 +130,7 @@ async def test_mongodb_connection(uri, options=None):
             print(f"  {key}: {value}")
         
         print("\nAttempting MongoDB connection...")
-        client = AsyncIOMotorClient(uri, **conn_options)
+        client = create_client(uri, **conn_options)
         
         # Force a connection to verify it works
         await client.admin.command('ping')
@@ -155,7 +152,7 @@ async def test_mongodb_connection(uri, options=None):
                 collections = await db.list_collection_names()
                 print_info("Collections", ", ".join(collections) if collections else "None")
         
-        await client.close()
+        client.close()
         return True
     except Exception as e:
         print_error(f"MongoDB connection error: {str(e)}")
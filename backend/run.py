@@ -4,16 +4,49 @@ import sys
 import subprocess
 import time
 
+# "development" runs a single auto-reloading uvicorn process, "production" runs
+# WEB_CONCURRENCY gunicorn-managed uvicorn workers. Defaults to production on Render.
+SERVER_MODE = os.environ.get("SERVER_MODE", "production" if os.environ.get("RENDER") else "development")
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+# Production workers watch the reference data by default, so a reload requested from
+# one worker (POST /admin/reload-reference) reaches all of them
+if SERVER_MODE == "production":
+    os.environ.setdefault("REFERENCE_WATCH_INTERVAL", "5")
+
+# Each worker process runs its own match pool, so in production the cores are split
+# between all their threads before batch scoring spreads over them (see CDIST_WORKERS)
+if SERVER_MODE == "production":
+    from app.match_pool import MATCH_POOL_WORKERS
+    os.environ.setdefault(
+        "CDIST_WORKERS",
+        str(max(1, (os.cpu_count() or 1) // (WEB_CONCURRENCY * max(1, MATCH_POOL_WORKERS))))
+    )
+
+# "background" serves requests right away and checks the database in the background
+# (see /ready), "blocking" checks it before the server starts, as startup used to
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background")
+
+# Workers are recycled after this many requests (plus jitter so they don't all restart at once)
+MAX_REQUESTS = int(os.environ.get("MAX_REQUESTS", 0))
+MAX_REQUESTS_JITTER = int(os.environ.get("MAX_REQUESTS_JITTER", 100))
+GRACEFUL_TIMEOUT = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+# Blocking startup waits on the MongoDB checks, so workers get more than gunicorn's default 30s
+WORKER_TIMEOUT = int(os.environ.get("WORKER_TIMEOUT", 120))
+
 def check_mongo_connection():
     """Run the MongoDB connection check script"""
     try:
         print("Running MongoDB connection diagnostic check...")
         # Import the module and run the check in the same process
         from app.startup import check_mongodb_connection
+        from app.db import close_client
         import asyncio
         
-        # Run the connection check
+        # Run the connection check; its client belongs to this short-lived event
+        # loop, so close it and let the server create its own
         result = asyncio.run(check_mongodb_connection())
+        close_client()
         
         if not result:
             print("⚠️ Warning: Could not establish MongoDB connection")
@@ -24,6 +57,43 @@ def check_mongo_connection():
         print(f"Error running MongoDB diagnostic: {str(e)}")
         return False
 
+def run_production_server(port):
+    """
+    Run the app under gunicorn with one uvicorn worker process per core.
+    
+    The app (and with it the reference data) is loaded once in the master process
+    before forking, so workers share it copy-on-write. Each worker creates its own
+    MongoDB client lazily on first use. Send SIGHUP to the master for a graceful
+    rolling restart of the workers.
+    """
+    from gunicorn.app.base import BaseApplication
+    
+    class ProductionServer(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+        
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+        
+        def load(self):
+            from app.main import app
+            return app
+    
+    options = {
+        "bind": f"0.0.0.0:{port}",
+        "workers": WEB_CONCURRENCY,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "timeout": WORKER_TIMEOUT,
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "max_requests": MAX_REQUESTS,
+        "max_requests_jitter": MAX_REQUESTS_JITTER if MAX_REQUESTS else 0,
+        "loglevel": "info",
+    }
+    ProductionServer(options).run()
+
 if __name__ == "__main__":
     print("Starting Psychological Test Form Backend server...")
     
@@ -36,27 +106,34 @@ if __name__ == "__main__":
     else:
         print(f"Running in local development mode on port {port}")
     
-    # Check MongoDB connection before starting the server
-    mongo_ok = check_mongo_connection()
+    # Check MongoDB connection before starting the server (blocking startup only)
+    mongo_ok = check_mongo_connection() if STARTUP_MODE == "blocking" else None
     
     # Startup banner
     print("\n" + "=" * 50)
     print("         PSYCHOLOGICAL TEST API SERVER")
     print("=" * 50)
     print(f"Server starting on port: {port}")
-    print(f"MongoDB connection test: {'✅ OK' if mongo_ok else '⚠️ Issues detected'}")
+    if mongo_ok is None:
+        print("MongoDB connection test: deferred to the background warm-up (see /ready)")
+    else:
+        print(f"MongoDB connection test: {'✅ OK' if mongo_ok else '⚠️ Issues detected'}")
     print(f"Environment: {'Production' if os.environ.get('RENDER') else 'Development'}")
+    print(f"Server mode: {SERVER_MODE}" + (f" ({WEB_CONCURRENCY} workers)" if SERVER_MODE == "production" else ""))
     print("=" * 50 + "\n")
     
     # Start the server with appropriate settings
     try:
-        uvicorn.run(
-            "app.main:app", 
-            host="0.0.0.0", 
-            port=port,
-            log_level="info",
-            reload=not os.environ.get("RENDER")  # Only use reload in development
-        )
+        if SERVER_MODE == "production":
+            run_production_server(port)
+        else:
+            uvicorn.run(
+                "app.main:app", 
+                host="0.0.0.0", 
+                port=port,
+                log_level="info",
+                reload=not os.environ.get("RENDER")  # Only use reload in development
+            )
     except Exception as e:
         print(f"Server failed to start: {str(e)}")
         sys.exit(1)
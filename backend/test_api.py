@@ -16,11 +16,18 @@ def test_api_endpoints():
     print(f"Response: {response.json()}")
     print()
     
-    # 2. Test getting all patients
+    # 2. Test getting all patients, following next_cursor through every page
     print("Testing GET /patients...")
-    response = requests.get(f"{BASE_URL}/patients")
-    print(f"Status: {response.status_code}")
-    patients = response.json()
+    patients = []
+    params = {}
+    while True:
+        response = requests.get(f"{BASE_URL}/patients", params=params)
+        print(f"Status: {response.status_code}")
+        page = response.json()
+        patients.extend(page["patients"])
+        if not page["next_cursor"]:
+            break
+        params = {"after": page["next_cursor"]}
     
     if patients:
         print(f"Found {len(patients)} patients:")